@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib import admin
 
 from katka.fields import username_on_model
@@ -49,8 +50,22 @@ class SCMRepositoryAdmin(WithUsernameAdminModel):
     list_display = ('pk', 'scm_service', 'organisation', 'repository_name')
 
 
+class SCMPipelineRunAdminForm(forms.ModelForm):
+    # stored in a PipelineDefinition, see SCMPipelineRun.pipeline_yaml
+    pipeline_yaml = forms.CharField(widget=forms.Textarea)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['pipeline_yaml'].initial = self.instance.pipeline_yaml
+
+    def save(self, commit=True):
+        self.instance.pipeline_yaml = self.cleaned_data['pipeline_yaml']
+        return super().save(commit=commit)
+
+
 @admin.register(SCMPipelineRun)
 class SCMPipelineRunAdmin(WithUsernameAdminModel):
+    form = SCMPipelineRunAdminForm
     fields = (
         'commit_hash', 'first_parent_hash', 'status', 'steps_total', 'steps_completed', 'pipeline_yaml', 'application'
     )
@@ -7,5 +7,9 @@ class KatkaCoreConfig(AppConfig):
 
     def ready(self):
         super().ready()
-        # import signals so the signal handlers are registered
-        from . import signals  # noqa: F401
+        # import signals and scopes so the signal handlers are registered
+        from . import scopes, signals  # noqa: F401
+        from .fields import register_audited_model
+
+        for model in self.get_models():
+            register_audited_model(model)
@@ -0,0 +1,111 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+from encrypted_model_fields.fields import EncryptedMixin
+from katka.auditedmodel import AuditedModel
+from katka.fields import EncryptedValue
+from katka.models import (
+    Application, ApplicationMetadata, ArchivedRow, Credential, CredentialSecret, Project, SCMPipelineRun, SCMRelease,
+    SCMRepository, SCMService, SCMStepRun, Team,
+)
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+DEFAULT_BATCH_SIZE = 500
+
+# The models whose deleted rows are archived, with extra conditions for their rows. Rows that are still referred to
+# by another row are not archived, so the models are ordered to archive the rows that refer to others first.
+ARCHIVED_MODELS = (
+    # the step counters of a pipeline include its deleted steps, so they are archived together with their pipeline
+    (SCMStepRun, {'scm_pipeline_run__deleted': True}),
+    (SCMRelease, {}),
+    (SCMPipelineRun, {}),
+    (ApplicationMetadata, {}),
+    (CredentialSecret, {}),
+    (Application, {}),
+    (SCMRepository, {}),
+    (Credential, {}),
+    (SCMService, {}),
+    (Project, {}),
+    (Team, {}),
+)
+
+
+def archive_deleted_rows(days=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move the rows that were (soft) deleted more than 'days' days ago to ArchivedRow, so the tables only keep growing
+    with the rows that are in use. 'days' defaults to the KATKA_ARCHIVE_AFTER_DAYS setting (default 90).
+
+    The rows are moved in batches, each batch in its own transaction, so the tables are never locked for long and an
+    interrupted run loses nothing. The rows that are deleted together with an archived row (e.g. the tags and output
+    chunks of a step) are archived as well. The files of LocalDiskOutputStorage are kept.
+
+    Returns:
+        The number of archived rows per model of ARCHIVED_MODELS
+    """
+    if days is None:
+        days = getattr(settings, 'KATKA_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    deleted_before = timezone.now() - timedelta(days=days)
+
+    archived = {}
+    for model, conditions in ARCHIVED_MODELS:
+        queryset = get_archivable_rows(model, deleted_before, **conditions).order_by('pk')
+        archived[model] = 0
+        while True:
+            with transaction.atomic():
+                # archived rows are deleted, so every batch starts at the first remaining row
+                batch = list(queryset.select_for_update()[:batch_size])
+                if not batch:
+                    break
+                archive_rows(batch)
+            archived[model] += len(batch)
+
+    return archived
+
+
+def get_archivable_rows(model, deleted_before, **conditions):
+    """The rows of an AuditedModel that were deleted before 'deleted_before' and that no audited row refers to"""
+    queryset = model.objects.filter(deleted=True, modified_at__lt=deleted_before, **conditions)
+    for relation in model._meta.related_objects:
+        if issubclass(relation.related_model, AuditedModel):
+            queryset = queryset.exclude(**{f'{relation.name}__isnull': False})
+
+    return queryset
+
+
+def archive_rows(rows):
+    """Move rows of the same model, and the rows that would be deleted with them, to ArchivedRow"""
+    collector = Collector(using=rows[0]._state.db)
+    collector.collect(rows)
+
+    instances = [instance for model_instances in collector.data.values() for instance in model_instances]
+    for queryset in collector.fast_deletes:
+        instances.extend(queryset)
+
+    connection = connections[collector.using]
+    ArchivedRow.objects.bulk_create(
+        ArchivedRow(model=instance._meta.label, object_pk=str(instance.pk),
+                    data=json.dumps(_column_values(instance, connection), cls=DjangoJSONEncoder))
+        for instance in instances
+    )
+    collector.delete()
+
+
+def _column_values(instance, connection):
+    values = {}
+    for field in instance._meta.concrete_fields:
+        value = instance.__dict__.get(field.attname)
+        if isinstance(value, EncryptedValue):
+            value = value.token  # not decrypted yet, archive it as it is stored
+        elif isinstance(field, EncryptedMixin):
+            value = field.get_db_prep_save(field.value_from_object(instance), connection)
+        else:
+            value = field.value_from_object(instance)
+        values[field.column] = value
+
+    return values
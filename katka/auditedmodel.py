@@ -3,6 +3,15 @@ from django.db import models
 from katka.fields import AutoUsernameField
 
 
+class ActiveManager(models.Manager):
+    """Only the rows that are not (soft) deleted"""
+
+    def get_queryset(self):
+        # 'deleted = false' instead of 'NOT deleted = true', so the database can use the partial indexes on that
+        # condition
+        return super().get_queryset().filter(deleted=False)
+
+
 class AuditedModel(models.Model):
     class Meta:
         abstract = True
@@ -12,3 +21,8 @@ class AuditedModel(models.Model):
     modified_at = models.DateTimeField(auto_now=True, editable=False)
     modified_username = AutoUsernameField()
     deleted = models.BooleanField(default=False)
+
+    # 'objects' stays the default manager and includes deleted rows, so the admin, related objects and migrations
+    # still see them
+    objects = models.Manager()
+    active = ActiveManager()
@@ -0,0 +1,77 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+log = logging.getLogger('katka')
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def migrate_in_batches(apps, name, queryset, process_batch, batch_size=DEFAULT_BATCH_SIZE, rows_per_second=None,
+                       sleep=time.sleep):
+    """
+    Process the rows of a queryset in batches ordered by primary key, each batch in its own transaction, so a large
+    table is not locked for the complete migration.
+
+    The last primary key of every batch is stored in BatchedMigrationProgress under 'name', in the same transaction
+    as the batch, so when the migration is interrupted, running it again continues with the next batch. Once all rows
+    are processed, running it again does nothing. Use it from a RunPython migration with 'atomic = False' on the
+    Migration class, otherwise all batches are still committed in a single transaction at the end.
+
+    Args:
+        apps: The app registry passed to RunPython (or django.apps.apps)
+        name: Unique name of the data migration
+        queryset: The rows to process, rows with a primary key below the last processed one are skipped
+        process_batch: Called with the list of rows of every batch
+        batch_size: The number of rows per batch
+        rows_per_second: Pause between batches to process at most this many rows per second, defaults to the
+                         KATKA_MIGRATION_ROWS_PER_SECOND setting, None means as fast as possible
+        sleep: Function used to pause
+
+    Returns:
+        The number of rows processed by this call
+    """
+    BatchedMigrationProgress = apps.get_model('katka', 'BatchedMigrationProgress')
+    if rows_per_second is None:
+        rows_per_second = getattr(settings, 'KATKA_MIGRATION_ROWS_PER_SECOND', None)
+
+    progress, _ = BatchedMigrationProgress.objects.get_or_create(name=name)
+    if progress.completed_at is not None:
+        log.info(f'Batched migration {name} already completed')
+        return 0
+
+    queryset = queryset.order_by('pk')
+    pk_field = queryset.model._meta.pk
+    processed = 0
+    while True:
+        started = time.monotonic()
+        with transaction.atomic():
+            # lock the progress, so two runs of the same migration do not process the same batch
+            progress = BatchedMigrationProgress.objects.select_for_update().get(name=name)
+            batch = queryset
+            if progress.last_pk is not None:
+                batch = batch.filter(pk__gt=pk_field.to_python(progress.last_pk))
+            batch = list(batch[:batch_size])
+
+            if batch:
+                process_batch(batch)
+                progress.last_pk = str(batch[-1].pk)
+                progress.rows_done += len(batch)
+            else:
+                progress.completed_at = timezone.now()
+            progress.save()
+
+        if not batch:
+            log.info(f'Batched migration {name} completed, {progress.rows_done} rows')
+            return processed
+
+        processed += len(batch)
+        log.info(f'Batched migration {name}: {progress.rows_done} rows done')
+
+        if rows_per_second:
+            remaining = len(batch) / rows_per_second - (time.monotonic() - started)
+            if remaining > 0:
+                sleep(remaining)
@@ -52,3 +52,16 @@ RELEASE_STATUS_CHOICES = (
 
 TAG_PRODUCTION_CHANGE_STARTED = "production_change_start"
 TAG_PRODUCTION_CHANGE_ENDED = "production_change_end"
+
+# How SCMPipelineRun.steps_total/steps_completed are kept up to date when steps are saved, see katka.step_counters
+STEP_COUNTER_MODE_RECOUNT = 'recount'
+STEP_COUNTER_MODE_DELTA = 'delta'
+
+# How pipeline change notifications are delivered to the runner, see katka.notifications
+NOTIFICATION_DISPATCHER_SYNC = 'sync'
+NOTIFICATION_DISPATCHER_OUTBOX = 'outbox'
+
+# How the release pre-conditions of a finished pipeline are determined, see katka.releases
+RELEASE_PRE_CONDITIONS_MODE_INCREMENTAL = 'incremental'
+RELEASE_PRE_CONDITIONS_MODE_RESCAN = 'rescan'
+RELEASE_PRE_CONDITIONS_MODE_VERIFY = 'verify'
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+# MultiFernet per FIELD_ENCRYPTION_KEY value, so a changed setting (e.g. in tests) takes effect
+_crypters = {}
+
+
+def get_keys():
+    """
+    The keys of the FIELD_ENCRYPTION_KEY setting, a single key or a list of keys. The first key encrypts, all keys
+    decrypt, so to rotate keys a new key is put in front and the old key is removed once all values are re-encrypted
+    with the new key (see the rotate_secret_keys command).
+    """
+    keys = getattr(settings, 'FIELD_ENCRYPTION_KEY', None)
+    if not keys:
+        raise ImproperlyConfigured('FIELD_ENCRYPTION_KEY must be defined in settings')
+
+    return tuple(keys) if isinstance(keys, (list, tuple)) else (keys,)
+
+
+def get_crypter(keys=None):
+    keys = keys or get_keys()
+    crypter = _crypters.get(keys)
+    if crypter is None:
+        try:
+            crypter = MultiFernet([Fernet(key) for key in keys])
+        except Exception as e:
+            raise ImproperlyConfigured(f'FIELD_ENCRYPTION_KEY defined incorrectly: {e}')
+        _crypters[keys] = crypter
+
+    return crypter
+
+
+def encrypt_str(value):
+    return get_crypter().encrypt(value.encode('utf-8')).decode('utf-8')
+
+
+def decrypt_str(token):
+    return get_crypter().decrypt(token.encode('utf-8')).decode('utf-8')
+
+
+def rotate_tokens(keys, tokens):
+    """
+    Encrypt tokens with the first of 'keys' (without decoding the plaintext), for the rotate_secret_keys command.
+    Only uses its arguments, so it can run in another process.
+
+    Values that were stored before they were encrypted (see LazyEncryptedCharField.decrypt) are encrypted.
+
+    Returns:
+        For every token the token encrypted with the first key, or None when it already is
+    """
+    crypter = get_crypter(keys)
+    primary = Fernet(keys[0])
+    return [_rotate_token(crypter, primary, token.encode('utf-8')) for token in tokens]
+
+
+def _rotate_token(crypter, primary, data):
+    try:
+        primary.decrypt(data)
+        return None
+    except InvalidToken:
+        pass
+
+    try:
+        return crypter.rotate(data).decode('utf-8')
+    except InvalidToken:
+        return crypter.encrypt(data).decode('utf-8')
@@ -1,9 +1,40 @@
+import base64
+import zlib
 from contextlib import contextmanager
+from contextvars import ContextVar
 
+from django.conf import settings
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
 
+from cryptography.fernet import InvalidToken
+from encrypted_model_fields.fields import EncryptedCharField, EncryptedMixin
+
+from .encryption import decrypt_str, encrypt_str
 from .exceptions import MissingUsername
 
+# The usernames set with username_on_model, by AutoUsernameField. Every thread (and asyncio task) has its own context,
+# so concurrent requests do not see each other's username.
+_usernames = ContextVar('katka_usernames', default={})
+# The context keys of the AutoUsernameFields of every model, see register_audited_model
+_audited_models = {}
+
+
+def register_audited_model(model):
+    """
+    Find the AutoUsernameFields of a model once, instead of on every username_on_model. The models of this app are
+    registered when the app is ready, other apps can register theirs in the ready() of their AppConfig. Models that
+    are not registered (e.g. the historical models of migrations) are registered on first use.
+
+    Returns:
+        The context keys of the AutoUsernameFields of the model
+    """
+    # the following looks a bit hacky, but is actually the documented way of Django on how to get a list of fields:
+    # https://docs.djangoproject.com/en/2.1/ref/models/meta/#retrieving-all-field-instances-of-a-model
+    keys = tuple(field.context_key for field in model._meta.get_fields() if isinstance(field, AutoUsernameField))
+    _audited_models[model] = keys
+    return keys
+
 
 @contextmanager
 def username_on_model(model, username):
@@ -16,25 +47,30 @@ def username_on_model(model, username):
 
     Using a global object can lead to all kinds of subtle bugs, so we
     needed to find a way to pass the username in a different way; in this case
-    explicit.
+    explicit. The username is kept in a context variable, so it only applies
+    to the current thread or asyncio task. Nested contexts override the
+    username until they exit.
 
     Args:
         model: The Django model to check for instances of AutoUsernameFields
         username: The username to set in this context
     """
 
-    # the following looks a bit hacky, but is actually the documented way of Django on how to get a list of fields:
-    # https://docs.djangoproject.com/en/2.1/ref/models/meta/#retrieving-all-field-instances-of-a-model
-    auto_username_fields = [field for field in model._meta.get_fields() if isinstance(field, AutoUsernameField)]
+    keys = _audited_models.get(model)
+    if keys is None:
+        keys = register_audited_model(model)
 
-    for field in auto_username_fields:
-        field.set_username(username)
+    usernames = _usernames.get()
+    if usernames:
+        usernames = {**usernames, **dict.fromkeys(keys, username)}
+    else:
+        usernames = dict.fromkeys(keys, username)
+    token = _usernames.set(usernames)
 
     try:
         yield
     finally:
-        for field in auto_username_fields:
-            field.reset_username()
+        _usernames.reset(token)
 
 
 class AutoUsernameField(models.CharField):
@@ -56,19 +92,22 @@ class AutoUsernameField(models.CharField):
             kwargs['max_length'] = 50
 
         self.only_on_create = only_on_create
-        self._username = None
-        self._prev_username = None
 
         super().__init__(*args, **kwargs)
 
-    def set_username(self, username):
-        self._prev_username, self._username = self._username, username
+    @property
+    def context_key(self):
+        # fields inherited from an abstract model compare equal to the same field of other models, so the field
+        # itself cannot be the key
+        return self.model, self.name
 
-    def reset_username(self):
-        self._username, self._prev_username = self._prev_username, None
+    def get_username(self):
+        """The username set with username_on_model in the current context, or None"""
+        return _usernames.get().get(self.context_key)
 
     def pre_save(self, model_instance, add):
-        if self._username is None:
+        username = self.get_username()
+        if username is None:
             class_name = model_instance.__class__.__name__
             raise MissingUsername(
                 f'No username set. Make sure the username is set with the "username_on_model({class_name}, username)" '
@@ -76,7 +115,7 @@ class AutoUsernameField(models.CharField):
             )
 
         if add or not self.only_on_create:
-            setattr(model_instance, self.attname, self._username)
+            setattr(model_instance, self.attname, username)
 
         return getattr(model_instance, self.attname)
 
@@ -84,3 +123,119 @@ class AutoUsernameField(models.CharField):
 class KatkaSlugField(models.SlugField):
     def __init__(self, *args, max_length=10, blank=False, null=False, **kwargs):
         super().__init__(*args, max_length=max_length, blank=blank, null=null, **kwargs)
+
+
+class CompressedTextField(models.TextField):
+    """
+    Text that is stored zlib compressed when that makes it smaller, which is the case for large, repetitive text like
+    pipeline definitions and step outputs.
+
+    The column stays a text column: compressed values are stored base64 encoded after COMPRESSED_MARKER, other values
+    are stored as is. Values are compressed when they are saved and decompressed when they are read from the
+    database, also for values() and values_list(). So reading is transparent, but database lookups on the text (e.g.
+    __contains) do not see the content of compressed values.
+
+    Values shorter than the KATKA_COMPRESSION_MIN_LENGTH setting (default 1024 characters) are never compressed.
+    """
+    COMPRESSED_MARKER = '\x1bzlib:'
+
+    def from_db_value(self, value, expression, connection):
+        return self.decompress(value)
+
+    def get_prep_value(self, value):
+        return self.compress(super().get_prep_value(value))
+
+    @classmethod
+    def compress(cls, value):
+        if value is None:
+            return value
+
+        # text that looks compressed is always compressed, so it is not mistaken for a compressed value when read
+        looks_compressed = cls.is_compressed(value)
+        if len(value) < getattr(settings, 'KATKA_COMPRESSION_MIN_LENGTH', 1024) and not looks_compressed:
+            return value
+
+        compressed = cls.COMPRESSED_MARKER + base64.b64encode(zlib.compress(value.encode('utf-8'))).decode('ascii')
+        if len(compressed) >= len(value) and not looks_compressed:
+            return value
+
+        return compressed
+
+    @classmethod
+    def decompress(cls, value):
+        if not cls.is_compressed(value):
+            return value
+
+        return zlib.decompress(base64.b64decode(value[len(cls.COMPRESSED_MARKER):])).decode('utf-8')
+
+    @classmethod
+    def is_compressed(cls, value):
+        return isinstance(value, str) and value.startswith(cls.COMPRESSED_MARKER)
+
+
+class EncryptedValue:
+    """A value of a LazyEncryptedCharField as it is stored, before it is decrypted"""
+    __slots__ = ('token',)
+
+    def __init__(self, token):
+        self.token = token
+
+    def __repr__(self):
+        return '<EncryptedValue>'
+
+
+class LazyDecryptedAttribute(DeferredAttribute):
+    """Decrypts an EncryptedValue on first access. A data descriptor, so it is also used once the value is loaded."""
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncryptedValue):
+            decrypt = getattr(instance, f'decrypt_{self.field_name}', None)
+            field = instance._meta.get_field(self.field_name)
+            value = decrypt(value.token) if decrypt else field.decrypt(value.token)
+            instance.__dict__[self.field_name] = value
+
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field_name] = value
+
+
+class LazyEncryptedCharField(EncryptedCharField):
+    """
+    An EncryptedCharField that is decrypted when the value is read from the model instead of when it is loaded, so
+    values that are not used are never decrypted. A model can decrypt (and cache) the values itself with a
+    'decrypt_<field name>(token)' method, see CredentialSecret.
+
+    Because of this, values() and values_list() return an EncryptedValue instead of the plaintext. Values are
+    encrypted with the keys of katka.encryption, which supports several keys to rotate them.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else EncryptedValue(value)
+
+    def to_python(self, value):
+        # values from the database are an EncryptedValue, so a string is always plaintext
+        if isinstance(value, EncryptedValue):
+            value = self.decrypt(value.token)
+
+        return super(EncryptedMixin, self).to_python(value)
+
+    def get_db_prep_save(self, value, connection):
+        # the encryption of EncryptedMixin is replaced, it only supports the keys that were set on import
+        value = super(EncryptedMixin, self).get_db_prep_save(value, connection)
+        if value is None:
+            return value
+
+        return encrypt_str(str(value))
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, LazyDecryptedAttribute(self.attname))
+
+    @staticmethod
+    def decrypt(token):
+        try:
+            return decrypt_str(token)
+        except InvalidToken:
+            return token  # stored before it was encrypted, like EncryptedCharField does
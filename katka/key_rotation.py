@@ -0,0 +1,67 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db.models import Case, F, Q, TextField, Value, When
+from django.db.models.functions import Cast
+
+from katka.batched_migrations import migrate_in_batches
+from katka.encryption import get_keys, rotate_tokens
+from katka.models import BatchedMigrationProgress, CredentialSecret
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def rotate_secret_keys(batch_size=DEFAULT_BATCH_SIZE, rows_per_second=None, processes=1, restart=False):
+    """
+    Re-encrypt all credential secrets with the first key of FIELD_ENCRYPTION_KEY, so the other keys can be removed.
+
+    The secrets are processed in batches with migrate_in_batches, so the table is never locked for long, the rotation
+    can be throttled, and an interrupted rotation continues where it stopped. The progress is kept per encryption key,
+    so a rotation to a newer key starts from the beginning. The crypto work of a batch is spread over 'processes'
+    processes. The values are re-encrypted without decoding them, and a secret that is changed while its batch is
+    re-encrypted keeps its new value.
+
+    Returns:
+        The number of secrets that were checked by this call
+    """
+    keys = get_keys()
+    name = f'rotate_secret_keys:{hashlib.sha256(keys[0].encode("utf-8")).hexdigest()[:16]}'
+    if restart:
+        BatchedMigrationProgress.objects.filter(name=name).delete()
+
+    # the value as it is stored, the field would decrypt it
+    secrets = CredentialSecret.objects.only('pk').annotate(token=Cast('value', TextField()))
+
+    with _executor(processes) as executor:
+        def rotate_batch(batch):
+            tokens = [secret.token for secret in batch]
+            chunk_size = -(-len(tokens) // processes)
+            chunks = [tokens[i:i + chunk_size] for i in range(0, len(tokens), chunk_size)]
+            rotated = [token for chunk in executor.map(rotate_tokens, [keys] * len(chunks), chunks) for token in chunk]
+
+            changed = [When(Q(pk=secret.pk) & Q(value=Value(secret.token)), then=Value(new_token))
+                       for secret, new_token in zip(batch, rotated) if new_token is not None]
+            if changed:
+                CredentialSecret.objects.filter(pk__in=[secret.pk for secret in batch]).update(
+                    value=Case(*changed, default=F('value'), output_field=TextField()),
+                )
+
+        return migrate_in_batches(apps, name, secrets, rotate_batch, batch_size=batch_size,
+                                  rows_per_second=rows_per_second)
+
+
+class _InlineExecutor:
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+@contextmanager
+def _executor(processes):
+    if processes <= 1:
+        yield _InlineExecutor()
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        yield executor
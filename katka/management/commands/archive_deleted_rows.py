@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from katka.archive import DEFAULT_BATCH_SIZE, archive_deleted_rows
+
+
+class Command(BaseCommand):
+    help = 'Move rows that were deleted long ago, and the rows that belong to them, to the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive rows deleted more than this many days ago, defaults to '
+                                 'KATKA_ARCHIVE_AFTER_DAYS or 90')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of rows archived per transaction')
+
+    def handle(self, *args, **options):
+        archived = archive_deleted_rows(days=options['days'], batch_size=options['batch_size'])
+        for model, rows in archived.items():
+            self.stdout.write(f'Archived {rows} {model._meta.verbose_name} row(s)')
@@ -0,0 +1,45 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Value
+
+from katka.batched_migrations import migrate_in_batches
+from katka.fields import CompressedTextField
+from katka.models import BatchedMigrationProgress, PipelineDefinition, SCMStepRun
+
+COMPRESSED_FIELDS = (
+    (PipelineDefinition, 'pipeline_yaml'),
+    (SCMStepRun, 'output'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compress the text of pipeline definitions and step outputs that were stored before they were compressed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of rows updated per transaction')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start from the first row again, instead of continuing where the last run stopped')
+
+    def handle(self, *args, **options):
+        for model, field_name in COMPRESSED_FIELDS:
+            name = f'compress_text_fields:{model._meta.label}.{field_name}'
+            if options['restart']:
+                BatchedMigrationProgress.objects.filter(name=name).delete()
+
+            queryset = model.objects.exclude(
+                **{f'{field_name}__startswith': Value(CompressedTextField.COMPRESSED_MARKER)}
+            ).only('pk', field_name)
+            compressed = 0
+
+            def compress_batch(batch):
+                nonlocal compressed
+                # saving a value compresses it, unless it is too short or does not get smaller
+                batch = [row for row in batch
+                         if CompressedTextField.is_compressed(CompressedTextField.compress(getattr(row, field_name)))]
+                model.objects.bulk_update(batch, [field_name])
+                compressed += len(batch)
+
+            rows = migrate_in_batches(apps, name, queryset, compress_batch, batch_size=options['batch_size'])
+            self.stdout.write(
+                f'Compressed {compressed} of {rows} {model._meta.verbose_name} {field_name} value(s)'
+            )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from katka.notifications import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = 'Send the pipeline change notifications from the outbox to the pipeline runner'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once instead of running forever')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of notifications sent per batch')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = dispatch_pending(limit=options['batch_size'])
+            if options['once']:
+                self.stdout.write(f'Sent {sent} notification(s)')
+                return
+
+            if sent < options['batch_size']:
+                time.sleep(options['interval'])
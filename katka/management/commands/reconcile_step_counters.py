@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from katka.step_counters import reconcile_step_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount steps_total and steps_completed of all pipeline runs and fix the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of pipelines updated per query')
+
+    def handle(self, *args, **options):
+        fixed = reconcile_step_counters(batch_size=options['batch_size'])
+        self.stdout.write(f'Fixed step counters of {fixed} pipeline run(s)')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from katka.key_rotation import DEFAULT_BATCH_SIZE, rotate_secret_keys
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-encrypt all credential secrets with the first key of FIELD_ENCRYPTION_KEY, after a new key was put in '
+        'front. Continues where an interrupted run stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of secrets re-encrypted per transaction')
+        parser.add_argument('--rows-per-second', type=float, default=None,
+                            help='Maximum number of secrets per second, defaults to KATKA_MIGRATION_ROWS_PER_SECOND')
+        parser.add_argument('--processes', type=int, default=1, help='Number of processes that do the crypto work')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start from the first secret again, instead of continuing where the last run stopped')
+
+    def handle(self, *args, **options):
+        checked = rotate_secret_keys(
+            batch_size=options['batch_size'], rows_per_second=options['rows_per_second'],
+            processes=options['processes'], restart=options['restart'],
+        )
+        self.stdout.write(f'Checked {checked} secret(s)')
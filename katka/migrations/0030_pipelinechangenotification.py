@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0029_release_pipeline_run_created_at_ordering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineChangeNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public_identifier', models.UUIDField(unique=True)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
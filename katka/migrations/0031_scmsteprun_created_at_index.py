@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0030_pipelinechangenotification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scmsteprun',
+            index=models.Index(fields=['-created_at', '-public_identifier'], name='katka_scmst_created_b71658_idx'),
+        ),
+    ]
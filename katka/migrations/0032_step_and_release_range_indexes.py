@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0031_scmsteprun_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scmrelease',
+            index=models.Index(fields=['started_at'], name='katka_scmre_started_74e742_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scmrelease',
+            index=models.Index(fields=['ended_at'], name='katka_scmre_ended_a_9f2488_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scmsteprun',
+            index=models.Index(fields=['started_at'], name='katka_scmst_started_f042c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scmsteprun',
+            index=models.Index(fields=['ended_at'], name='katka_scmst_ended_a_966425_idx'),
+        ),
+    ]
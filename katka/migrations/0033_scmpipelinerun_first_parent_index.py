@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0032_step_and_release_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scmpipelinerun',
+            index=models.Index(fields=['application', 'first_parent_hash', 'status'], name='katka_scmpi_applica_eb3126_idx'),
+        ),
+    ]
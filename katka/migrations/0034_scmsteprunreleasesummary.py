@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0033_scmpipelinerun_first_parent_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SCMStepRunReleaseSummary',
+            fields=[
+                ('scm_step_run', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='release_summary', serialize=False, to='katka.SCMStepRun')),
+                ('sequence_id', models.CharField(max_length=30, null=True)),
+                ('status', models.CharField(max_length=30)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('ended_at', models.DateTimeField(null=True)),
+                ('release_version', models.TextField(null=True)),
+                ('scm_pipeline_run', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='katka.SCMPipelineRun')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scmsteprunreleasesummary',
+            index=models.Index(fields=['scm_pipeline_run', 'sequence_id', 'scm_step_run'], name='katka_scmst_scm_pip_ba5f5d_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0034_scmsteprunreleasesummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SCMStepRunTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('scm_step_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_set', to='katka.SCMStepRun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scmstepruntag',
+            constraint=models.UniqueConstraint(fields=('name', 'scm_step_run'), name='unique tags per step'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0035_scmstepruntag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchedMigrationProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('last_pk', models.CharField(max_length=255, null=True)),
+                ('rows_done', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(null=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+from katka.batched_migrations import migrate_in_batches
+
+MAX_TAG_LENGTH = 255
+
+
+def fill_tags(apps, schema_editor):
+    """Create the tag rows of the existing steps"""
+    SCMStepRun = apps.get_model('katka', 'SCMStepRun')
+    SCMStepRunTag = apps.get_model('katka', 'SCMStepRunTag')
+
+    def create_tags(steps):
+        SCMStepRunTag.objects.bulk_create(
+            [
+                SCMStepRunTag(scm_step_run_id=step.pk, name=name)
+                for step in steps
+                for name in set(step.tags.split(' ')) if name and len(name) <= MAX_TAG_LENGTH
+            ],
+            ignore_conflicts=True,
+        )
+
+    steps = SCMStepRun.objects.exclude(tags='').only('pk', 'tags')
+    migrate_in_batches(apps, '0037_fill_scmstepruntag', steps, create_tags)
+
+
+class Migration(migrations.Migration):
+    # every batch is committed on its own, see migrate_in_batches
+    atomic = False
+
+    dependencies = [
+        ('katka', '0036_batchedmigrationprogress'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_tags, migrations.RunPython.noop),
+    ]
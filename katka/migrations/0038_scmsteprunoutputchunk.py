@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0037_fill_scmstepruntag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SCMStepRunOutputChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.BigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+                ('data', models.TextField(blank=True)),
+                ('storage_position', models.BigIntegerField(null=True)),
+                ('storage_length', models.PositiveIntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('scm_step_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='output_chunks', to='katka.SCMStepRun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scmsteprunoutputchunk',
+            constraint=models.UniqueConstraint(fields=('scm_step_run', 'offset'), name='unique output offsets per step'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:35
+
+from django.db import migrations
+
+import katka.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0038_scmsteprunoutputchunk'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scmpipelinerun',
+            name='pipeline_yaml',
+            field=katka.fields.CompressedTextField(default='---'),
+        ),
+        migrations.AlterField(
+            model_name='scmsteprun',
+            name='output',
+            field=katka.fields.CompressedTextField(blank=True),
+        ),
+    ]
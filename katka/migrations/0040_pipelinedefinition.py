@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import katka.fields
+import katka.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0039_compressed_text_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineDefinition',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('pipeline_yaml', katka.fields.CompressedTextField()),
+            ],
+            managers=[
+                ('objects', katka.models.PipelineDefinitionManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scmpipelinerun',
+            name='pipeline_definition',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='katka.PipelineDefinition'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+from katka.batched_migrations import migrate_in_batches
+
+MIGRATION_NAME = '0041_fill_pipelinedefinition'
+REVERSE_MIGRATION_NAME = '0041_fill_pipelinedefinition:reverse'
+
+
+def fill_definitions(apps, schema_editor):
+    """Store the pipeline yaml of the existing pipeline runs once per distinct content and link the runs to it"""
+    SCMPipelineRun = apps.get_model('katka', 'SCMPipelineRun')
+    PipelineDefinition = apps.get_model('katka', 'PipelineDefinition')
+
+    def link_definitions(pipelines):
+        definitions = {}
+        for pipeline in pipelines:
+            content_hash = PipelineDefinition.objects.content_hash(pipeline.pipeline_yaml)
+            definitions[content_hash] = PipelineDefinition(content_hash=content_hash,
+                                                           pipeline_yaml=pipeline.pipeline_yaml)
+            pipeline.pipeline_definition_id = content_hash
+
+        # definitions shared with an earlier batch already exist
+        PipelineDefinition.objects.bulk_create(definitions.values(), ignore_conflicts=True)
+        SCMPipelineRun.objects.bulk_update(pipelines, ['pipeline_definition'])
+
+    pipelines = SCMPipelineRun.objects.filter(pipeline_definition__isnull=True).only('pk', 'pipeline_yaml')
+    migrate_in_batches(apps, MIGRATION_NAME, pipelines, link_definitions)
+
+
+def restore_pipeline_yaml(apps, schema_editor):
+    """
+    Copy the pipeline yaml of the definitions back to the pipeline runs when migrating back, in batches like the fill.
+    Afterwards, forget that the fill completed, so it runs again when migrating forward.
+    """
+    SCMPipelineRun = apps.get_model('katka', 'SCMPipelineRun')
+    BatchedMigrationProgress = apps.get_model('katka', 'BatchedMigrationProgress')
+
+    def copy_definitions(pipelines):
+        for pipeline in pipelines:
+            pipeline.pipeline_yaml = pipeline.pipeline_definition.pipeline_yaml
+        SCMPipelineRun.objects.bulk_update(pipelines, ['pipeline_yaml'])
+
+    pipelines = SCMPipelineRun.objects.filter(pipeline_definition__isnull=False).select_related(
+        'pipeline_definition',
+    ).only('pk', 'pipeline_definition', 'pipeline_definition__pipeline_yaml')
+    migrate_in_batches(apps, REVERSE_MIGRATION_NAME, pipelines, copy_definitions)
+
+    BatchedMigrationProgress.objects.filter(name__in=[MIGRATION_NAME, REVERSE_MIGRATION_NAME]).delete()
+
+
+class Migration(migrations.Migration):
+    # every batch is committed on its own, see migrate_in_batches
+    atomic = False
+
+    dependencies = [
+        ('katka', '0040_pipelinedefinition'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_definitions, restore_pipeline_yaml),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0041_fill_pipelinedefinition'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='scmpipelinerun',
+            name='pipeline_yaml',
+        ),
+        migrations.AlterField(
+            model_name='scmpipelinerun',
+            name='pipeline_definition',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='katka.PipelineDefinition'),
+        ),
+    ]
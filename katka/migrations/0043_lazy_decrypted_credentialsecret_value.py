@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:47
+
+from django.db import migrations
+
+import katka.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0042_remove_scmpipelinerun_pipeline_yaml'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='credentialsecret',
+            name='value',
+            field=katka.fields.LazyEncryptedCharField(),
+        ),
+    ]
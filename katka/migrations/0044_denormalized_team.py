@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0043_lazy_decrypted_credentialsecret_value'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scmpipelinerun',
+            name='team',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='katka.Team'),
+        ),
+        migrations.AddField(
+            model_name='scmsteprun',
+            name='team',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='katka.Team'),
+        ),
+        migrations.AddIndex(
+            model_name='scmpipelinerun',
+            index=models.Index(condition=models.Q(deleted=False), fields=['team', '-created_at', '-public_identifier'], name='active_pipeline_runs_team_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scmsteprun',
+            index=models.Index(condition=models.Q(deleted=False), fields=['team', '-created_at', '-public_identifier'], name='active_step_runs_team_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import F
+
+from katka.batched_migrations import migrate_in_batches
+
+MIGRATION_NAME = '0045_fill_denormalized_team'
+# every pipeline run has a few dozen steps, which are updated in the same batch
+BATCH_SIZE = 200
+
+
+def fill_teams(apps, schema_editor):
+    """Set the team of the existing pipeline runs and their steps to the team of the project of their application"""
+    SCMPipelineRun = apps.get_model('katka', 'SCMPipelineRun')
+    SCMStepRun = apps.get_model('katka', 'SCMStepRun')
+
+    def set_teams(pipelines):
+        pipelines_per_team = {}
+        for pipeline in pipelines:
+            pipelines_per_team.setdefault(pipeline.application_team, []).append(pipeline.pk)
+
+        for team_id, pipeline_ids in pipelines_per_team.items():
+            SCMPipelineRun.objects.filter(pk__in=pipeline_ids).update(team=team_id)
+            SCMStepRun.objects.filter(scm_pipeline_run__in=pipeline_ids).update(team=team_id)
+
+    pipelines = SCMPipelineRun.objects.filter(team__isnull=True).only('pk').annotate(
+        application_team=F('application__project__team'),
+    )
+    migrate_in_batches(apps, MIGRATION_NAME, pipelines, set_teams, batch_size=BATCH_SIZE)
+
+
+def forget_progress(apps, schema_editor):
+    """Forget that the fill completed, so it runs again when migrating forward after migrating back"""
+    apps.get_model('katka', 'BatchedMigrationProgress').objects.filter(name=MIGRATION_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    # every batch is committed on its own, see migrate_in_batches
+    atomic = False
+
+    dependencies = [
+        ('katka', '0044_denormalized_team'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_teams, forget_progress),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0045_fill_denormalized_team'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scmpipelinerun',
+            name='team',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='katka.Team'),
+        ),
+        migrations.AlterField(
+            model_name='scmsteprun',
+            name='team',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, to='katka.Team'),
+        ),
+    ]
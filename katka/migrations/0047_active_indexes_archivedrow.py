@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:08
+
+from django.db import migrations, models
+
+import katka.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('katka', '0046_denormalized_team_required'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_pk', models.CharField(max_length=255)),
+                ('data', katka.fields.CompressedTextField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scmrelease',
+            index=models.Index(condition=models.Q(deleted=False), fields=['-created_at', '-public_identifier'], name='active_releases_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrow',
+            index=models.Index(fields=['model', 'object_pk'], name='katka_archi_model_e973c2_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+import json
+
+from django.db import migrations
+
+from katka.batched_migrations import migrate_in_batches
+from katka.step_output import find_output_value, output_may_contain_key
+
+MIGRATION_NAME = '0048_fill_scmsteprunreleasesummary'
+RELEASE_VERSION_KEY = 'release.version'
+STEP_EXECUTED_STATUSES = ('failed', 'success')
+
+
+def fill_summaries(apps, schema_editor):
+    """Create the release summaries of the existing executed steps"""
+    SCMStepRun = apps.get_model('katka', 'SCMStepRun')
+    SCMStepRunReleaseSummary = apps.get_model('katka', 'SCMStepRunReleaseSummary')
+
+    def create_summaries(steps):
+        # only the outputs that can contain the release version are loaded, the other outputs can be large
+        outputs = dict(SCMStepRun.objects.filter(
+            output_may_contain_key(RELEASE_VERSION_KEY), pk__in=[step.pk for step in steps],
+        ).values_list('pk', 'output'))
+
+        summaries = []
+        for step in steps:
+            found, version = find_output_value(outputs.get(step.pk, ''), RELEASE_VERSION_KEY)
+            summaries.append(SCMStepRunReleaseSummary(
+                scm_step_run_id=step.pk, scm_pipeline_run_id=step.scm_pipeline_run_id,
+                sequence_id=step.sequence_id, status=step.status, started_at=step.started_at,
+                ended_at=step.ended_at, release_version=json.dumps(version) if found else None,
+            ))
+        SCMStepRunReleaseSummary.objects.bulk_create(summaries, ignore_conflicts=True)
+
+    steps = SCMStepRun.objects.filter(status__in=STEP_EXECUTED_STATUSES).only(
+        'pk', 'scm_pipeline_run', 'sequence_id', 'status', 'started_at', 'ended_at',
+    )
+    migrate_in_batches(apps, MIGRATION_NAME, steps, create_summaries)
+
+
+def forget_progress(apps, schema_editor):
+    """Forget that the fill completed, so it runs again when migrating forward after migrating back"""
+    apps.get_model('katka', 'BatchedMigrationProgress').objects.filter(name=MIGRATION_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    # every batch is committed on its own, see migrate_in_batches
+    atomic = False
+
+    dependencies = [
+        ('katka', '0047_active_indexes_archivedrow'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_summaries, forget_progress),
+    ]
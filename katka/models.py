@@ -1,15 +1,17 @@
+import hashlib
 import uuid
 
 from django.contrib.auth.models import Group
 from django.db import models
+from django.utils import timezone
 
-from encrypted_model_fields.fields import EncryptedCharField
 from katka.auditedmodel import AuditedModel
 from katka.constants import (
     PIPELINE_STATUS_CHOICES, PIPELINE_STATUS_INITIALIZING, RELEASE_STATUS_CHOICES, RELEASE_STATUS_IN_PROGRESS,
     STEP_STATUS_CHOICES, STEP_STATUS_NOT_STARTED,
 )
-from katka.fields import KatkaSlugField
+from katka.fields import CompressedTextField, KatkaSlugField, LazyEncryptedCharField
+from katka.secret_cache import secret_cache
 
 
 class Team(AuditedModel):
@@ -31,6 +33,11 @@ class Project(AuditedModel):
     class Meta:
         unique_together = ('team', 'slug')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the team of the pipeline runs of the project, see katka.signals.move_pipelines_with_project
+        self.pipelines_team_id = self.__dict__.get('team_id')
+
     def __str__(self):  # pragma: no cover
         return f'{self.name}'
 
@@ -47,7 +54,7 @@ class Credential(AuditedModel):
 
 class CredentialSecret(AuditedModel):
     key = models.CharField(max_length=50)
-    value = EncryptedCharField(max_length=200)
+    value = LazyEncryptedCharField(max_length=200)
     credential = models.ForeignKey(Credential, on_delete=models.CASCADE)
 
     class Meta:
@@ -56,6 +63,17 @@ class CredentialSecret(AuditedModel):
     def __str__(self):  # pragma: no cover
         return f'{self.credential.name}/{self.key}'
 
+    def decrypt_value(self, token):
+        """
+        Decrypt the value once per process instead of on every read. The encrypted value is part of the cache key, so
+        an update is never answered with the old plaintext, not even when it is done with QuerySet.update() (which does
+        not change modified_at) or by another process. The plaintext is also removed when the secret is saved or
+        deleted, see katka.signals.
+        """
+        return secret_cache.get_or_decrypt(
+            (self.credential_id, self.key, token), lambda: LazyEncryptedCharField.decrypt(token),
+        )
+
 
 class SCMService(AuditedModel):
     class Meta:
@@ -95,10 +113,44 @@ class Application(AuditedModel):
     class Meta:
         unique_together = ('project', 'slug')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the project the team of the pipeline runs was taken from, see katka.signals.move_pipelines_with_application
+        self.pipelines_project_id = self.__dict__.get('project_id')
+
     def __str__(self):  # pragma: no cover
         return f'{self.name}'
 
 
+class PipelineDefinitionManager(models.Manager):
+    use_in_migrations = True
+
+    @staticmethod
+    def content_hash(pipeline_yaml):
+        return hashlib.sha256(pipeline_yaml.encode('utf-8')).hexdigest()
+
+    def get_for_yaml(self, pipeline_yaml):
+        """The definition with this content, created when no run used it before"""
+        definition, _ = self.get_or_create(
+            content_hash=self.content_hash(pipeline_yaml), defaults={'pipeline_yaml': pipeline_yaml},
+        )
+        return definition
+
+
+class PipelineDefinition(models.Model):
+    """
+    The pipeline yaml of pipeline runs, stored once per distinct content. The definition of an application rarely
+    changes between commits, so most runs share it. Rows are never changed, the content hash is the primary key.
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)  # SHA-256 of the yaml
+    pipeline_yaml = CompressedTextField()
+
+    objects = PipelineDefinitionManager()
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.content_hash}'
+
+
 # Pipeline run results
 class SCMPipelineRun(AuditedModel):
     class Meta:
@@ -108,7 +160,16 @@ class SCMPipelineRun(AuditedModel):
             models.UniqueConstraint(fields=('commit_hash', 'application'), name='unique commits per application'),
         )
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['-created_at'])]
+        indexes = [
+            # the lists are paginated on active_pipeline_runs_team_idx, which also orders on the primary key
+            models.Index(fields=['-created_at']),
+            # the commit graph: find the children of a commit to run them after their parent finished
+            models.Index(fields=['application', 'first_parent_hash', 'status']),
+            # the runs in scope of a user, newest first. Deleted runs are never listed, so they are left out of the
+            # index (see AuditedModel.active)
+            models.Index(fields=['team', '-created_at', '-public_identifier'], name='active_pipeline_runs_team_idx',
+                         condition=models.Q(deleted=False)),
+        ]
 
     public_identifier = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     commit_hash = models.CharField(max_length=64)  # A SHA-1 hash is 40 characters, SHA-256 is 64 characters
@@ -121,14 +182,65 @@ class SCMPipelineRun(AuditedModel):
     status = models.CharField(max_length=30, choices=PIPELINE_STATUS_CHOICES, default=PIPELINE_STATUS_INITIALIZING)
     steps_total = models.PositiveSmallIntegerField(default=0)
     steps_completed = models.PositiveSmallIntegerField(default=0)
-    pipeline_yaml = models.TextField(default='---')
+    pipeline_definition = models.ForeignKey(PipelineDefinition, on_delete=models.PROTECT)
     application = models.ForeignKey(Application, on_delete=models.PROTECT)
+    # the team of the project of the application, so the runs can be filtered on team without joining the project.
+    # Set on save and kept up to date when an application or project moves, see katka.pipeline_teams
+    team = models.ForeignKey(Team, on_delete=models.PROTECT, db_index=False, editable=False)
+
+    DEFAULT_PIPELINE_YAML = '---'
+
+    def __init__(self, *args, **kwargs):
+        self._new_pipeline_yaml = None
+        super().__init__(*args, **kwargs)
+        self.team_application_id = self.__dict__.get('application_id')
+
+    @property
+    def pipeline_yaml(self):
+        """
+        The yaml of the pipeline definition. Setting it links the run to the definition with that content when the run
+        is saved, so the yaml is only stored once for all runs that use it.
+        """
+        if self._new_pipeline_yaml is not None:
+            return self._new_pipeline_yaml
+        if self.pipeline_definition_id is None:
+            return self.DEFAULT_PIPELINE_YAML
+
+        return self.pipeline_definition.pipeline_yaml
+
+    @pipeline_yaml.setter
+    def pipeline_yaml(self, value):
+        self._new_pipeline_yaml = value
+
+    def save(self, *args, **kwargs):
+        if self._new_pipeline_yaml is not None or self.pipeline_definition_id is None:
+            self.pipeline_definition = PipelineDefinition.objects.get_for_yaml(self.pipeline_yaml)
+            self._new_pipeline_yaml = None
+
+        moved = self.team_id is not None and self.application_id != self.team_application_id
+        if self.team_id is None or moved:
+            self.team_id = Application.objects.filter(pk=self.application_id).values_list('project__team').get()[0]
+            self.team_application_id = self.application_id
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'team'}
+
+        super().save(*args, **kwargs)
+
+        if moved:
+            SCMStepRun.objects.filter(scm_pipeline_run=self).exclude(team=self.team_id).update(team=self.team_id)
 
 
 class SCMStepRun(AuditedModel):
     class Meta:
         verbose_name = 'SCM step'
         verbose_name_plural = 'SCM steps'
+        indexes = [
+            models.Index(fields=['-created_at', '-public_identifier']),
+            models.Index(fields=['started_at']),
+            models.Index(fields=['ended_at']),
+            models.Index(fields=['team', '-created_at', '-public_identifier'], name='active_step_runs_team_idx',
+                         condition=models.Q(deleted=False)),
+        ]
 
     step_type = models.CharField(max_length=100, null=True)
     public_identifier = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -136,7 +248,7 @@ class SCMStepRun(AuditedModel):
     name = models.CharField(max_length=100)
     stage = models.CharField(max_length=100)
     status = models.CharField(max_length=30, choices=STEP_STATUS_CHOICES, default=STEP_STATUS_NOT_STARTED)
-    output = models.TextField(blank=True)
+    output = CompressedTextField(blank=True)
     sequence_id = models.CharField(max_length=30, blank=True, null=True)
     # The format of a sequence ID is: <stage_nr>.<step_nr>-<parallel_nr>, with the following explanation:
     #
@@ -150,10 +262,97 @@ class SCMStepRun(AuditedModel):
     # there are more than 9 stages, it should be "01.1", or if there are more than 9 steps: "1.01".
     # This allows easy sorting for e.g. frontends.
     scm_pipeline_run = models.ForeignKey(SCMPipelineRun, on_delete=models.PROTECT)
+    # the team of the pipeline run, see SCMPipelineRun.team
+    team = models.ForeignKey(Team, on_delete=models.PROTECT, db_index=False, editable=False)
     tags = models.TextField(blank=True)
     started_at = models.DateTimeField(blank=True, null=True)
     ended_at = models.DateTimeField(blank=True, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_counted_state()
+        instance.remember_synced_tags()
+        instance.remember_summarized_output()
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous_pipeline_id, _ = getattr(self, 'counted_state', (None, None))
+        if self.team_id is None or self.scm_pipeline_run_id != previous_pipeline_id:
+            if SCMStepRun.scm_pipeline_run.is_cached(self):
+                self.team_id = self.scm_pipeline_run.team_id
+            else:
+                self.team_id = SCMPipelineRun.objects.filter(pk=self.scm_pipeline_run_id).values_list('team').get()[0]
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'team'}
+
+        super().save(*args, **kwargs)
+
+    def remember_counted_state(self):
+        """
+        Remember the pipeline and status as they are stored in the database, so the pipeline step counters can be
+        adjusted with the difference on the next save. Deferred fields are not in __dict__, which leaves them unknown.
+        """
+        self.counted_state = (self.__dict__.get('scm_pipeline_run_id'), self.__dict__.get('status'))
+
+    def remember_synced_tags(self):
+        """Remember the tags that are stored as SCMStepRunTag rows, so they are only synced again when they change"""
+        self.synced_tags = self.__dict__.get('tags')
+
+    def remember_summarized_output(self):
+        """
+        Remember the output as it is stored in the database, so the release summary of the step only looks for the
+        release version in it again when it changes
+        """
+        self.summarized_output = self.__dict__.get('output')
+
+
+class SCMStepRunTag(models.Model):
+    """
+    A tag of a step, the space separated SCMStepRun.tags in a form that can be indexed, so steps can be queried on
+    their tags. The rows are kept in sync with SCMStepRun.tags, see katka.step_tags.
+    """
+    class Meta:
+        constraints = (
+            # also the index to find the steps with a tag
+            models.UniqueConstraint(fields=('name', 'scm_step_run'), name='unique tags per step'),
+        )
+
+    scm_step_run = models.ForeignKey(SCMStepRun, on_delete=models.CASCADE, related_name='tag_set')
+    name = models.CharField(max_length=255)
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.name}'
+
+
+class SCMStepRunOutputChunk(models.Model):
+    """
+    A chunk of output appended to a step, see katka.output_storage.
+
+    The offsets are in characters and the chunks of a step are contiguous, so the chunks to read for a range of the
+    output can be found on the (scm_step_run, offset) index. Depending on the storage, the text is in 'data' or
+    stored elsewhere at 'storage_position'.
+    """
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('scm_step_run', 'offset'), name='unique output offsets per step'),
+        )
+
+    scm_step_run = models.ForeignKey(SCMStepRun, on_delete=models.CASCADE, related_name='output_chunks')
+    offset = models.BigIntegerField()
+    length = models.PositiveIntegerField()
+    data = models.TextField(blank=True)
+    storage_position = models.BigIntegerField(null=True)
+    storage_length = models.PositiveIntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def end(self):
+        return self.offset + self.length
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.scm_step_run_id}@{self.offset}'
+
 
 # SCM Releases, comprises a range of commits that are released
 class SCMRelease(AuditedModel):
@@ -161,7 +360,14 @@ class SCMRelease(AuditedModel):
         verbose_name = 'SCM release'
         verbose_name_plural = 'SCM releases'
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['-created_at'])]
+        indexes = [
+            models.Index(fields=['-created_at']),
+            # the lists are paginated on this index, which also orders on the primary key
+            models.Index(fields=['-created_at', '-public_identifier'], name='active_releases_created_idx',
+                         condition=models.Q(deleted=False)),
+            models.Index(fields=['started_at']),
+            models.Index(fields=['ended_at']),
+        ]
 
     public_identifier = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
@@ -181,3 +387,80 @@ class ApplicationMetadata(AuditedModel):
 
     def __str__(self):  # pragma: no cover
         return f'{self.application.name}/{self.key}'
+
+
+class PipelineChangeNotification(models.Model):
+    """
+    Outbox of pipeline change notifications that still need to be sent to the pipeline runner.
+
+    There is at most one row per pipeline, so multiple changes of a pipeline before the notification is sent are
+    coalesced into a single notification.
+    """
+    public_identifier = models.UUIDField(unique=True)
+    requested_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.public_identifier}'
+
+
+class SCMStepRunReleaseSummary(models.Model):
+    """
+    The part of an executed step that matters for closing the release of its pipeline, kept up to date whenever the
+    step is saved, so a finished pipeline does not need to read and parse the output of all its steps. The production
+    change tags of the step are its SCMStepRunTag rows (see katka.releases).
+    """
+    class Meta:
+        indexes = [
+            # the order of the steps, see katka.releases.SUMMARY_ORDERING
+            models.Index(fields=['scm_pipeline_run', 'sequence_id', 'scm_step_run']),
+        ]
+
+    scm_step_run = models.OneToOneField(
+        SCMStepRun, on_delete=models.CASCADE, primary_key=True, related_name='release_summary',
+    )
+    scm_pipeline_run = models.ForeignKey(SCMPipelineRun, on_delete=models.CASCADE, db_index=False)
+    sequence_id = models.CharField(max_length=30, null=True)
+    status = models.CharField(max_length=30)
+    started_at = models.DateTimeField(null=True)
+    ended_at = models.DateTimeField(null=True)
+    # the JSON encoded release.version of the output, null when the output does not contain it
+    release_version = models.TextField(null=True)
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.scm_step_run_id}'
+
+
+class BatchedMigrationProgress(models.Model):
+    """
+    Progress of a data migration that is done in batches, so it can continue where it stopped after an interruption.
+    See katka.batched_migrations.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    last_pk = models.CharField(max_length=255, null=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.name}'
+
+
+class ArchivedRow(models.Model):
+    """
+    A row that was soft deleted long ago and moved out of its table, see katka.archive. 'data' contains the values of
+    the columns as JSON, keyed by column name. Encrypted values stay encrypted.
+    """
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_pk']),
+        ]
+
+    model = models.CharField(max_length=100)  # the label of the model, e.g. 'katka.SCMStepRun'
+    object_pk = models.CharField(max_length=255)
+    data = CompressedTextField()
+    archived_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.model}:{self.object_pk}'
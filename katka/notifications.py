@@ -0,0 +1,170 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from katka.constants import NOTIFICATION_DISPATCHER_OUTBOX, NOTIFICATION_DISPATCHER_SYNC
+from katka.models import PipelineChangeNotification
+from requests import HTTPError, RequestException
+
+log = logging.getLogger('katka')
+
+DEFAULT_RETRY_DELAY = 2  # seconds, doubled on every failed attempt
+DEFAULT_MAX_RETRY_DELAY = 300
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_CLAIM_TIMEOUT = 60  # seconds, longer than sending a notification takes
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='katka-notifications')
+_scheduled = threading.Event()
+# the timer of the in-process worker that drains the outbox again when the next retry is due, see _schedule_retry
+_retry_timer = None
+
+
+def notify_pipeline_change(pipeline):
+    """
+    Notify the pipeline runner that a pipeline changed, either directly or through the outbox.
+
+    With the 'outbox' dispatcher, a notification row is written in the current transaction and it is sent by a
+    background worker once the transaction is committed, so the request does not wait on the pipeline runner.
+    """
+    dispatcher = getattr(settings, 'PIPELINE_CHANGE_NOTIFICATION_DISPATCHER', NOTIFICATION_DISPATCHER_SYNC)
+    if dispatcher != NOTIFICATION_DISPATCHER_OUTBOX:
+        post_notification(pipeline.public_identifier)
+        return
+
+    enqueue_notification(pipeline.public_identifier)
+    if getattr(settings, 'PIPELINE_CHANGE_NOTIFICATION_IN_PROCESS_WORKER', True):
+        transaction.on_commit(schedule_dispatch)
+
+
+def post_notification(public_identifier):
+    """Send a notification to the pipeline runner, returns whether it was accepted"""
+    session = settings.PIPELINE_CHANGE_NOTIFICATION_SESSION
+    response = session.post(
+        settings.PIPELINE_CHANGE_NOTIFICATION_URL, json={'public_identifier': str(public_identifier)}
+    )
+
+    try:
+        response.raise_for_status()
+    except HTTPError:
+        log.exception("Failed to notify pipeline runner")
+        return False
+
+    return True
+
+
+def enqueue_notification(public_identifier):
+    now = timezone.now()
+    pending = PipelineChangeNotification.objects.filter(public_identifier=public_identifier)
+    if pending.update(requested_at=now, attempts=0, next_attempt_at=now):
+        return
+
+    try:
+        with transaction.atomic():
+            PipelineChangeNotification.objects.create(public_identifier=public_identifier, requested_at=now)
+    except IntegrityError:
+        # a concurrent transaction created it after the update above
+        pending.update(requested_at=now, attempts=0, next_attempt_at=now)
+
+
+def schedule_dispatch():
+    """Drain the outbox in the background worker, unless a drain is already scheduled"""
+    if _scheduled.is_set():
+        return
+
+    _scheduled.set()
+    _executor.submit(_dispatch_in_worker)
+
+
+def _dispatch_in_worker():
+    _scheduled.clear()
+    try:
+        dispatch_pending()
+        _schedule_retry()
+    except Exception:
+        log.exception("Failed to dispatch pipeline change notifications")
+    finally:
+        connection.close()
+
+
+def _schedule_retry():
+    """Drain the outbox again when the first notification that is left is due, e.g. a failed one to retry"""
+    global _retry_timer
+
+    next_attempt_at = PipelineChangeNotification.objects.aggregate(Min('next_attempt_at'))['next_attempt_at__min']
+    if _retry_timer is not None:
+        _retry_timer.cancel()
+        _retry_timer = None
+    if next_attempt_at is None:
+        return
+
+    _retry_timer = threading.Timer(max((next_attempt_at - timezone.now()).total_seconds(), 0), schedule_dispatch)
+    _retry_timer.daemon = True
+    _retry_timer.start()
+
+
+def dispatch_pending(limit=100):
+    """
+    Send the notifications that are due, oldest first.
+
+    The notifications are claimed first: rows locked by another dispatcher are skipped and the claimed rows are not
+    due again for PIPELINE_CHANGE_NOTIFICATION_CLAIM_TIMEOUT seconds, so concurrent dispatchers (e.g. the command and
+    the in-process worker) do not send the same notification twice. A notification that was requested again while it
+    was being sent is kept, so the runner is notified of the latest change as well. Failed notifications are retried
+    with exponential backoff, up to a maximum number of attempts.
+
+    Returns:
+        The number of notifications that were sent successfully
+    """
+    retry_delay = getattr(settings, 'PIPELINE_CHANGE_NOTIFICATION_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    max_retry_delay = getattr(settings, 'PIPELINE_CHANGE_NOTIFICATION_MAX_RETRY_DELAY', DEFAULT_MAX_RETRY_DELAY)
+    max_attempts = getattr(settings, 'PIPELINE_CHANGE_NOTIFICATION_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+    sent = 0
+    for notification in _claim_due(limit):
+        current = PipelineChangeNotification.objects.filter(
+            pk=notification.pk, requested_at=notification.requested_at
+        )
+        try:
+            accepted = post_notification(notification.public_identifier)
+        except RequestException:
+            log.exception("Failed to connect to pipeline runner")
+            accepted = False
+
+        if accepted:
+            current.delete()
+            sent += 1
+            continue
+
+        attempts = notification.attempts + 1
+        if attempts >= max_attempts:
+            log.error(f'Giving up notifying pipeline runner of {notification.public_identifier} '
+                      f'after {attempts} attempts')
+            current.delete()
+            continue
+
+        delay = min(retry_delay * 2 ** (attempts - 1), max_retry_delay)
+        current.update(attempts=attempts, next_attempt_at=timezone.now() + timedelta(seconds=delay))
+
+    return sent
+
+
+def _claim_due(limit):
+    claim_timeout = getattr(settings, 'PIPELINE_CHANGE_NOTIFICATION_CLAIM_TIMEOUT', DEFAULT_CLAIM_TIMEOUT)
+    now = timezone.now()
+    with transaction.atomic():
+        due = list(
+            PipelineChangeNotification.objects.select_for_update(skip_locked=True).filter(
+                next_attempt_at__lte=now,
+            ).order_by('next_attempt_at')[:limit]
+        )
+        PipelineChangeNotification.objects.filter(pk__in=[notification.pk for notification in due]).update(
+            next_attempt_at=now + timedelta(seconds=claim_timeout),
+        )
+
+    return due
@@ -0,0 +1,95 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from katka.models import SCMStepRun, SCMStepRunOutputChunk
+
+DEFAULT_STORAGE = 'katka.output_storage.DatabaseOutputStorage'
+
+
+class DatabaseOutputStorage:
+    """Stores the text of the output chunks in the chunk table itself, apart from the steps table"""
+
+    def write(self, chunk, text):
+        chunk.data = text
+
+    def read(self, chunk):
+        return chunk.data
+
+
+class LocalDiskOutputStorage:
+    """
+    Stores the output of every step in a file in the KATKA_STEP_OUTPUT_DIRECTORY directory, the chunk table only
+    contains the position of every chunk in the file. The directory needs to be shared by all processes of the service.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or getattr(settings, 'KATKA_STEP_OUTPUT_DIRECTORY', None)
+        if not self.directory:
+            raise ImproperlyConfigured('KATKA_STEP_OUTPUT_DIRECTORY is required for the local disk output storage')
+
+    def path(self, step_id):
+        return os.path.join(self.directory, f'{step_id}.log')
+
+    def write(self, chunk, text):
+        os.makedirs(self.directory, exist_ok=True)
+        data = text.encode('utf-8')
+        with open(self.path(chunk.scm_step_run_id), 'ab') as f:
+            chunk.storage_position = f.tell()
+            f.write(data)
+        chunk.storage_length = len(data)
+
+    def read(self, chunk):
+        with open(self.path(chunk.scm_step_run_id), 'rb') as f:
+            f.seek(chunk.storage_position)
+            return f.read(chunk.storage_length).decode('utf-8')
+
+
+def get_output_storage():
+    """The output storage configured with the KATKA_STEP_OUTPUT_STORAGE setting (a dotted path to a class)"""
+    return import_string(getattr(settings, 'KATKA_STEP_OUTPUT_STORAGE', DEFAULT_STORAGE))()
+
+
+def append_output(step, text):
+    """
+    Append text to the output of a step.
+
+    Concurrent appends to the same step are serialized by locking the step, so the chunks stay contiguous.
+
+    Returns:
+        The offset at which the text was appended
+    """
+    with transaction.atomic():
+        SCMStepRun.objects.select_for_update().filter(pk=step.pk).values_list('pk').get()
+        offset = get_output_size(step)
+        chunk = SCMStepRunOutputChunk(scm_step_run=step, offset=offset, length=len(text))
+        get_output_storage().write(chunk, text)
+        chunk.save()
+
+    return offset
+
+
+def get_output_size(step):
+    """The number of characters appended to the output of a step"""
+    last = SCMStepRunOutputChunk.objects.filter(scm_step_run=step).order_by('-offset').only('offset', 'length').first()
+    return last.end if last else 0
+
+
+def read_output(step, offset, limit):
+    """Read at most 'limit' characters of the appended output of a step, starting at 'offset'"""
+    end = offset + limit
+    chunks = SCMStepRunOutputChunk.objects.filter(
+        scm_step_run=step, offset__lt=end, offset__gt=offset - F('length'),
+    ).order_by('offset')
+
+    storage = get_output_storage()
+    parts = []
+    for chunk in chunks:
+        text = storage.read(chunk)
+        parts.append(text[max(offset - chunk.offset, 0):end - chunk.offset])
+
+    return ''.join(parts)
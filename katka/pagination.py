@@ -0,0 +1,35 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Opt-in keyset pagination on the ('-created_at', '-pk') index.
+
+    Results are only paginated when the client asks for it by passing 'page_size' (or a cursor from a previous page),
+    otherwise the complete list is returned like before. Since the cursor points to a position in the index instead
+    of an offset, pages stay stable when new rows are inserted and every page costs the same, however deep it is.
+
+    The primary key makes the ordering unique, so rows with the same created_at are always in the same order and are
+    never repeated or skipped between pages.
+    """
+    ordering = ('-created_at', '-pk')
+    page_size = None
+    page_size_query_param = 'page_size'
+    default_page_size = 100
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        page_size = super().get_page_size(request)
+        if page_size is None and self.cursor_query_param in request.query_params:
+            # links to the next/previous pages always contain the page size, but be lenient with hand-crafted urls
+            return self.default_page_size
+
+        return page_size
+
+    def get_ordering(self, request, queryset, view):
+        """Follow the ordering requested from the view (see FilterViewMixin), which is restricted to indexed fields"""
+        ordering = view.get_ordering() if hasattr(view, 'get_ordering') else None
+        if ordering:
+            return (ordering, '-pk' if ordering.startswith('-') else 'pk')
+
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,16 @@
+from katka.models import SCMPipelineRun, SCMStepRun
+
+
+def update_pipeline_teams(applications, team_id):
+    """
+    Set the denormalized team of the pipeline runs and steps of applications, after the applications moved to
+    another project or their project moved to another team. Only rows with another team are written.
+
+    Args:
+        applications: The applications, a queryset or a list of primary keys
+        team_id: The team of the project of the applications
+    """
+    SCMPipelineRun.objects.filter(application__in=applications).exclude(team=team_id).update(team=team_id)
+    SCMStepRun.objects.filter(scm_pipeline_run__application__in=applications).exclude(team=team_id).update(
+        team=team_id,
+    )
@@ -1,14 +1,27 @@
 import json
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
 from katka import constants
 from katka.fields import username_on_model
-from katka.models import SCMPipelineRun, SCMRelease, SCMStepRun
+from katka.models import SCMPipelineRun, SCMRelease, SCMStepRun, SCMStepRunReleaseSummary, SCMStepRunTag
+from katka.step_output import find_output_value, output_may_contain_key
 
 log = logging.getLogger('katka')
 
+RELEASE_VERSION_KEY = 'release.version'
+# the fields of a release summary that are copied from its step
+SUMMARY_STEP_FIELDS = ['scm_pipeline_run', 'sequence_id', 'status', 'started_at', 'ended_at']
+# The order of the steps of a pipeline, steps without sequence_id last like PostgreSQL orders them by default. Steps
+# with the same sequence_id are ordered on their primary key, so the order never depends on the query plan.
+STEPS_ORDERING = (F('sequence_id').asc(nulls_last=True), 'pk')
+STEPS_ORDERING_REVERSED = (F('sequence_id').desc(nulls_first=True), '-pk')
+
 
 @dataclass
 class StepsPreConditions:
@@ -41,7 +54,7 @@ def close_release_if_pipeline_finished(pipeline: SCMPipelineRun):
         log.debug(f'Pipeline {pipeline.public_identifier} not finished, doing nothing')
         return None
 
-    pre_conditions = _gather_steps_pre_conditions(pipeline)
+    pre_conditions = _get_steps_pre_conditions(pipeline)
     if not pre_conditions.start_and_finish_tags_were_executed:
         log.debug(f'Pipeline {pipeline.public_identifier} missing start and/or finish tags')
         return None
@@ -70,15 +83,17 @@ def close_release_if_pipeline_finished(pipeline: SCMPipelineRun):
 
 
 def _gather_steps_pre_conditions(pipeline):
-    steps = SCMStepRun.objects.filter(scm_pipeline_run=pipeline).order_by("sequence_id")
+    steps = _executed_steps(pipeline.pk)
+    outputs = _outputs_with_release_version(steps)
     prod_start_date = None
     prod_end_date = None
     success_status_between_start_end = []
-    pipeline_output = {}
+    version_number = None
     for step in steps:
-        if step.status not in constants.STEP_EXECUTED_STATUSES:
-            continue
-        _add_output(pipeline_output=pipeline_output, step_output=step.output)
+        found, version = find_output_value(outputs.get(step.pk, ''), RELEASE_VERSION_KEY)
+        if found:
+            version_number = version
+
         if constants.TAG_PRODUCTION_CHANGE_STARTED in step.tags.split(" "):
             prod_start_date = step.started_at
 
@@ -89,19 +104,185 @@ def _gather_steps_pre_conditions(pipeline):
             prod_end_date = step.ended_at
             break
 
-    return StepsPreConditions(pipeline_output.get("release.version"),
+    return StepsPreConditions(version_number,
                               success_status_between_start_end,
                               prod_change_start_date=prod_start_date,
                               prod_change_end_date=prod_end_date)
 
 
-def _add_output(pipeline_output: dict, step_output: str) -> None:
-    if not step_output:
-        return
-    try:
-        pipeline_output.update(json.loads(step_output))
-    except json.JSONDecodeError:
-        logging.warning("Invalid JSON in step output")
+def _has_production_change_tags(pipeline):
+    """Whether executed steps of the pipeline are tagged with the start and end of the production change"""
+    tags = (constants.TAG_PRODUCTION_CHANGE_STARTED, constants.TAG_PRODUCTION_CHANGE_ENDED)
+    tagged = SCMStepRunTag.objects.filter(
+        scm_step_run__scm_pipeline_run=pipeline,
+        scm_step_run__status__in=constants.STEP_EXECUTED_STATUSES,
+        name__in=tags,
+    ).values_list('name', flat=True).distinct()
+    return set(tagged) == set(tags)
+
+
+def _executed_steps(pipeline_id):
+    return SCMStepRun.objects.filter(
+        scm_pipeline_run=pipeline_id, status__in=constants.STEP_EXECUTED_STATUSES,
+    ).defer('output').order_by(*STEPS_ORDERING)
+
+
+def _outputs_with_release_version(steps):
+    """Only load the outputs that can contain the release version, the other outputs can be large and are not used"""
+    return dict(steps.filter(output_may_contain_key(RELEASE_VERSION_KEY)).values_list('pk', 'output'))
+
+
+def _get_steps_pre_conditions(pipeline):
+    """
+    Use the release summaries of the steps, which are updated whenever a step is saved, instead of reading all steps.
+
+    The RELEASE_PRE_CONDITIONS_MODE setting can be set to 'rescan' to read all steps like before, or to 'verify' to
+    do both and rebuild the release summaries when they do not match the steps.
+    """
+    mode = getattr(settings, 'RELEASE_PRE_CONDITIONS_MODE', constants.RELEASE_PRE_CONDITIONS_MODE_INCREMENTAL)
+    if mode == constants.RELEASE_PRE_CONDITIONS_MODE_RESCAN:
+        if not _has_production_change_tags(pipeline):
+            # the release cannot be closed without both tags, so there is no need to read all steps
+            return StepsPreConditions(None, [])
+
+        return _gather_steps_pre_conditions(pipeline)
+
+    pre_conditions = _pre_conditions_from_summaries(pipeline.pk)
+    if mode == constants.RELEASE_PRE_CONDITIONS_MODE_VERIFY:
+        rescanned = _gather_steps_pre_conditions(pipeline)
+        if _without_step_order(rescanned) != pre_conditions:
+            log.warning(f'Release summaries of pipeline {pipeline.public_identifier} do not match its steps, '
+                        f'rebuilding')
+            _rebuild_summaries(pipeline.pk)
+            return rescanned
+
+    return pre_conditions
+
+
+def record_steps(steps):
+    """
+    Update the release summaries of the steps, after the steps were saved. Only the rows of the steps themselves are
+    written, so steps of the same pipeline can be saved concurrently.
+    """
+    executed = [step for step in steps if step.status in constants.STEP_EXECUTED_STATUSES]
+    not_executed = [step.pk for step in steps if step.status not in constants.STEP_EXECUTED_STATUSES]
+    if not_executed:
+        SCMStepRunReleaseSummary.objects.filter(pk__in=not_executed).delete()
+
+    existing = _summarized_step_ids(executed)
+    created, updated, updated_with_version = [], [], []
+    for step in executed:
+        if step.pk not in existing:
+            created.append(_summarize_step(step, step.output))
+        elif step.output == getattr(step, 'summarized_output', None):
+            # the output did not change, so neither did the release version in it
+            updated.append(_summarize_step(step))
+        else:
+            updated_with_version.append(_summarize_step(step, step.output))
+
+    SCMStepRunReleaseSummary.objects.bulk_update(updated, SUMMARY_STEP_FIELDS)
+    SCMStepRunReleaseSummary.objects.bulk_update(updated_with_version, SUMMARY_STEP_FIELDS + ['release_version'])
+    # the summary of a step that is saved concurrently can be created by the other save first, which then stays
+    SCMStepRunReleaseSummary.objects.bulk_create(created, ignore_conflicts=True)
+
+    for step in steps:
+        step.remember_summarized_output()
+
+
+def _summarized_step_ids(steps):
+    if not steps:
+        return set()
+
+    summaries = SCMStepRunReleaseSummary.objects.filter(pk__in=[step.pk for step in steps])
+    return set(summaries.values_list('pk', flat=True))
+
+
+def _summarize_step(step, step_output=None):
+    """The release summary of an executed step, the release version is only looked up when 'step_output' is given"""
+    summary = SCMStepRunReleaseSummary(
+        scm_step_run_id=step.pk,
+        scm_pipeline_run_id=step.scm_pipeline_run_id,
+        sequence_id=step.sequence_id,
+        status=step.status,
+        started_at=step.started_at,
+        ended_at=step.ended_at,
+    )
+    if step_output is not None:
+        found, version = find_output_value(step_output, RELEASE_VERSION_KEY)
+        if found:
+            summary.release_version = json.dumps(version)
+
+    return summary
+
+
+def _rebuild_summaries(pipeline_id):
+    steps = _executed_steps(pipeline_id)
+    outputs = _outputs_with_release_version(steps)
+    with transaction.atomic():
+        SCMStepRunReleaseSummary.objects.filter(scm_pipeline_run=pipeline_id).delete()
+        SCMStepRunReleaseSummary.objects.bulk_create(
+            [_summarize_step(step, outputs.get(step.pk, '')) for step in steps], ignore_conflicts=True,
+        )
+
+
+def _pre_conditions_from_summaries(pipeline_id):
+    """
+    Same as _gather_steps_pre_conditions, but from the release summaries of the steps, with a few indexed queries
+    that do not read the summaries of all steps. Only the number of failed steps between the start and the end of the
+    production change is counted, so those steps come first in 'success_status_between_start_end'.
+    """
+    summaries = SCMStepRunReleaseSummary.objects.filter(scm_pipeline_run=pipeline_id)
+    end = _tagged(summaries, constants.TAG_PRODUCTION_CHANGE_ENDED).order_by(*STEPS_ORDERING).first()
+    if end is not None:
+        # like a rescan, the steps after the end of the production change are ignored
+        summaries = summaries.filter(_at_or_before(end.sequence_id, end.pk))
+
+    version = summaries.exclude(release_version=None).order_by(*STEPS_ORDERING_REVERSED).values_list(
+        'release_version', flat=True,
+    ).first()
+    version_number = json.loads(version) if version is not None else None
+    prod_end_date = end.ended_at if end is not None else None
+
+    starts = list(_tagged(summaries, constants.TAG_PRODUCTION_CHANGE_STARTED).order_by(*STEPS_ORDERING).values_list(
+        'sequence_id', 'pk', 'started_at',
+    ))
+    if not starts:
+        return StepsPreConditions(version_number, [], prod_change_end_date=prod_end_date)
+
+    first_sequence_id, first_pk, _ = starts[0]
+    counts = summaries.filter(_at_or_after(first_sequence_id, first_pk)).aggregate(
+        steps=Count('pk'), failed=Count('pk', filter=~Q(status=constants.STEP_STATUS_SUCCESS)),
+    )
+    return StepsPreConditions(version_number,
+                              [False] * counts['failed'] + [True] * (counts['steps'] - counts['failed']),
+                              prod_change_start_date=starts[-1][2],
+                              prod_change_end_date=prod_end_date)
+
+
+def _at_or_before(sequence_id, pk):
+    """Filter for the summaries that are ordered before the step with 'sequence_id' and 'pk', or are that step"""
+    if sequence_id is None:
+        return Q(sequence_id__isnull=False) | Q(sequence_id__isnull=True, pk__lte=pk)
+
+    return Q(sequence_id__lt=sequence_id) | Q(sequence_id=sequence_id, pk__lte=pk)
+
+
+def _at_or_after(sequence_id, pk):
+    """Filter for the summaries that are ordered after the step with 'sequence_id' and 'pk', or are that step"""
+    if sequence_id is None:
+        return Q(sequence_id__isnull=True, pk__gte=pk)
+
+    return Q(sequence_id__gt=sequence_id) | Q(sequence_id=sequence_id, pk__gte=pk) | Q(sequence_id__isnull=True)
+
+
+def _tagged(summaries, tag):
+    return summaries.filter(scm_step_run__tag_set__name=tag)
+
+
+def _without_step_order(pre_conditions):
+    """The pre-conditions like _pre_conditions_from_summaries finds them, so they can be compared"""
+    return replace(pre_conditions,
+                   success_status_between_start_end=sorted(pre_conditions.success_status_between_start_end))
 
 
 def _get_current_release(pipeline):
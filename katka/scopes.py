@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from katka.models import Team
+
+CACHE_KEY_PREFIX = 'katka:team-scope'
+CACHE_VERSION_KEY = f'{CACHE_KEY_PREFIX}:version'
+
+
+def get_team_ids(request):
+    """
+    Return the ids of the teams that are linked to a group the user of the request is a member of.
+
+    The ids are resolved once per request, so all querysets and related fields of a request can filter on a flat
+    list of team ids instead of joining through the groups of the user every time. When
+    KATKA_TEAM_SCOPE_CACHE_TIMEOUT is set, the ids are also cached across requests until a group membership or team
+    changes.
+    """
+    team_ids = getattr(request, '_katka_team_ids', None)
+    if team_ids is None:
+        team_ids = _get_cached_team_ids(request.user)
+        request._katka_team_ids = team_ids
+
+    return team_ids
+
+
+def filter_by_user_teams(queryset, team_lookup, request):
+    """Only keep the objects of the queryset whose team (reached through 'team_lookup') is in scope of the user"""
+    if team_lookup is None:
+        return queryset
+
+    return queryset.filter(**{f'{team_lookup}__in': get_team_ids(request)})
+
+
+def _get_cached_team_ids(user):
+    if not user.is_authenticated:
+        return []
+
+    timeout = getattr(settings, 'KATKA_TEAM_SCOPE_CACHE_TIMEOUT', None)
+    if not timeout:
+        return _resolve_team_ids(user)
+
+    key = f'{CACHE_KEY_PREFIX}:{cache.get_or_set(CACHE_VERSION_KEY, 0, None)}:{user.pk}'
+    team_ids = cache.get(key)
+    if team_ids is None:
+        team_ids = _resolve_team_ids(user)
+        cache.set(key, team_ids, timeout)
+
+    return team_ids
+
+
+def _resolve_team_ids(user):
+    return list(Team.objects.filter(group__in=user.groups.all()).values_list('pk', flat=True))
+
+
+def invalidate_team_scopes():
+    """Invalidate the cached team ids of all users"""
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CACHE_VERSION_KEY, 1, None)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_on_group_membership_change(sender, **kwargs):
+    if kwargs['action'] in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_team_scopes()
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def invalidate_on_team_change(sender, **kwargs):
+    invalidate_team_scopes()
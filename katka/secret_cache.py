@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class SecretCache:
+    """
+    Decrypted secrets, so the same secret is not decrypted again for every request that reads it.
+
+    At most KATKA_SECRET_CACHE_SIZE secrets (default 1000) are kept, the least recently used are evicted first, and a
+    secret is decrypted again after KATKA_SECRET_CACHE_TTL seconds (default 300). A size of 0 disables the cache. The
+    plaintext only lives in the memory of this process, it is never put in a shared cache like Django's cache
+    framework.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def get_or_decrypt(self, key, decrypt):
+        """
+        Return the cached plaintext for 'key', or call 'decrypt' and cache what it returns.
+
+        The key has to change when the encrypted value changes, e.g. by including the encrypted value itself, so an
+        update can never return the old plaintext.
+        """
+        max_size = getattr(settings, 'KATKA_SECRET_CACHE_SIZE', 1000)
+        if not max_size:
+            return decrypt()
+
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        # decrypt outside of the lock, so other threads can use the cache meanwhile
+        plaintext = decrypt()
+
+        with self._lock:
+            self._entries[key] = (now + getattr(settings, 'KATKA_SECRET_CACHE_TTL', 300), plaintext)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+            # expired plaintext is never returned, it is dropped once it is the least recently used
+            while self._entries and next(iter(self._entries.values()))[0] <= now:
+                self._entries.popitem(last=False)
+
+        return plaintext
+
+    def invalidate(self, *prefix):
+        """Remove the plaintext of all keys that start with 'prefix'"""
+        with self._lock:
+            for key in [key for key in self._entries if key[:len(prefix)] == prefix]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+secret_cache = SecretCache()
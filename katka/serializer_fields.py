@@ -1,4 +1,5 @@
 from katka.models import Application, Credential, Project, SCMPipelineRun, SCMRepository, SCMService, Team
+from katka.scopes import get_team_ids
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.relations import PrimaryKeyRelatedField
@@ -34,10 +35,7 @@ class TeamRelatedField(PrimaryKeyRelated403Field):
 
     def get_queryset(self):
         """Only get the teams that are connected to a group that the user is a member of"""
-        return Team.objects.filter(
-            group__in=self.context['request'].user.groups.all(),
-            deleted=False
-        )
+        return Team.active.filter(pk__in=get_team_ids(self.context['request']))
 
 
 class ProjectRelatedField(PrimaryKeyRelated403Field):
@@ -45,10 +43,9 @@ class ProjectRelatedField(PrimaryKeyRelated403Field):
 
     def get_queryset(self):
         """Only get the projects that are connected to a team that the user is a member of"""
-        return Project.objects.filter(
-            team__group__in=self.context['request'].user.groups.all(),
-            team__deleted=False,
-            deleted=False
+        return Project.active.filter(
+            team__in=get_team_ids(self.context['request']),
+            team__deleted=False
         )
 
 
@@ -56,10 +53,9 @@ class CredentialRelatedField(PrimaryKeyRelated403Field):
     does_not_exist_message = 'Credential or team does not exist or is not linked to your group'
 
     def get_queryset(self):
-        return Credential.objects.filter(
-            team__group__in=self.context['request'].user.groups.all(),
-            team__deleted=False,
-            deleted=False,
+        return Credential.active.filter(
+            team__in=get_team_ids(self.context['request']),
+            team__deleted=False
         )
 
 
@@ -67,19 +63,16 @@ class SCMServiceRelatedField(PrimaryKeyRelated403Field):
     does_not_exist_message = 'SCMService does not exist'
 
     def get_queryset(self):
-        return SCMService.objects.filter(
-            deleted=False
-        )
+        return SCMService.active.all()
 
 
 class SCMRepositoryRelatedField(PrimaryKeyRelated403Field):
     does_not_exist_message = 'SCMRepository does not exist'
 
     def get_queryset(self):
-        return SCMRepository.objects.filter(
+        return SCMRepository.active.filter(
             scm_service__deleted=False,
-            credential__deleted=False,
-            deleted=False
+            credential__deleted=False
         )
 
 
@@ -87,11 +80,10 @@ class ApplicationRelatedField(PrimaryKeyRelated403Field):
     does_not_exist_message = 'Application does not exist or does not belong to your team'
 
     def get_queryset(self):
-        return Application.objects.filter(
-            project__team__group__in=self.context['request'].user.groups.all(),
+        return Application.active.filter(
+            project__team__in=get_team_ids(self.context['request']),
             project__team__deleted=False,
-            project__deleted=False,
-            deleted=False
+            project__deleted=False
         )
 
 
@@ -99,10 +91,9 @@ class SCMPipelineRunRelatedField(PrimaryKeyRelated403Field):
     does_not_exist_message = 'SCM Pipeline Run does not exist or does not belong to your team'
 
     def get_queryset(self):
-        return SCMPipelineRun.objects.filter(
-            application__project__team__group__in=self.context['request'].user.groups.all(),
-            application__project__team__deleted=False,
+        return SCMPipelineRun.active.filter(
+            team__in=get_team_ids(self.context['request']),
+            team__deleted=False,
             application__project__deleted=False,
-            application__deleted=False,
-            deleted=False
+            application__deleted=False
         )
@@ -10,11 +10,45 @@ from katka.serializer_fields import (
     SCMRepositoryRelatedField, SCMServiceRelatedField, TeamRelatedField,
 )
 from rest_framework import serializers
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def get_sparse_field_names(request, field_names):
+    """
+    Return the field names requested with '?fields=a,b' (only these fields) or '?omit=a,b' (all but these fields).
+
+    Sparse fieldsets only apply to reads, a write always uses all fields.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return list(field_names)
+
+    requested = {}
+    for param in ('fields', 'omit'):
+        value = request.query_params.get(param, None)
+        if value is not None:
+            requested[param] = [name for name in value.split(',') if name]
+            unknown = set(requested[param]) - set(field_names)
+            if unknown:
+                raise ValidationError({param: [f'Unknown field(s): {", ".join(sorted(unknown))}']})
+
+    return [
+        name for name in field_names
+        if name in requested.get('fields', field_names) and name not in requested.get('omit', [])
+    ]
 
 
 class KatkaSerializer(serializers.ModelSerializer):
-    pass
+    """Supports sparse fieldsets, see get_sparse_field_names"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = get_sparse_field_names(self.context.get('request', None), fields.keys())
+        for name in list(fields):
+            if name not in requested:
+                del fields[name]
+
+        return fields
 
 
 class TeamSerializer(KatkaSerializer):
@@ -87,6 +121,8 @@ class SCMRepositorySerializer(KatkaSerializer):
 
 class SCMPipelineRunSerializer(KatkaSerializer):
     application = ApplicationRelatedField()
+    # stored in a PipelineDefinition, see SCMPipelineRun.pipeline_yaml
+    pipeline_yaml = serializers.CharField(required=False, style={'base_template': 'textarea.html'})
 
     class Meta:
         model = SCMPipelineRun
@@ -106,6 +142,16 @@ class SCMStepRunSerializer(KatkaSerializer):
         )
 
 
+class SCMStepRunBulkCreateSerializer(SCMStepRunSerializer):
+    """Steps created for a pipeline in bulk, the pipeline is not part of the body but taken from the url"""
+    scm_pipeline_run = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
+class SCMStepRunOutputSerializer(serializers.Serializer):
+    """A chunk of output that is appended to a step"""
+    output = serializers.CharField(trim_whitespace=False)
+
+
 class SCMStepRunUpdateSerializer(KatkaSerializer):
     # it seems redundant to declare this field here as it is declared in the model, but in this
     # context it's a required field and in the model it's optional, thus the duplication.
@@ -122,6 +168,20 @@ class SCMStepRunUpdateSerializer(KatkaSerializer):
         super().__init__(*args, **kwargs)
 
 
+class SCMStepRunBulkUpdateSerializer(SCMStepRunUpdateSerializer):
+    """Status updates of several steps at once, the step to update is part of each entry"""
+    public_identifier = serializers.UUIDField()
+
+
+class BootstrapSerializer(serializers.Serializer):
+    """What a pipeline runner needs to check out the repository of an application, see BootstrapViewMixin"""
+    application = ApplicationSerializer()
+    scm_repository = SCMRepositorySerializer(source='application.scm_repository')
+    scm_service = SCMServiceSerializer(source='application.scm_repository.scm_service')
+    credential = CredentialSerializer(source='application.scm_repository.credential')
+    secrets = CredentialSecretSerializer(source='application.scm_repository.credential.active_secrets', many=True)
+
+
 class SCMReleaseSerializer(KatkaSerializer):
     scm_pipeline_runs = SCMPipelineRunRelatedField(required=False, read_only=True, many=True)
 
@@ -1,35 +1,51 @@
 import logging
 
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from katka.constants import PIPELINE_STATUS_INITIALIZING, PIPELINE_STATUS_QUEUED, STEP_FINAL_STATUSES
-from katka.fields import username_on_model
-from katka.models import SCMPipelineRun, SCMStepRun
-from katka.releases import close_release_if_pipeline_finished, create_release_if_necessary
-from requests import HTTPError
+from katka.constants import (
+    PIPELINE_STATUS_INITIALIZING, PIPELINE_STATUS_QUEUED, STEP_COUNTER_MODE_DELTA, STEP_COUNTER_MODE_RECOUNT,
+)
+from katka.models import Application, CredentialSecret, Project, SCMPipelineRun, SCMStepRun
+from katka.notifications import notify_pipeline_change
+from katka.pipeline_teams import update_pipeline_teams
+from katka.releases import close_release_if_pipeline_finished, create_release_if_necessary, record_steps
+from katka.secret_cache import secret_cache
+from katka.step_counters import adjust_step_counters, recount_step_counters
+from katka.step_tags import sync_step_tags
 
 log = logging.getLogger('katka')
 
 
 @receiver(post_save, sender=SCMStepRun)
-def update_pipeline_from_steps(sender, **kwargs):
+def update_tags_from_step(sender, **kwargs):
+    step = kwargs['instance']
+    if kwargs['created'] or getattr(step, 'synced_tags', None) != step.tags:
+        sync_step_tags([step], created=kwargs['created'])
+
+
+@receiver(post_save, sender=SCMStepRun)
+def update_release_summary_from_step(sender, **kwargs):
     """
-    Update the pipeline 'steps_completed' and 'steps_total' in case they changed whenever a step is updated/added
+    Keep the release summary of the step up to date, before the pipeline is saved by update_pipeline_from_steps
+    (receivers are called in the order they are connected), after its tags are synced by update_tags_from_step
     """
-    pipeline = kwargs['instance'].scm_pipeline_run
-    pipeline_steps = SCMStepRun.objects.filter(scm_pipeline_run=pipeline)
+    record_steps([kwargs['instance']])
 
-    before_steps_total = pipeline.steps_total
-    before_steps_completed = pipeline.steps_completed
 
-    pipeline.steps_total = pipeline_steps.count()
-    pipeline.steps_completed = pipeline_steps.filter(status__in=STEP_FINAL_STATUSES).count()
+@receiver(post_save, sender=SCMStepRun)
+def update_pipeline_from_steps(sender, **kwargs):
+    """
+    Update the pipeline 'steps_completed' and 'steps_total' in case they changed whenever a step is updated/added
+    """
+    step = kwargs['instance']
+    if getattr(settings, 'PIPELINE_STEP_COUNTER_MODE', STEP_COUNTER_MODE_RECOUNT) == STEP_COUNTER_MODE_DELTA:
+        adjust_step_counters(step, kwargs['created'])
+    else:
+        recount_step_counters(step.scm_pipeline_run, step.modified_username)
 
-    if pipeline.steps_completed != before_steps_completed or pipeline.steps_total != before_steps_total:
-        with username_on_model(SCMPipelineRun, kwargs['instance'].modified_username):
-            pipeline.save()
+    step.remember_counted_state()
 
 
 @receiver(post_save, sender=SCMPipelineRun)
@@ -48,15 +64,7 @@ def send_pipeline_change_notification(sender, **kwargs):
         # being run, do not notify.
         return
 
-    session = settings.PIPELINE_CHANGE_NOTIFICATION_SESSION
-    response = session.post(
-        settings.PIPELINE_CHANGE_NOTIFICATION_URL, json={'public_identifier': str(pipeline.public_identifier)}
-    )
-
-    try:
-        response.raise_for_status()
-    except HTTPError:
-        log.exception("Failed to notify pipeline runner")
+    notify_pipeline_change(pipeline)
 
 
 @receiver(post_save, sender=SCMPipelineRun)
@@ -66,3 +74,34 @@ def create_close_releases(sender, **kwargs):
         create_release_if_necessary(pipeline)
     else:
         close_release_if_pipeline_finished(pipeline)
+
+
+@receiver(post_save, sender=CredentialSecret)
+@receiver(post_delete, sender=CredentialSecret)
+def forget_decrypted_secret(sender, **kwargs):
+    """
+    Do not keep the plaintext of a changed or deleted secret in memory. The cache key contains the encrypted value,
+    so this is not needed to return the new value, but it also covers a changed key of the secret.
+    """
+    secret = kwargs['instance']
+    secret_cache.invalidate(secret.credential_id)
+
+
+@receiver(post_save, sender=Application)
+def move_pipelines_with_application(sender, **kwargs):
+    """Move the pipeline runs to the team of the project, when the application moved to another project"""
+    application = kwargs['instance']
+    if not kwargs['created'] and application.project_id != application.pipelines_project_id:
+        update_pipeline_teams([application.pk], application.project.team_id)
+
+    application.pipelines_project_id = application.project_id
+
+
+@receiver(post_save, sender=Project)
+def move_pipelines_with_project(sender, **kwargs):
+    """Move the pipeline runs of the applications to the team of the project, when the project moved to another team"""
+    project = kwargs['instance']
+    if not kwargs['created'] and project.team_id != project.pipelines_team_id:
+        update_pipeline_teams(Application.objects.filter(project=project).values('pk'), project.team_id)
+
+    project.pipelines_team_id = project.team_id
@@ -0,0 +1,118 @@
+import logging
+
+from django.db import router
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from katka.constants import STEP_FINAL_STATUSES
+from katka.fields import username_on_model
+from katka.models import SCMPipelineRun, SCMStepRun
+
+log = logging.getLogger('katka')
+
+COUNTER_FIELDS = ('steps_total', 'steps_completed', 'modified_at', 'modified_username')
+
+
+def recount_step_counters(pipeline, username):
+    """
+    Count the steps of a pipeline and save the pipeline when 'steps_total' or 'steps_completed' changed.
+
+    This costs two COUNT queries over all the steps of the pipeline.
+    """
+    pipeline_steps = SCMStepRun.objects.filter(scm_pipeline_run=pipeline)
+
+    before_steps_total = pipeline.steps_total
+    before_steps_completed = pipeline.steps_completed
+
+    pipeline.steps_total = pipeline_steps.count()
+    pipeline.steps_completed = pipeline_steps.filter(status__in=STEP_FINAL_STATUSES).count()
+
+    if pipeline.steps_completed != before_steps_completed or pipeline.steps_total != before_steps_total:
+        with username_on_model(SCMPipelineRun, username):
+            pipeline.save()
+
+
+def adjust_step_counters(step, created):
+    """
+    Adjust the counters of the pipeline of a step with the difference between the previous and the new step status.
+
+    The counters are changed with F() expressions, so concurrent step updates on the same pipeline do not overwrite
+    each other and no COUNT query is needed. When the previous state of the step is not known (e.g. the instance was
+    not loaded from the database) the counters of the pipeline are recounted instead.
+    """
+    previous_pipeline_id, previous_status = (None, None) if created else getattr(step, 'counted_state', (None, None))
+
+    if not created and (previous_status is None or previous_pipeline_id != step.scm_pipeline_run_id):
+        if previous_pipeline_id is not None and previous_pipeline_id != step.scm_pipeline_run_id:
+            previous_pipeline = SCMPipelineRun.objects.get(pk=previous_pipeline_id)
+            recount_step_counters(previous_pipeline, step.modified_username)
+
+        recount_step_counters(step.scm_pipeline_run, step.modified_username)
+        return
+
+    total_delta = 1 if created else 0
+    completed_delta = int(step.status in STEP_FINAL_STATUSES)
+    if not created:
+        completed_delta -= int(previous_status in STEP_FINAL_STATUSES)
+
+    if total_delta == 0 and completed_delta == 0:
+        return
+
+    pipeline = step.scm_pipeline_run
+    SCMPipelineRun.objects.filter(pk=pipeline.pk).update(
+        steps_total=F('steps_total') + total_delta,
+        steps_completed=F('steps_completed') + completed_delta,
+        modified_at=timezone.now(),
+        modified_username=step.modified_username,
+    )
+    # the status is refreshed as well, the cached pipeline of the step can be older than the stored one
+    pipeline.refresh_from_db(fields=COUNTER_FIELDS + ('status',))
+
+    # The counters are not saved through pipeline.save(), so notify the receivers of the pipeline (runner
+    # notification, release handling) just like a regular save would have done.
+    post_save.send(
+        sender=SCMPipelineRun,
+        instance=pipeline,
+        created=False,
+        update_fields=frozenset(COUNTER_FIELDS),
+        raw=False,
+        using=router.db_for_write(SCMPipelineRun, instance=pipeline),
+    )
+
+
+def reconcile_step_counters(queryset=None, batch_size=500):
+    """
+    Recount 'steps_total' and 'steps_completed' for all pipelines in the queryset in bulk and fix the ones that
+    drifted from the actual number of steps.
+
+    Args:
+        queryset: The pipelines to check, defaults to all pipelines
+        batch_size: The number of pipelines that are updated per query
+
+    Returns:
+        The number of pipelines whose counters were fixed
+    """
+    if queryset is None:
+        queryset = SCMPipelineRun.objects.all()
+
+    drifted = queryset.order_by().annotate(
+        actual_steps_total=Count('scmsteprun'),
+        actual_steps_completed=Count('scmsteprun', filter=Q(scmsteprun__status__in=STEP_FINAL_STATUSES)),
+    ).filter(
+        ~Q(steps_total=F('actual_steps_total')) | ~Q(steps_completed=F('actual_steps_completed'))
+    ).only('pk', 'steps_total', 'steps_completed')
+
+    fixed = []
+    for pipeline in drifted.iterator():
+        log.info(
+            f'Pipeline {pipeline.pk} step counters drifted: '
+            f'{pipeline.steps_completed}/{pipeline.steps_total} instead of '
+            f'{pipeline.actual_steps_completed}/{pipeline.actual_steps_total}'
+        )
+        pipeline.steps_total = pipeline.actual_steps_total
+        pipeline.steps_completed = pipeline.actual_steps_completed
+        fixed.append(pipeline)
+
+    SCMPipelineRun.objects.bulk_update(fixed, ['steps_total', 'steps_completed'], batch_size=batch_size)
+    return len(fixed)
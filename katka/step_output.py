@@ -0,0 +1,95 @@
+import json
+import logging
+from json.decoder import WHITESPACE, scanstring
+
+from django.db.models import Q, Value
+
+from katka.fields import CompressedTextField
+
+log = logging.getLogger('katka')
+
+_decoder = json.JSONDecoder()
+# A key can only be missed by a plain substring search when it is written with unicode escapes
+_UNICODE_ESCAPE = '\\u'
+
+
+def output_may_contain_key(key):
+    """
+    Filter for steps whose output can contain 'key' at all, so outputs that cannot are never loaded.
+
+    This is an over-approximation: find_output_value decides whether the key is really there. Compressed outputs
+    cannot be searched by the database, so they are always included.
+    """
+    return (
+        Q(output__contains=json.dumps(key))
+        | Q(output__contains=_UNICODE_ESCAPE)
+        # a Value is not compressed like a plain string would be, because it is not prepared by the field
+        | Q(output__startswith=Value(CompressedTextField.COMPRESSED_MARKER))
+    )
+
+
+def find_output_value(step_output, key):
+    """
+    Get the value of 'key' from the top level of the JSON object in a step output, without parsing the complete
+    output. This is the value json.loads(step_output)[key] would have, so with duplicate keys the last one wins.
+
+    Outputs that do not mention the key are not parsed at all. Otherwise the top level of the object is walked and
+    only the value of the key is decoded, the other values are skipped one by one and the walk stops at the last
+    occurrence of the key. Because of this, invalid JSON after that occurrence is not noticed.
+
+    Returns:
+        A tuple (found, value)
+    """
+    if not step_output:
+        return False, None
+
+    needle = json.dumps(key)
+    if needle not in step_output and _UNICODE_ESCAPE not in step_output:
+        return False, None
+
+    try:
+        return _scan_object(step_output, key, needle)
+    except (ValueError, IndexError):
+        log.warning("Invalid JSON in step output")
+        return False, None
+
+
+def _scan_object(text, key, needle):
+    index = _skip_whitespace(text, 0)
+    if text[index] != '{':
+        # not an object, so there are no keys (this includes valid JSON like lists and strings)
+        _decoder.raw_decode(text, index)
+        return False, None
+
+    found, value = False, None
+    index = _skip_whitespace(text, index + 1)
+    if text[index] == '}':
+        return found, value
+
+    while True:
+        if text[index] != '"':
+            raise ValueError(f'Expecting property name at {index}')
+        name, index = scanstring(text, index + 1)
+
+        index = _skip_whitespace(text, index)
+        if text[index] != ':':
+            raise ValueError(f'Expecting ":" at {index}')
+        index = _skip_whitespace(text, index + 1)
+
+        # raw_decode skips a value, it only builds the values that are skipped one at a time
+        item, index = _decoder.raw_decode(text, index)
+        if name == key:
+            found, value = True, item
+            if text.find(needle, index) == -1 and text.find(_UNICODE_ESCAPE, index) == -1:
+                return found, value  # no later duplicate of the key is possible
+
+        index = _skip_whitespace(text, index)
+        if text[index] == '}':
+            return found, value
+        if text[index] != ',':
+            raise ValueError(f'Expecting "," at {index}')
+        index = _skip_whitespace(text, index + 1)
+
+
+def _skip_whitespace(text, index):
+    return WHITESPACE.match(text, index).end()
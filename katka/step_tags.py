@@ -0,0 +1,55 @@
+import logging
+
+from katka.models import SCMStepRunTag
+
+log = logging.getLogger('katka')
+
+MAX_TAG_LENGTH = SCMStepRunTag._meta.get_field('name').max_length
+
+
+def parse_tags(tags):
+    """The tags of the space separated SCMStepRun.tags"""
+    names = set()
+    for name in tags.split(" "):
+        if len(name) > MAX_TAG_LENGTH:
+            log.warning(f'Tag "{name[:50]}..." is longer than {MAX_TAG_LENGTH} characters, it cannot be queried')
+        elif name:
+            names.add(name)
+
+    return names
+
+
+def sync_step_tags(steps, created=False):
+    """
+    Update the SCMStepRunTag rows of the steps to match their tags.
+
+    Args:
+        steps: The saved steps
+        created: Whether the steps were just created, so they do not have any tag rows yet
+    """
+    existing = {}
+    if not created:
+        rows = SCMStepRunTag.objects.filter(scm_step_run__in=[step.pk for step in steps]).values_list(
+            'scm_step_run', 'name',
+        )
+        for step_id, name in rows:
+            existing.setdefault(step_id, set()).add(name)
+
+    to_create = []
+    to_delete = {}
+    for step in steps:
+        names = parse_tags(step.tags)
+        current = existing.get(step.pk, set())
+        to_create += [SCMStepRunTag(scm_step_run=step, name=name) for name in sorted(names - current)]
+        if current - names:
+            to_delete[step.pk] = current - names
+
+    if to_create:
+        # the tags of a step that is saved concurrently can be created by the other save first, which are then kept
+        SCMStepRunTag.objects.bulk_create(to_create, ignore_conflicts=True)
+
+    for step_id, names in to_delete.items():
+        SCMStepRunTag.objects.filter(scm_step_run=step_id, name__in=names).delete()
+
+    for step in steps:
+        step.remember_synced_tags()
@@ -2,75 +2,128 @@ import logging
 from datetime import datetime
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.http import parse_etags, quote_etag
 
 import pytz
 from katka.constants import (
     PIPELINE_FINAL_STATUSES, PIPELINE_STATUS_IN_PROGRESS, PIPELINE_STATUS_INITIALIZING, PIPELINE_STATUS_QUEUED,
     STEP_FINAL_STATUSES,
 )
+from katka.fields import username_on_model
 from katka.models import (
-    Application, ApplicationMetadata, Credential, CredentialSecret, Project, SCMPipelineRun, SCMRelease, SCMRepository,
-    SCMService, SCMStepRun, Team,
+    Application, ApplicationMetadata, Credential, CredentialSecret, PipelineDefinition, Project, SCMPipelineRun,
+    SCMRelease, SCMRepository, SCMService, SCMStepRun, Team,
 )
+from katka.output_storage import append_output, get_output_size, read_output
+from katka.pagination import CreatedAtCursorPagination
+from katka.releases import record_steps
+from katka.scopes import filter_by_user_teams, get_team_ids
 from katka.serializers import (
-    ApplicationMetadataSerializer, ApplicationSerializer, CredentialSecretSerializer, CredentialSerializer,
-    ProjectSerializer, SCMPipelineRunSerializer, SCMReleaseSerializer, SCMRepositorySerializer, SCMServiceSerializer,
-    SCMStepRunSerializer, SCMStepRunUpdateSerializer, TeamSerializer,
+    ApplicationMetadataSerializer, ApplicationSerializer, BootstrapSerializer, CredentialSecretSerializer,
+    CredentialSerializer, ProjectSerializer, SCMPipelineRunSerializer, SCMReleaseSerializer, SCMRepositorySerializer,
+    SCMServiceSerializer, SCMStepRunBulkCreateSerializer, SCMStepRunBulkUpdateSerializer, SCMStepRunOutputSerializer,
+    SCMStepRunSerializer, SCMStepRunUpdateSerializer, TeamSerializer, get_sparse_field_names,
 )
+from katka.step_counters import recount_step_counters
+from katka.step_tags import sync_step_tags
 from katka.viewsets import AuditViewSet, FilterViewMixin, ReadOnlyAuditViewMixin, UpdateAuditMixin
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.status import HTTP_201_CREATED, HTTP_304_NOT_MODIFIED
 
 log = logging.getLogger(__name__)
 
 
+class BootstrapViewMixin:
+    """
+    Adds GET <object>/bootstrap/, which returns the application with its repository, SCM service, credential and
+    the decrypted secrets of the credential in one response, so a pipeline runner does not need a request for each
+    of them. Besides resolving the teams of the user, this takes two queries: one for the objects and one for the
+    secrets. Responds with a 404 when the credential is not in scope of the user.
+    """
+    # Lookup from the model to its application, '' for the application itself
+    application_lookup = ''
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'bootstrap':
+            return queryset
+
+        repository = f'{self.application_lookup}scm_repository'
+        return queryset.filter(**{
+            f'{repository}__deleted': False,
+            f'{repository}__scm_service__deleted': False,
+            f'{repository}__credential__deleted': False,
+            f'{repository}__credential__team__in': get_team_ids(self.request),
+        }).select_related(f'{repository}__scm_service', f'{repository}__credential')
+
+    def _get_deferred_fields(self):
+        # the nested serializers of the bootstrap need every column of the related objects, whatever the sparse
+        # fieldset of the view is
+        if self.action == 'bootstrap':
+            return []
+
+        return super()._get_deferred_fields()
+
+    def get_prefetches(self):
+        if self.action != 'bootstrap':
+            return super().get_prefetches()
+
+        secrets = CredentialSecret.active.order_by('key')
+        return [Prefetch(f'{self.application_lookup}scm_repository__credential__credentialsecret_set',
+                         queryset=secrets, to_attr='active_secrets')]
+
+    @action(detail=True, methods=['get'])
+    def bootstrap(self, request, pk=None):
+        instance = self.get_object()
+        application = instance.application if self.application_lookup else instance
+        # without the request, the nested serializers always return all their fields instead of a sparse fieldset
+        context = {**self.get_serializer_context(), 'request': None}
+        return Response(BootstrapSerializer({'application': application}, context=context).data)
+
+
 class TeamViewSet(FilterViewMixin, AuditViewSet):
     model = Team
     serializer_class = TeamSerializer
     lookup_field = 'public_identifier'
     lookup_value_regex = '[0-9a-f-]{36}'
+    # Only show teams that are linked to a group that the user is part of
+    team_lookup = 'public_identifier'
 
     def get_queryset(self):
-        # Only show teams that are linked to a group that the user is part of
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(group__in=user_groups)
+        return super().get_queryset().select_related('group')
 
 
 class ProjectViewSet(FilterViewMixin, AuditViewSet):
     model = Project
     serializer_class = ProjectSerializer
-
-    def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(team__group__in=user_groups)
+    team_lookup = 'team'
 
 
-class ApplicationViewSet(FilterViewMixin, AuditViewSet):
+class ApplicationViewSet(BootstrapViewMixin, FilterViewMixin, AuditViewSet):
     model = Application
     serializer_class = ApplicationSerializer
-
-    def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(project__team__group__in=user_groups)
+    team_lookup = 'project__team'
 
 
 class CredentialViewSet(FilterViewMixin, AuditViewSet):
     model = Credential
     serializer_class = CredentialSerializer
-
-    def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(team__group__in=user_groups)
+    team_lookup = 'team'
 
 
 class CredentialSecretsViewSet(AuditViewSet):
     model = CredentialSecret
     serializer_class = CredentialSecretSerializer
     lookup_field = 'key'
+    team_lookup = 'credential__team'
 
     def get_queryset(self):
-        user_groups = self.request.user.groups.all()
         kwargs = {
-            'credential__team__group__in': user_groups,
             'credential__deleted': False,
             'credential': self.kwargs['credentials_pk'],
         }
@@ -86,21 +139,43 @@ class SCMServiceViewSet(ReadOnlyAuditViewMixin):
 class SCMRepositoryViewSet(FilterViewMixin, AuditViewSet):
     model = SCMRepository
     serializer_class = SCMRepositorySerializer
-
-    def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(credential__team__group__in=user_groups)
+    team_lookup = 'credential__team'
 
 
-class SCMPipelineRunViewSet(FilterViewMixin, AuditViewSet):
+class SCMPipelineRunViewSet(BootstrapViewMixin, FilterViewMixin, AuditViewSet):
     model = SCMPipelineRun
     serializer_class = SCMPipelineRunSerializer
+    team_lookup = 'team'
+    application_lookup = 'application__'
+    pagination_class = CreatedAtCursorPagination
+    reject_full_scans = True
+    exact_filter_fields = ('status',)
+    range_filter_fields = ('created_at',)
+    in_filter_fields = ('status',)
+    ordering_fields = ('created_at',)
 
     parameter_lookup_map = {
         'scmrelease': 'scmrelease',
         'release': 'scmrelease',
+        # the definitions are stored once per content hash, so filter on the (indexed) hash
+        'pipeline_yaml': 'pipeline_definition',
     }
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve') and 'pipeline_yaml' in get_sparse_field_names(
+                self.request, self.serializer_class.Meta.fields):
+            # the yaml is stored in the pipeline definition, read it with the same query
+            queryset = queryset.select_related('pipeline_definition')
+
+        return queryset
+
+    def get_filter_value(self, query_param, value):
+        if query_param == 'pipeline_yaml':
+            return PipelineDefinition.objects.content_hash(value)
+
+        return super().get_filter_value(query_param, value)
+
     def perform_update(self, serializer):
         status = serializer.validated_data.get('status', None)
         if status == PIPELINE_STATUS_IN_PROGRESS:
@@ -128,98 +203,260 @@ class SCMPipelineRunViewSet(FilterViewMixin, AuditViewSet):
         return True
 
     def _run_next_pipeline_if_available(self, application, commit_hash):
-        try:
-            next_pipeline = self.model.objects.get(application=application, first_parent_hash=commit_hash)
-        except self.model.DoesNotExist:
-            return  # does not exist (yet), so nothing to do
-
-        if next_pipeline.status != PIPELINE_STATUS_QUEUED:
-            if next_pipeline.status != PIPELINE_STATUS_INITIALIZING:
-                log.warning(
-                    f'Next pipeline {next_pipeline.pk} is not queued, it has status "{next_pipeline.status}", '
-                    'not updating'
-                )
-            return
-
-        # No need to wrap inside a "with username_on_model():" context manager since at this point we already
-        # are in a context. Worried about infinite recursion because we keep setting statuses for the next
-        # pipelines? Since this method is only called when a pipeline moves from the "in progress" state to
-        # a final state and the next pipeline is set to the "in progress" state, it should not trigger recursion.
-        next_pipeline.status = PIPELINE_STATUS_IN_PROGRESS
-        next_pipeline.save()
+        """
+        Start the pipelines of all children of the commit that just finished. A commit normally has one child, but
+        when branches fork from it, they can all continue. Children are started in the order they were created.
+        """
+        next_pipelines = self.model.objects.filter(
+            application=application, first_parent_hash=commit_hash,
+        ).order_by('created_at', 'pk')
+
+        for next_pipeline in next_pipelines:
+            if next_pipeline.status != PIPELINE_STATUS_QUEUED:
+                if next_pipeline.status != PIPELINE_STATUS_INITIALIZING:
+                    log.warning(
+                        f'Next pipeline {next_pipeline.pk} is not queued, it has status "{next_pipeline.status}", '
+                        'not updating'
+                    )
+                continue
+
+            # No need to wrap inside a "with username_on_model():" context manager since at this point we already
+            # are in a context. Worried about infinite recursion because we keep setting statuses for the next
+            # pipelines? Since this method is only called when a pipeline moves from the "in progress" state to
+            # a final state and the next pipeline is set to the "in progress" state, it should not trigger recursion.
+            next_pipeline.status = PIPELINE_STATUS_IN_PROGRESS
+            next_pipeline.save()
+
+    @action(detail=True, methods=['post'], url_path='steps')
+    def create_steps(self, request, pk=None):
+        """
+        Create all steps of a pipeline with a single request, e.g. while the pipeline is initializing.
+
+        The body is a list of steps, the pipeline is taken from the url. All steps are validated before any of them
+        is stored, they are inserted with one query and the step counters of the pipeline are updated once.
+        """
+        pipeline = self.get_object()
+        context = self.get_serializer_context()
+        serializer = SCMStepRunBulkCreateSerializer(data=request.data, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+
+        steps = [
+            SCMStepRun(scm_pipeline_run=pipeline, team_id=pipeline.team_id, **step_data)
+            for step_data in serializer.validated_data
+        ]
+        with transaction.atomic(), username_on_model(SCMStepRun, request.user.username):
+            SCMStepRun.objects.bulk_create(steps)
+            # bulk_create does not send post_save, so update the tags, the release summaries and the counters of the
+            # pipeline once for all steps
+            sync_step_tags(steps, created=True)
+            record_steps(steps)
+            recount_step_counters(pipeline, request.user.username)
+
+        for step in steps:
+            step.remember_counted_state()
+
+        return Response(SCMStepRunBulkCreateSerializer(steps, many=True, context=context).data,
+                        status=HTTP_201_CREATED)
 
     def _trigger_sync(self):
         """We are missing commits, sync them so we can get the complete string of commits"""
         log.warning("Need to sync commits because at least one is missing, but this is not implemented yet")
 
-    def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(application__project__team__group__in=user_groups)
+    def get_prefetches(self):
+        if self.action == 'bootstrap':
+            return super().get_prefetches()
+
+        return [Prefetch('scmrelease_set', queryset=SCMRelease.active.only('pk'))]
+
+    @action(detail=True, methods=['get'], url_path='pipeline-definition')
+    def pipeline_definition(self, request, pk=None):
+        """
+        The pipeline yaml of a run, with its content hash as ETag. Most runs of an application share their definition,
+        so a client that already has it sends the hash in If-None-Match and gets a 304 response without the yaml.
+        """
+        pipeline = self.get_object()
+        etag = quote_etag(pipeline.pipeline_definition_id)
+        if _etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        definition = PipelineDefinition.objects.get(pk=pipeline.pipeline_definition_id)
+        data = {'content_hash': definition.content_hash, 'pipeline_yaml': definition.pipeline_yaml}
+        return Response(data, headers={'ETag': etag})
+
+
+def _etag_matches(etag, if_none_match):
+    """Weak comparison, as used for If-None-Match"""
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags or f'W/{etag}' in etags
 
 
 def pre_validate_steprun_update(serializer):
     """In case of an update to the status which sets the step to a final status, ensure the 'ended_at'
        field is set.
     """
-    if 'status' in serializer.validated_data and serializer.validated_data['status'] in STEP_FINAL_STATUSES \
-            and 'ended_at' not in serializer.validated_data:
-        serializer.validated_data['ended_at'] = datetime.now(tz=pytz.timezone(settings.TIME_ZONE))
+    _set_ended_at_on_final_status(serializer.validated_data)
+
+
+def _set_ended_at_on_final_status(validated_data):
+    if 'status' in validated_data and validated_data['status'] in STEP_FINAL_STATUSES \
+            and 'ended_at' not in validated_data:
+        validated_data['ended_at'] = datetime.now(tz=pytz.timezone(settings.TIME_ZONE))
 
 
 class SCMStepRunViewSet(FilterViewMixin, AuditViewSet):
     model = SCMStepRun
     serializer_class = SCMStepRunSerializer
+    team_lookup = 'team'
+    pagination_class = CreatedAtCursorPagination
+    reject_full_scans = True
+    exact_filter_fields = ('status', 'slug', 'name', 'stage')
+    range_filter_fields = ('created_at', 'started_at', 'ended_at')
+    in_filter_fields = ('status',)
+    ordering_fields = ('created_at',)
+
+    parameter_lookup_map = {
+        'tag': 'tag_set__name',
+    }
+
+    # The default and maximum number of characters returned by a single read of the appended output
+    output_page_size = 64 * 1024
+    max_output_page_size = 1024 * 1024
 
     def perform_update(self, serializer):
         pre_validate_steprun_update(serializer)
         serializer.save()
 
-    def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(scm_pipeline_run__application__project__team__group__in=user_groups)
+    @action(detail=True, methods=['get', 'post'], url_path='output')
+    def output_log(self, request, pk=None):
+        """
+        Append-only output of a step, e.g. the log of a long running step. POST {"output": "<chunk>"} appends a chunk,
+        GET ?offset=&limit= reads a range. Clients tailing the output continue reading at 'next_offset'.
+
+        This output is stored apart from the 'output' field of the step, see katka.output_storage.
+        """
+        step = self.get_object()
+        if request.method == 'POST':
+            serializer = SCMStepRunOutputSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            text = serializer.validated_data['output']
+            offset = append_output(step, text)
+            return Response({'offset': offset, 'next_offset': offset + len(text)}, status=HTTP_201_CREATED)
+
+        offset = self._get_non_negative_int('offset', 0)
+        limit = min(self._get_non_negative_int('limit', self.output_page_size), self.max_output_page_size)
+        output = read_output(step, offset, limit)
+        return Response({
+            'offset': offset,
+            'next_offset': offset + len(output),
+            'size': get_output_size(step),
+            'output': output,
+        })
+
+    def _get_non_negative_int(self, query_param, default):
+        value = self.request.query_params.get(query_param, None)
+        if value is None:
+            return default
+
+        if not value.isdigit():
+            raise ValidationError({query_param: ['A non-negative integer is required.']})
+
+        return int(value)
 
 
 class SCMStepRunUpdateStatusView(UpdateAuditMixin):
     model = SCMStepRun
     serializer_class = SCMStepRunUpdateSerializer
+    team_lookup = 'team'
 
     def perform_update(self, serializer):
         pre_validate_steprun_update(serializer)
         serializer.save()
 
     def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return self.model.objects.exclude(deleted=True).filter(
-            scm_pipeline_run__application__project__team__group__in=user_groups
-        )
+        return filter_by_user_teams(self.model.active.all(), self.team_lookup, self.request)
+
+    @action(detail=False, methods=['put'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Update the status of several steps at once, e.g. when parallel steps finish at the same time.
+
+        The body is a list of {public_identifier, status, ended_at} entries. When any entry is invalid or refers to
+        a step that does not exist, nothing is updated. The steps are updated with one query and the counters of
+        each affected pipeline are updated once, which also closes the release of a finished pipeline once.
+        """
+        serializer = SCMStepRunBulkUpdateSerializer(data=request.data, many=True,
+                                                    context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+
+        updates = {}
+        for step_data in serializer.validated_data:
+            public_identifier = step_data.pop('public_identifier')
+            if public_identifier in updates:
+                raise ValidationError({'public_identifier': [f'Step {public_identifier} is updated more than once']})
+            _set_ended_at_on_final_status(step_data)
+            updates[public_identifier] = step_data
+
+        steps = self.get_queryset().select_related('scm_pipeline_run').in_bulk(list(updates))
+        missing = [str(public_identifier) for public_identifier in updates if public_identifier not in steps]
+        if missing:
+            raise NotFound(f'Step(s) not found: {", ".join(missing)}')
+
+        update_fields = {'modified_at', 'modified_username'}
+        with transaction.atomic(), username_on_model(self.model, request.user.username):
+            for public_identifier, step_data in updates.items():
+                step = steps[public_identifier]
+                for field_name, value in step_data.items():
+                    setattr(step, field_name, value)
+                    update_fields.add(field_name)
+                # bulk_update does not call pre_save, so set the audit fields the way a regular save would
+                for field_name in ('modified_at', 'modified_username'):
+                    self.model._meta.get_field(field_name).pre_save(step, add=False)
+
+            self.model.objects.bulk_update(steps.values(), sorted(update_fields))
+
+            # bulk_update does not send post_save, so update the release summaries and the counters once per pipeline
+            # instead of once per step
+            record_steps(steps.values())
+            pipelines = {step.scm_pipeline_run_id: step.scm_pipeline_run for step in steps.values()}
+            for pipeline in pipelines.values():
+                recount_step_counters(pipeline, request.user.username)
+
+        for step in steps.values():
+            step.remember_counted_state()
+
+        updated = [steps[public_identifier] for public_identifier in updates]
+        return Response(SCMStepRunBulkUpdateSerializer(updated, many=True, context=self.get_serializer_context()).data)
 
 
 class SCMReleaseViewSet(FilterViewMixin, ReadOnlyAuditViewMixin):
     model = SCMRelease
     serializer_class = SCMReleaseSerializer
+    team_lookup = 'scm_pipeline_runs__team'
+    pagination_class = CreatedAtCursorPagination
+    range_filter_fields = ('created_at', 'started_at', 'ended_at')
+    in_filter_fields = ('status',)
+    ordering_fields = ('created_at',)
 
     parameter_lookup_map = {
         'application': 'scm_pipeline_runs__application'
     }
 
-    def get_queryset(self):
-        user_groups = self.request.user.groups.all()
-        return super().get_queryset().filter(
-            scm_pipeline_runs__application__project__team__group__in=user_groups
+    def get_prefetches(self):
+        pipeline_runs = filter_by_user_teams(
+            SCMPipelineRun.active.all(), SCMPipelineRunViewSet.team_lookup, self.request
         )
+        return [Prefetch('scm_pipeline_runs', queryset=pipeline_runs.only('pk'))]
 
 
 class ApplicationMetadataViewSet(AuditViewSet):
     model = ApplicationMetadata
     serializer_class = ApplicationMetadataSerializer
     lookup_field = 'key'
+    team_lookup = 'application__project__team'
 
     def get_queryset(self):
-        user_groups = self.request.user.groups.all()
         kwargs = {
-            'application__project__team__group__in': user_groups,
             'application__deleted': False,
             'application': self.kwargs['applications_pk'],
-            'deleted': False,
         }
         return super().get_queryset().filter(**kwargs)
@@ -1,5 +1,16 @@
+from datetime import datetime, time
+
+from django.contrib.admin.utils import lookup_needs_distinct
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError as DjangoValidationError
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
 from katka.fields import username_on_model
+from katka.scopes import filter_by_user_teams
+from katka.serializers import get_sparse_field_names
 from rest_framework import mixins, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
@@ -8,9 +19,26 @@ class ReadOnlyAuditViewMixin(mixins.RetrieveModelMixin,
                              mixins.ListModelMixin,
                              GenericViewSet):
     model = None
+    # Lookup from the model to its team, to only show objects of teams linked to a group the user is a member of
+    team_lookup = None
 
     def get_queryset(self):
-        return self.model.objects.exclude(deleted=True)
+        return filter_by_user_teams(self.model.active.all(), self.team_lookup, self.request)
+
+    def get_prefetches(self):
+        """
+        The relations the serializer reads, as arguments for prefetch_related (e.g. Prefetch objects), so they are
+        fetched with one query per relation instead of one query per object
+        """
+        return []
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        prefetches = self.get_prefetches()
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+
+        return queryset
 
 
 class UpdateAuditMixin(mixins.UpdateModelMixin, GenericViewSet):
@@ -39,8 +67,50 @@ class AuditViewSet(mixins.CreateModelMixin,
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def is_indexed(model, field_name):
+    """Whether the field is the first column of an index of the model, so lookups on it do not scan the table"""
+    field = model._meta.get_field(field_name)
+    if field.primary_key or field.unique or field.db_index or field.many_to_many or field.one_to_many:
+        return True  # many-to-many and reverse relations are looked up on the foreign key index of the other table
+
+    first_fields = [index.fields[0] for index in model._meta.indexes]
+    first_fields += [fields[0] for fields in model._meta.unique_together]
+    first_fields += [constraint.fields[0] for constraint in model._meta.constraints if hasattr(constraint, 'fields')]
+    return any(first_field.lstrip('-') == field_name for first_field in first_fields)
+
+
 class FilterViewMixin:
     parameter_lookup_map = None
+    # Whether a request that only filters on fields without an index is rejected, to prevent full scans of a large
+    # table. A filter on an indexed field, a range filter or a filter of parameter_lookup_map narrows the scan, so the
+    # other filters of the request are then allowed as well.
+    reject_full_scans = False
+    # Fields without an index that can still be filtered on with ?<field>=<value> or ?<field>__in=<values> when
+    # reject_full_scans is set, because clients rely on them
+    exact_filter_fields = ()
+    # Fields that can be filtered on a range with the __gt, __gte, __lt and __lte suffixes, e.g.
+    # ?created_at__gte=2019-11-01T00:00:00Z. These need to be indexed, to prevent full table scans.
+    range_filter_fields = ()
+    # Fields that can be filtered on a comma separated list of values with the __in suffix, e.g. ?status__in=a,b
+    in_filter_fields = ()
+    # Fields the list can be ordered on with ?ordering=<field> or ?ordering=-<field>. These need to be indexed and
+    # not nullable, so the ordering can also be used for cursor pagination.
+    ordering_fields = ()
+    ordering_query_param = 'ordering'
+
+    range_lookups = ('gt', 'gte', 'lt', 'lte')
+
+    def __init_subclass__(cls, **kwargs):
+        """Check the declared range and ordering fields once, a mistake is a bug in the view and not in the request"""
+        super().__init_subclass__(**kwargs)
+        model = getattr(cls, 'model', None)
+        if model is None:
+            return
+
+        for field_name in cls.range_filter_fields:
+            cls._check_indexed(model, field_name)
+        for field_name in cls.ordering_fields:
+            cls._check_indexed(model, field_name, allow_null=False)
 
     """
     Uses the Serializer fields to construct GET Parameter filtering
@@ -48,9 +118,6 @@ class FilterViewMixin:
     def get_queryset(self):
         queryset = super().get_queryset()
 
-        # Fetch distinct for all model fields, to prevent duplications due to SQL Joins
-        queryset = queryset.distinct()
-
         # Allow filtering on any field in serializer
         all_fields = self.serializer_class.Meta.fields
         filter_fields_lookup = {field: field for field in all_fields}
@@ -67,9 +134,132 @@ class FilterViewMixin:
             django_lookup_field = filter_fields_lookup[query_param]
             value = self.request.query_params.get(query_param, None)
             if value is not None:
-                filters[django_lookup_field] = value
+                filters[django_lookup_field] = self.get_filter_value(query_param, value)
+
+        filters.update(self._get_typed_filters(filter_fields_lookup))
+        if self.reject_full_scans:
+            self._check_full_scan(filters)
 
         if filters:
             queryset = queryset.filter(**filters)
 
+        if any(lookup_needs_distinct(self.model._meta, lookup) for lookup in [self.team_lookup or '', *filters]):
+            queryset = self._deduplicate(queryset)
+
+        ordering = self.get_ordering()
+        if ordering:
+            queryset = queryset.order_by(ordering)
+
+        deferred = self._get_deferred_fields()
+        if deferred:
+            queryset = queryset.defer(*deferred)
+
         return queryset
+
+    def _get_deferred_fields(self):
+        """Do not read the columns of the fields that are left out with a sparse fieldset from the database"""
+        all_fields = self.serializer_class.Meta.fields
+        requested = get_sparse_field_names(self.request, all_fields)
+        concrete = {field.name for field in self.model._meta.concrete_fields if not field.primary_key}
+        return [name for name in all_fields if name not in requested and name in concrete]
+
+    def get_ordering(self):
+        """Return the ordering requested with the ordering query parameter, or None"""
+        ordering = self.request.query_params.get(self.ordering_query_param, None)
+        if ordering is None:
+            return None
+
+        if ordering.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({self.ordering_query_param: [f'Ordering on "{ordering}" is not supported']})
+
+        return ordering
+
+    def get_filter_value(self, query_param, value):
+        """The value to filter on for the value of a ?<query_param>=<value> filter"""
+        return value
+
+    def _check_full_scan(self, filters):
+        mapped = set((self.parameter_lookup_map or {}).values())
+        unindexed = []
+        for lookup in filters:
+            field_name, _, suffix = lookup.partition('__')
+            if lookup in mapped or suffix in self.range_lookups or self._is_indexed(field_name):
+                return  # the scan is narrowed by an index
+            if field_name not in self.exact_filter_fields:
+                unindexed.append(lookup)
+
+        if unindexed:
+            raise ValidationError({unindexed[0]: [f'Filtering on "{unindexed[0]}" alone is not supported, it needs a '
+                                                  'filter on an indexed field as well']})
+
+    def _is_indexed(self, field_name):
+        try:
+            return is_indexed(self.model, field_name)
+        except FieldDoesNotExist:
+            return False
+
+    def _get_typed_filters(self, filter_fields_lookup):
+        filters = {}
+        for query_param, value in self.request.query_params.items():
+            field_name, _, lookup = query_param.partition('__')
+            if not lookup or query_param in filter_fields_lookup:
+                continue
+
+            if lookup in self.range_lookups and field_name in self.range_filter_fields:
+                filters[query_param] = self._parse_value(query_param, field_name, value)
+            elif lookup == 'in' and field_name in self.in_filter_fields:
+                filters[query_param] = [self._parse_value(query_param, field_name, v) for v in value.split(',')]
+            else:
+                # anything else is not backed by an index or not supported, do not silently ignore it
+                raise ValidationError({query_param: [f'Filtering on "{query_param}" is not supported']})
+
+        return filters
+
+    def _parse_value(self, query_param, field_name, value):
+        field = self.model._meta.get_field(field_name)
+        try:
+            if isinstance(field, models.DateTimeField):
+                return self._parse_datetime(value)
+
+            value = field.to_python(value)
+            field.validate(value, None)
+        except DjangoValidationError as e:
+            raise ValidationError({query_param: e.messages})
+        except ValueError:
+            # well formed, but not an existing date or time, e.g. 2019-13-45
+            raise ValidationError({query_param: ['Enter a valid date/time.']})
+
+        return value
+
+    @staticmethod
+    def _parse_datetime(value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is None:
+                raise DjangoValidationError('Enter a valid date/time.')
+            parsed = datetime.combine(date, time())
+
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+
+        return parsed
+
+    @classmethod
+    def _check_indexed(cls, model, field_name, allow_null=True):
+        if not is_indexed(model, field_name) or (model._meta.get_field(field_name).null and not allow_null):
+            raise ImproperlyConfigured(
+                f'{cls.__name__} declares "{field_name}" as a range or ordering field, but it is not indexed or it '
+                'is nullable'
+            )
+
+    def _deduplicate(self, queryset):
+        """
+        Joins over a multi-valued relation (reverse foreign key or many-to-many) can return an object multiple times.
+        Deduplicate on the primary key with a subquery instead of a DISTINCT over all (potentially large) columns.
+        """
+        deduplicated = self.model.objects.filter(pk__in=queryset.order_by().values('pk'))
+        if queryset.query.order_by:
+            deduplicated = deduplicated.order_by(*queryset.query.order_by)
+
+        return deduplicated
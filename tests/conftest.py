@@ -416,6 +416,16 @@ def deactivated_scm_step_run(scm_step_run):
     return scm_step_run
 
 
+@pytest.fixture
+def create_scm_step_run():
+    def create(scm_pipeline_run, slug, **fields):
+        fields = {'name': slug, 'stage': 'deploy', **fields}
+        with username_on_model(models.SCMStepRun, 'initial'):
+            return models.SCMStepRun.objects.create(slug=slug, scm_pipeline_run=scm_pipeline_run, **fields)
+
+    return create
+
+
 @pytest.fixture
 def scm_release(scm_pipeline_run):
     scm_release = models.SCMRelease.objects.filter(scm_pipeline_runs__pk__exact=scm_pipeline_run.pk).first()
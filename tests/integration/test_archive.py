@@ -0,0 +1,134 @@
+import json
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+import pytest
+from katka.archive import archive_deleted_rows
+from katka.fields import username_on_model
+from katka.models import (
+    ArchivedRow, CredentialSecret, SCMPipelineRun, SCMRelease, SCMStepRun, SCMStepRunOutputChunk, SCMStepRunTag,
+)
+from katka.output_storage import append_output
+
+
+def _delete(instance, days_ago=100):
+    instance.__class__.objects.filter(pk=instance.pk).update(
+        deleted=True, modified_at=timezone.now() - timedelta(days=days_ago),
+    )
+
+
+def _archived():
+    return {(row.model, row.object_pk) for row in ArchivedRow.objects.all()}
+
+
+@pytest.fixture
+def tagged_step(scm_step_run):
+    scm_step_run.tags = 'release'
+    with username_on_model(SCMStepRun, 'initial'):
+        scm_step_run.save()
+    append_output(scm_step_run, 'log')
+
+    return scm_step_run
+
+
+@pytest.mark.django_db
+class TestActiveManager:
+    def test_excludes_deleted_rows(self, scm_pipeline_run, another_scm_pipeline_run):
+        _delete(another_scm_pipeline_run)
+
+        assert list(SCMPipelineRun.active.all()) == [scm_pipeline_run]
+        assert SCMPipelineRun.objects.count() == 2
+
+    def test_uses_partial_index(self, scm_step_run):
+        assert 'active_step_runs_team_idx' in SCMStepRun.active.filter(team=scm_step_run.team_id).explain()
+
+
+@pytest.mark.django_db
+class TestArchiveDeletedRows:
+    def test_step_with_its_tags_and_output(self, scm_pipeline_run, tagged_step):
+        _delete(scm_pipeline_run)
+        _delete(tagged_step)
+
+        archived = archive_deleted_rows()
+
+        assert archived[SCMStepRun] == 1
+        # the release of the pipeline is not deleted, so the pipeline is kept
+        assert archived[SCMPipelineRun] == 0
+        assert SCMPipelineRun.objects.filter(pk=scm_pipeline_run.pk).exists()
+        assert not SCMStepRun.objects.exists()
+        assert not SCMStepRunTag.objects.exists()
+        assert not SCMStepRunOutputChunk.objects.exists()
+        assert {model for model, _ in _archived()} == {
+            'katka.SCMStepRun', 'katka.SCMStepRunTag', 'katka.SCMStepRunOutputChunk',
+        }
+
+        data = json.loads(ArchivedRow.objects.get(model='katka.SCMStepRun').data)
+        assert data['public_identifier'] == str(tagged_step.pk)
+        assert data['scm_pipeline_run_id'] == str(scm_pipeline_run.pk)
+        assert data['tags'] == 'release'
+
+    def test_pipeline_with_its_release(self, scm_pipeline_run, scm_release, scm_step_run):
+        scm_step_run.status = 'success'
+        with username_on_model(SCMStepRun, 'finished'):
+            scm_step_run.save()
+        for instance in (scm_pipeline_run, scm_release, scm_step_run):
+            _delete(instance)
+
+        archived = archive_deleted_rows()
+
+        assert (archived[SCMStepRun], archived[SCMRelease], archived[SCMPipelineRun]) == (1, 1, 1)
+        assert ('katka.SCMRelease', str(scm_release.pk)) in _archived()
+        assert ('katka.SCMPipelineRun', str(scm_pipeline_run.pk)) in _archived()
+        assert ('katka.SCMStepRunReleaseSummary', str(scm_step_run.pk)) in _archived()
+        assert 'katka.SCMRelease_scm_pipeline_runs' in {model for model, _ in _archived()}
+
+    def test_recently_deleted_rows_are_kept(self, scm_pipeline_run, scm_step_run):
+        _delete(scm_pipeline_run, days_ago=10)
+        _delete(scm_step_run, days_ago=10)
+
+        assert archive_deleted_rows()[SCMStepRun] == 0
+        assert archive_deleted_rows(days=5)[SCMStepRun] == 1
+
+    def test_deleted_steps_of_active_pipelines_are_kept(self, scm_step_run):
+        _delete(scm_step_run)
+
+        assert archive_deleted_rows()[SCMStepRun] == 0
+        assert SCMStepRun.objects.filter(pk=scm_step_run.pk).exists()
+
+    def test_referenced_rows_are_kept(self, scm_pipeline_run, scm_step_run):
+        _delete(scm_pipeline_run)
+
+        assert archive_deleted_rows()[SCMPipelineRun] == 0
+        assert not ArchivedRow.objects.exists()
+
+    def test_secrets_stay_encrypted(self, my_secret):
+        _delete(my_secret)
+        token = CredentialSecret.objects.annotate(token=Cast('value', TextField())).values_list('token').get()[0]
+
+        assert archive_deleted_rows()[CredentialSecret] == 1
+
+        row = ArchivedRow.objects.get(model='katka.CredentialSecret')
+        assert json.loads(row.data)['value'] == token
+        assert 'full_access_value' not in row.data
+
+    def test_batches(self, scm_pipeline_run, scm_step_run, another_scm_step_run):
+        _delete(scm_pipeline_run)
+        for step in (scm_step_run, another_scm_step_run):
+            SCMStepRun.objects.filter(pk=step.pk).update(scm_pipeline_run=scm_pipeline_run)
+            _delete(step)
+
+        assert archive_deleted_rows(batch_size=1)[SCMStepRun] == 2
+
+    def test_command(self, scm_pipeline_run, scm_step_run, capsys):
+        _delete(scm_pipeline_run)
+        _delete(scm_step_run)
+
+        call_command('archive_deleted_rows', '--days', '30', '--batch-size', '10')
+
+        output = capsys.readouterr().out
+        assert 'Archived 1 SCM step row(s)' in output
+        assert 'Archived 0 SCM pipeline row(s)' in output
@@ -0,0 +1,114 @@
+from django.apps import apps
+
+import pytest
+from katka.batched_migrations import migrate_in_batches
+from katka.fields import username_on_model
+from katka.models import BatchedMigrationProgress, SCMStepRun
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def steps(scm_pipeline_run):
+    with username_on_model(SCMStepRun, 'initial'):
+        return sorted(
+            (SCMStepRun.objects.create(slug=f'step{number}', name=f'step{number}', stage='deploy',
+                                       scm_pipeline_run=scm_pipeline_run) for number in range(10)),
+            key=lambda step: step.pk,
+        )
+
+
+def _rename(batch):
+    SCMStepRun.objects.filter(pk__in=[step.pk for step in batch]).update(name='migrated')
+
+
+@pytest.mark.django_db
+class TestMigrateInBatches:
+    def test_all_rows(self, steps):
+        batches = []
+
+        def process_batch(batch):
+            batches.append([step.pk for step in batch])
+            _rename(batch)
+
+        assert migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), process_batch, batch_size=4) == 10
+
+        assert batches == [[step.pk for step in steps[i:i + 4]] for i in (0, 4, 8)]
+        assert set(SCMStepRun.objects.values_list('name', flat=True)) == {'migrated'}
+        progress = BatchedMigrationProgress.objects.get(name='test')
+        assert progress.rows_done == 10
+        assert progress.last_pk == str(steps[-1].pk)
+        assert progress.completed_at is not None
+
+    def test_resume_after_interruption(self, steps):
+        calls = []
+
+        def interrupted_on_third_batch(batch):
+            calls.append(batch)
+            if len(calls) == 3:
+                _rename(batch)  # rolled back with the batch
+                raise Interrupted()
+            _rename(batch)
+
+        with pytest.raises(Interrupted):
+            migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), interrupted_on_third_batch, batch_size=3)
+
+        # the first two batches are committed, the third is rolled back
+        progress = BatchedMigrationProgress.objects.get(name='test')
+        assert progress.rows_done == 6
+        assert progress.last_pk == str(steps[5].pk)
+        assert progress.completed_at is None
+        assert SCMStepRun.objects.filter(name='migrated').count() == 6
+
+        resumed = []
+
+        def process_batch(batch):
+            resumed.extend(step.pk for step in batch)
+            _rename(batch)
+
+        assert migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), process_batch, batch_size=3) == 4
+
+        assert resumed == [step.pk for step in steps[6:]]
+        assert SCMStepRun.objects.filter(name='migrated').count() == 10
+        assert BatchedMigrationProgress.objects.get(name='test').rows_done == 10
+
+    def test_completed_does_nothing(self, steps):
+        migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), _rename)
+
+        def process_batch(batch):
+            raise AssertionError('should not be called')
+
+        assert migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), process_batch) == 0
+
+    def test_names_are_independent(self, steps):
+        migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), _rename)
+
+        assert migrate_in_batches(apps, 'other', SCMStepRun.objects.all(), _rename) == 10
+
+    def test_throttle(self, steps):
+        pauses = []
+
+        migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), _rename, batch_size=5, rows_per_second=10,
+                           sleep=pauses.append)
+
+        # two batches of 5 rows at 10 rows per second, each batch takes about half a second
+        assert len(pauses) == 2
+        assert all(0.4 < pause <= 0.5 for pause in pauses)
+
+    def test_throttle_setting(self, settings, steps):
+        settings.KATKA_MIGRATION_ROWS_PER_SECOND = 1
+        pauses = []
+
+        migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), _rename, batch_size=10, sleep=pauses.append)
+
+        assert len(pauses) == 1
+        assert 9 < pauses[0] <= 10
+
+    def test_no_throttle(self, steps):
+        pauses = []
+
+        migrate_in_batches(apps, 'test', SCMStepRun.objects.all(), _rename, batch_size=5, sleep=pauses.append)
+
+        assert pauses == []
@@ -0,0 +1,93 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from katka.fields import username_on_model
+from katka.models import Credential, SCMRepository, SCMService
+
+
+@pytest.fixture
+def bootstrap(application, scm_repository, scm_service, credential):
+    return {
+        'application': {
+            'public_identifier': str(application.pk), 'slug': application.slug, 'name': application.name,
+            'project': str(application.project_id), 'scm_repository': str(scm_repository.pk),
+        },
+        'scm_repository': {
+            'public_identifier': str(scm_repository.pk), 'organisation': 'acme', 'repository_name': 'sample',
+            'credential': str(credential.pk), 'scm_service': str(scm_service.pk),
+        },
+        'scm_service': {
+            'public_identifier': str(scm_service.pk), 'scm_service_type': 'bitbucket', 'server_url': 'www.example.com',
+        },
+        'credential': {
+            'public_identifier': str(credential.pk), 'name': credential.name, 'team': str(credential.team_id),
+        },
+        # the secret of the credential that is deleted is left out
+        'secrets': [{'key': 'access_token', 'value': 'full_access_value', 'credential': str(credential.pk)}],
+    }
+
+
+def _katka_queries(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    return response, [query['sql'] for query in queries.captured_queries if '"katka_' in query['sql']]
+
+
+@pytest.mark.django_db
+class TestBootstrap:
+    def test_application(self, client, logged_in_user, application, secret, bootstrap):
+        response, queries = _katka_queries(client, f'/applications/{application.pk}/bootstrap/')
+
+        assert response.status_code == 200
+        assert response.json() == bootstrap
+        # the teams of the user, the objects and the secrets
+        assert len(queries) == 3
+
+    def test_pipeline_run(self, client, logged_in_user, scm_pipeline_run, secret, bootstrap):
+        response, queries = _katka_queries(client, f'/scm-pipeline-runs/{scm_pipeline_run.pk}/bootstrap/')
+
+        assert response.status_code == 200
+        assert response.json() == bootstrap
+        assert len(queries) == 3
+
+    def test_without_secrets(self, client, logged_in_user, application, bootstrap):
+        response = client.get(f'/applications/{application.pk}/bootstrap/')
+
+        assert response.json() == {**bootstrap, 'secrets': []}
+
+    def test_not_logged_in(self, client, application, scm_pipeline_run):
+        assert client.get(f'/applications/{application.pk}/bootstrap/').status_code == 404
+        assert client.get(f'/scm-pipeline-runs/{scm_pipeline_run.pk}/bootstrap/').status_code == 404
+
+    def test_credential_not_in_scope(self, client, logged_in_user, application, scm_repository, not_my_credential):
+        scm_repository.credential = not_my_credential
+        with username_on_model(SCMRepository, 'initial'):
+            scm_repository.save()
+
+        assert client.get(f'/applications/{application.pk}/bootstrap/').status_code == 404
+
+    def test_deleted_credential(self, client, logged_in_user, application, credential):
+        credential.deleted = True
+        with username_on_model(Credential, 'initial'):
+            credential.save()
+
+        assert client.get(f'/applications/{application.pk}/bootstrap/').status_code == 404
+
+    def test_deleted_scm_service(self, client, logged_in_user, application, scm_service):
+        scm_service.deleted = True
+        with username_on_model(SCMService, 'initial'):
+            scm_service.save()
+
+        assert client.get(f'/applications/{application.pk}/bootstrap/').status_code == 404
+
+    @pytest.mark.parametrize('query', ['fields=name', 'omit=application', 'fields=public_identifier&omit=name'])
+    def test_sparse_fieldsets_are_ignored(self, client, logged_in_user, application, scm_pipeline_run, secret,
+                                          bootstrap, query):
+        for url in (f'/applications/{application.pk}/bootstrap/',
+                    f'/scm-pipeline-runs/{scm_pipeline_run.pk}/bootstrap/'):
+            response = client.get(f'{url}?{query}')
+
+            assert response.status_code == 200
+            assert response.json() == bootstrap
@@ -0,0 +1,81 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from katka import models
+from katka.fields import username_on_model
+
+
+def _steps(number, **kwargs):
+    return [{'slug': f'step-{i}', 'name': f'Step {i}', 'stage': 'deploy', **kwargs} for i in range(number)]
+
+
+def _post(client, pipeline, data):
+    url = f'/scm-pipeline-runs/{pipeline.public_identifier}/steps/'
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url, data, content_type='application/json')
+
+    return response, len(queries.captured_queries)
+
+
+@pytest.mark.django_db
+class TestBulkStepCreation:
+    def test_create(self, client, logged_in_user, scm_pipeline_run):
+        data = _steps(2) + _steps(1, status='success')
+        data[2]['slug'] = 'step-done'
+        response, _ = _post(client, scm_pipeline_run, data)
+
+        assert response.status_code == 201
+        parsed = response.json()
+        assert [step['slug'] for step in parsed] == ['step-0', 'step-1', 'step-done']
+        assert {step['scm_pipeline_run'] for step in parsed} == {str(scm_pipeline_run.pk)}
+
+        steps = models.SCMStepRun.objects.filter(scm_pipeline_run=scm_pipeline_run)
+        assert steps.count() == 3
+        assert {step.created_username for step in steps} == {'test_user'}
+
+        pipeline = models.SCMPipelineRun.objects.get(pk=scm_pipeline_run.pk)
+        assert pipeline.steps_total == 3
+        assert pipeline.steps_completed == 1
+
+    def test_constant_number_of_queries(self, client, logged_in_user, scm_pipeline_run, next_scm_pipeline_run):
+        response, few_queries = _post(client, scm_pipeline_run, _steps(2))
+        assert response.status_code == 201
+
+        # enough steps to show the difference, while still fitting in a single INSERT on SQLite
+        response, many_queries = _post(client, next_scm_pipeline_run, _steps(40))
+        assert response.status_code == 201
+        assert models.SCMPipelineRun.objects.get(pk=next_scm_pipeline_run.pk).steps_total == 40
+
+        assert many_queries == few_queries
+
+    def test_pipeline_in_body_is_ignored(self, client, logged_in_user, scm_pipeline_run, another_scm_pipeline_run):
+        response, _ = _post(client, scm_pipeline_run, _steps(1, scm_pipeline_run=str(another_scm_pipeline_run.pk)))
+
+        assert response.status_code == 201
+        assert response.json()[0]['scm_pipeline_run'] == str(scm_pipeline_run.pk)
+        assert models.SCMStepRun.objects.filter(scm_pipeline_run=another_scm_pipeline_run).count() == 0
+
+    def test_invalid_step_creates_nothing(self, client, logged_in_user, scm_pipeline_run):
+        data = _steps(2)
+        data[1]['status'] = 'bla'
+        response, _ = _post(client, scm_pipeline_run, data)
+
+        assert response.status_code == 400
+        assert response.json() == [{}, {'status': ['"bla" is not a valid choice.']}]
+        assert models.SCMStepRun.objects.filter(scm_pipeline_run=scm_pipeline_run).count() == 0
+
+    def test_not_a_list(self, client, logged_in_user, scm_pipeline_run):
+        response, _ = _post(client, scm_pipeline_run, _steps(1)[0])
+
+        assert response.status_code == 400
+
+    def test_not_my_pipeline(self, client, logged_in_user, not_my_application):
+        with username_on_model(models.SCMPipelineRun, 'initial'):
+            not_my_pipeline_run = models.SCMPipelineRun.objects.create(application=not_my_application,
+                                                                       commit_hash='1234')
+
+        response, _ = _post(client, not_my_pipeline_run, _steps(1))
+
+        assert response.status_code == 404
+        assert models.SCMStepRun.objects.filter(scm_pipeline_run=not_my_pipeline_run).count() == 0
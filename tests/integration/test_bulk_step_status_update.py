@@ -0,0 +1,132 @@
+import uuid
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import mock
+import pytest
+from freezegun import freeze_time
+from katka import models
+from katka.fields import username_on_model
+
+
+@pytest.fixture
+def create_steps(create_scm_step_run):
+    def create(pipeline, number):
+        return [create_scm_step_run(pipeline, f'step-{i}', sequence_id=f'1.{i}') for i in range(number)]
+
+    return create
+
+
+def _put(client, data):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.put('/update-scm-step-run/bulk/', data, content_type='application/json')
+
+    return response, len(queries.captured_queries)
+
+
+@pytest.mark.django_db
+class TestBulkStepStatusUpdate:
+    def test_update(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        steps = create_steps(scm_pipeline_run, 3)
+        data = [
+            {'public_identifier': str(steps[0].pk), 'status': 'success'},
+            {'public_identifier': str(steps[1].pk), 'status': 'failed', 'ended_at': '2019-05-04T11:13:14Z'},
+            {'public_identifier': str(steps[2].pk), 'status': 'in progress'},
+        ]
+
+        with freeze_time('2019-05-04 12:00:00'):
+            response, _ = _put(client, data)
+
+        assert response.status_code == 200
+        assert [step['status'] for step in response.json()] == ['success', 'failed', 'in progress']
+
+        updated = models.SCMStepRun.objects.in_bulk([step.pk for step in steps])
+        assert updated[steps[0].pk].status == 'success'
+        assert updated[steps[0].pk].ended_at.isoformat() == '2019-05-04T12:00:00+00:00'
+        assert updated[steps[1].pk].status == 'failed'
+        assert updated[steps[1].pk].ended_at.isoformat() == '2019-05-04T11:13:14+00:00'
+        assert updated[steps[2].pk].status == 'in progress'
+        assert updated[steps[2].pk].ended_at is None
+        assert {step.modified_username for step in updated.values()} == {'test_user'}
+        assert updated[steps[0].pk].modified_at.isoformat() == '2019-05-04T12:00:00+00:00'
+
+        pipeline = models.SCMPipelineRun.objects.get(pk=scm_pipeline_run.pk)
+        assert pipeline.steps_total == 3
+        assert pipeline.steps_completed == 2
+
+    def test_parallel_steps_finishing(self, client, logged_in_user, scm_pipeline_run, next_scm_pipeline_run,
+                                      create_steps):
+        few_steps = create_steps(scm_pipeline_run, 2)
+        many_steps = create_steps(next_scm_pipeline_run, 50)
+
+        response, few_queries = _put(client, [{'public_identifier': str(step.pk), 'status': 'success'}
+                                              for step in few_steps])
+        assert response.status_code == 200
+
+        response, many_queries = _put(client, [{'public_identifier': str(step.pk), 'status': 'success'}
+                                               for step in many_steps])
+        assert response.status_code == 200
+
+        assert many_queries == few_queries
+        pipeline = models.SCMPipelineRun.objects.get(pk=next_scm_pipeline_run.pk)
+        assert pipeline.steps_completed == 50
+
+    def test_pipeline_saved_once_per_pipeline(self, client, logged_in_user, scm_pipeline_run, next_scm_pipeline_run,
+                                              create_steps):
+        steps = create_steps(scm_pipeline_run, 3) + create_steps(next_scm_pipeline_run, 2)
+
+        with mock.patch('katka.signals.close_release_if_pipeline_finished') as close_release:
+            response, _ = _put(client, [{'public_identifier': str(step.pk), 'status': 'success'} for step in steps])
+
+        assert response.status_code == 200
+        assert sorted(call[0][0].pk for call in close_release.call_args_list) == sorted(
+            [scm_pipeline_run.pk, next_scm_pipeline_run.pk]
+        )
+
+    def test_invalid_entry_updates_nothing(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        steps = create_steps(scm_pipeline_run, 2)
+        data = [
+            {'public_identifier': str(steps[0].pk), 'status': 'success'},
+            {'public_identifier': str(steps[1].pk), 'status': 'bla'},
+        ]
+
+        response, _ = _put(client, data)
+
+        assert response.status_code == 400
+        assert response.json() == [{}, {'status': ['"bla" is not a valid choice.']}]
+        assert models.SCMStepRun.objects.get(pk=steps[0].pk).status == 'not started'
+
+    def test_missing_step_updates_nothing(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        steps = create_steps(scm_pipeline_run, 1)
+        missing = uuid.uuid4()
+        data = [
+            {'public_identifier': str(steps[0].pk), 'status': 'success'},
+            {'public_identifier': str(missing), 'status': 'success'},
+        ]
+
+        response, _ = _put(client, data)
+
+        assert response.status_code == 404
+        assert response.json() == {'detail': f'Step(s) not found: {missing}'}
+        assert models.SCMStepRun.objects.get(pk=steps[0].pk).status == 'not started'
+
+    def test_not_my_step(self, client, logged_in_user, not_my_application, create_steps):
+        with username_on_model(models.SCMPipelineRun, 'initial'):
+            not_my_pipeline_run = models.SCMPipelineRun.objects.create(application=not_my_application,
+                                                                       commit_hash='1234')
+        steps = create_steps(not_my_pipeline_run, 1)
+
+        response, _ = _put(client, [{'public_identifier': str(steps[0].pk), 'status': 'success'}])
+
+        assert response.status_code == 404
+        assert models.SCMStepRun.objects.get(pk=steps[0].pk).status == 'not started'
+
+    def test_duplicate_step(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        steps = create_steps(scm_pipeline_run, 1)
+        data = [{'public_identifier': str(steps[0].pk), 'status': 'success'}] * 2
+
+        response, _ = _put(client, data)
+
+        assert response.status_code == 400
+        assert models.SCMStepRun.objects.get(pk=steps[0].pk).status == 'not started'
@@ -0,0 +1,82 @@
+import json
+
+from django.core.management import call_command
+from django.db import connection
+
+import pytest
+from katka.fields import CompressedTextField
+from katka.models import BatchedMigrationProgress, PipelineDefinition, SCMPipelineRun, SCMStepRun
+from katka.releases import _outputs_with_release_version
+
+LARGE_OUTPUT = json.dumps({'log': ['Deploying to production'] * 100, 'release_version': '1.2.3'})
+
+
+def _stored(model, pk, field_name):
+    """The text as it is stored, bypassing the field"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {field_name} FROM {model._meta.db_table} WHERE {model._meta.pk.column} = %s',
+                       [model._meta.pk.get_db_prep_value(pk, connection)])
+        return cursor.fetchone()[0]
+
+
+def _store_raw(model, pk, field_name, value):
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {model._meta.db_table} SET {field_name} = %s WHERE {model._meta.pk.column} = %s',
+                       [value, model._meta.pk.get_db_prep_value(pk, connection)])
+
+
+@pytest.mark.django_db
+class TestCompressedText:
+    def test_output_is_stored_compressed(self, client, logged_in_user, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step', output=LARGE_OUTPUT)
+
+        stored = _stored(SCMStepRun, step.pk, 'output')
+        assert CompressedTextField.is_compressed(stored)
+        assert len(stored) < len(LARGE_OUTPUT) / 5
+        assert SCMStepRun.objects.get(pk=step.pk).output == LARGE_OUTPUT
+        assert SCMStepRun.objects.values_list('output', flat=True).get(pk=step.pk) == LARGE_OUTPUT
+        assert client.get(f'/scm-step-runs/{step.pk}/').json()['output'] == LARGE_OUTPUT
+
+    def test_short_text_is_stored_as_is(self, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step', output='{"release_version": "1.2.3"}')
+
+        assert _stored(SCMStepRun, step.pk, 'output') == '{"release_version": "1.2.3"}'
+        definition_pk = scm_pipeline_run.pipeline_definition_id
+        assert _stored(PipelineDefinition, definition_pk, 'pipeline_yaml') == scm_pipeline_run.pipeline_yaml
+
+    def test_release_version_in_compressed_output(self, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'compressed', output=LARGE_OUTPUT)
+        create_scm_step_run(scm_pipeline_run, 'other', output='{"other": 1}')
+
+        assert _outputs_with_release_version(SCMStepRun.objects.all()) == {step.pk: LARGE_OUTPUT}
+
+    def test_compress_existing_rows(self, scm_pipeline_run, create_scm_step_run):
+        large = create_scm_step_run(scm_pipeline_run, 'large', output='x')
+        small = create_scm_step_run(scm_pipeline_run, 'small', output='x')
+        pipeline_yaml = 'stages:\n  - deploy\n' * 100
+        # rows that were saved before the field was compressed
+        _store_raw(SCMStepRun, large.pk, 'output', LARGE_OUTPUT)
+        _store_raw(PipelineDefinition, scm_pipeline_run.pipeline_definition_id, 'pipeline_yaml', pipeline_yaml)
+
+        call_command('compress_text_fields', batch_size=1)
+
+        assert CompressedTextField.is_compressed(_stored(SCMStepRun, large.pk, 'output'))
+        assert _stored(SCMStepRun, small.pk, 'output') == 'x'
+        definition_pk = scm_pipeline_run.pipeline_definition_id
+        assert CompressedTextField.is_compressed(_stored(PipelineDefinition, definition_pk, 'pipeline_yaml'))
+        assert SCMStepRun.objects.get(pk=large.pk).output == LARGE_OUTPUT
+        assert SCMPipelineRun.objects.get(pk=scm_pipeline_run.pk).pipeline_yaml == pipeline_yaml
+        assert BatchedMigrationProgress.objects.filter(
+            name__startswith='compress_text_fields:', completed_at__isnull=False,
+        ).count() == 2
+
+    def test_restart(self, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step', output='x')
+        call_command('compress_text_fields')
+        _store_raw(SCMStepRun, step.pk, 'output', LARGE_OUTPUT)
+
+        call_command('compress_text_fields')
+        assert not CompressedTextField.is_compressed(_stored(SCMStepRun, step.pk, 'output'))
+
+        call_command('compress_text_fields', restart=True)
+        assert CompressedTextField.is_compressed(_stored(SCMStepRun, step.pk, 'output'))
@@ -0,0 +1,64 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from katka.fields import username_on_model
+from katka.models import SCMRelease
+
+
+def _list_query(client, url, table):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    sql = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(f'SELECT "{table}".')]
+    return response.json(), sql[0]
+
+
+def _query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return ' '.join(row[-1] for row in cursor.fetchall())
+
+
+@pytest.mark.django_db
+class TestDeduplication:
+    def test_single_valued_relations_are_not_deduplicated(self, client, logged_in_user, scm_step_run):
+        parsed, sql = _list_query(client, '/scm-step-runs/', 'katka_scmsteprun')
+
+        assert len(parsed) == 1
+        assert 'DISTINCT' not in sql
+        assert 'IN (SELECT' not in sql
+        assert 'DISTINCT' not in _query_plan(sql)
+
+    def test_filter_on_single_valued_relation(self, client, logged_in_user, scm_pipeline_run, scm_step_run):
+        parsed, sql = _list_query(client, f'/scm-step-runs/?scm_pipeline_run={scm_pipeline_run.pk}',
+                                  'katka_scmsteprun')
+
+        assert len(parsed) == 1
+        assert 'DISTINCT' not in sql
+        assert 'IN (SELECT' not in sql
+
+    def test_multi_valued_scope_is_deduplicated_on_pk(self, client, logged_in_user, scm_pipeline_run, scm_release,
+                                                      next_scm_pipeline_run):
+        # both pipeline runs are in the same release, so joining the release with its pipeline runs returns it twice
+        assert scm_release.scm_pipeline_runs.count() == 2
+
+        parsed, sql = _list_query(client, '/scm-releases/', 'katka_scmrelease')
+
+        assert [release['public_identifier'] for release in parsed] == [str(scm_release.pk)]
+        assert 'DISTINCT' not in sql
+        assert '"katka_scmrelease"."public_identifier" IN (SELECT' in sql
+        assert 'DISTINCT' not in _query_plan(sql)
+
+    def test_multi_valued_filter_is_deduplicated_on_pk(self, client, logged_in_user, scm_pipeline_run, scm_release):
+        with username_on_model(SCMRelease, 'initial'):
+            other_release = SCMRelease.objects.create(name='other')
+        other_release.scm_pipeline_runs.add(scm_pipeline_run)
+
+        parsed, sql = _list_query(client, f'/scm-pipeline-runs/?release={scm_release.pk}', 'katka_scmpipelinerun')
+
+        assert [pipeline['public_identifier'] for pipeline in parsed] == [str(scm_pipeline_run.pk)]
+        assert 'DISTINCT' not in sql
+        assert '"katka_scmpipelinerun"."public_identifier" IN (SELECT' in sql
+        assert 'ORDER BY "katka_scmpipelinerun"."created_at" DESC' in sql
@@ -0,0 +1,126 @@
+from django.core.management import call_command
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+import mock
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+from katka import key_rotation
+from katka.encryption import rotate_tokens
+from katka.fields import username_on_model
+from katka.models import CredentialSecret
+
+OLD_KEY = Fernet.generate_key().decode('utf-8')
+NEW_KEY = Fernet.generate_key().decode('utf-8')
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def secrets(settings, credential):
+    settings.FIELD_ENCRYPTION_KEY = OLD_KEY
+    with username_on_model(CredentialSecret, 'initial'):
+        return [CredentialSecret.objects.create(key=f'key{number}', value=f'value{number}', credential=credential)
+                for number in range(5)]
+
+
+def _tokens():
+    return dict(CredentialSecret.objects.annotate(token=Cast('value', TextField())).values_list('key', 'token'))
+
+
+def _encrypted_with(key):
+    fernet = Fernet(key)
+    encrypted = set()
+    for secret_key, token in _tokens().items():
+        try:
+            fernet.decrypt(token.encode('utf-8'))
+            encrypted.add(secret_key)
+        except InvalidToken:
+            pass
+
+    return encrypted
+
+
+def _values():
+    return {secret.key: secret.value for secret in CredentialSecret.objects.all()}
+
+
+@pytest.mark.django_db
+class TestKeyRotation:
+    def test_decrypt_with_any_key_encrypt_with_first(self, settings, secrets):
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+
+        assert _values() == {f'key{number}': f'value{number}' for number in range(5)}
+
+        with username_on_model(CredentialSecret, 'test'):
+            secrets[0].save()
+        assert _encrypted_with(NEW_KEY) == {'key0'}
+
+    def test_rotate(self, settings, secrets):
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+
+        call_command('rotate_secret_keys', batch_size=2)
+
+        assert _encrypted_with(NEW_KEY) == {f'key{number}' for number in range(5)}
+        settings.FIELD_ENCRYPTION_KEY = NEW_KEY
+        assert _values() == {f'key{number}': f'value{number}' for number in range(5)}
+
+    def test_resume_after_interruption(self, settings, secrets):
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+        calls = []
+
+        def interrupted_on_second_batch(keys, tokens):
+            calls.append(tokens)
+            if len(calls) == 2:
+                raise Interrupted()
+            return rotate_tokens(keys, tokens)
+
+        with mock.patch('katka.key_rotation.rotate_tokens', interrupted_on_second_batch):
+            with pytest.raises(Interrupted):
+                key_rotation.rotate_secret_keys(batch_size=2)
+
+        assert len(_encrypted_with(NEW_KEY)) == 2
+
+        assert key_rotation.rotate_secret_keys(batch_size=2) == 3
+        assert len(_encrypted_with(NEW_KEY)) == 5
+        # completed for this key, running it again does nothing
+        assert key_rotation.rotate_secret_keys(batch_size=2) == 0
+
+    def test_restart(self, settings, secrets):
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+        key_rotation.rotate_secret_keys()
+
+        assert key_rotation.rotate_secret_keys() == 0
+        assert key_rotation.rotate_secret_keys(restart=True) == 5
+
+    def test_next_rotation_starts_over(self, settings, secrets):
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+        key_rotation.rotate_secret_keys()
+        newest_key = Fernet.generate_key().decode('utf-8')
+        settings.FIELD_ENCRYPTION_KEY = [newest_key, NEW_KEY]
+
+        assert key_rotation.rotate_secret_keys() == 5
+        assert len(_encrypted_with(newest_key)) == 5
+
+    def test_changed_during_rotation(self, settings, secrets):
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+
+        def changed_meanwhile(keys, tokens):
+            CredentialSecret.objects.filter(key='key0').update(value='changed')
+            return rotate_tokens(keys, tokens)
+
+        with mock.patch('katka.key_rotation.rotate_tokens', changed_meanwhile):
+            key_rotation.rotate_secret_keys()
+
+        assert _values()['key0'] == 'changed'
+        assert _values()['key1'] == 'value1'
+
+    def test_processes(self, settings, secrets):
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+
+        assert key_rotation.rotate_secret_keys(batch_size=3, processes=2) == 5
+
+        assert len(_encrypted_with(NEW_KEY)) == 5
+        assert _values() == {f'key{number}': f'value{number}' for number in range(5)}
@@ -0,0 +1,99 @@
+import pytest
+from katka import models
+from katka.fields import username_on_model
+from tests.utils.queries import assert_constant_list_queries
+
+
+def _save(instance):
+    with username_on_model(instance.__class__, 'initial'):
+        instance.save()
+    return instance
+
+
+@pytest.mark.django_db
+class TestListQueryCounts:
+    def test_teams(self, client, logged_in_user, group):
+        assert_constant_list_queries(
+            client, '/teams/', lambda n: _save(models.Team(name=f'Team {n}', slug=f'T{n}', group=group))
+        )
+
+    def test_projects(self, client, logged_in_user, team):
+        assert_constant_list_queries(
+            client, '/projects/', lambda n: _save(models.Project(name=f'Project {n}', slug=f'P{n}', team=team))
+        )
+
+    def test_applications(self, client, logged_in_user, project, scm_service, credential):
+        def add_application(n):
+            repository = _save(models.SCMRepository(scm_service=scm_service, credential=credential,
+                                                    organisation='acme', repository_name=f'repo{n}'))
+            _save(models.Application(project=project, scm_repository=repository, name=f'App {n}', slug=f'A{n}'))
+
+        assert_constant_list_queries(client, '/applications/', add_application)
+
+    def test_credentials(self, client, logged_in_user, team):
+        assert_constant_list_queries(
+            client, '/credentials/', lambda n: _save(models.Credential(name=f'Credential {n}', team=team))
+        )
+
+    def test_secrets(self, client, logged_in_user, credential):
+        assert_constant_list_queries(
+            client, f'/credentials/{credential.pk}/secrets/',
+            lambda n: _save(models.CredentialSecret(key=f'key{n}', value='secret', credential=credential))
+        )
+
+    def test_scm_services(self, client, logged_in_user):
+        assert_constant_list_queries(
+            client, '/scm-services/',
+            lambda n: _save(models.SCMService(scm_service_type='git', server_url=f'https://scm{n}.example.com'))
+        )
+
+    def test_scm_repositories(self, client, logged_in_user, scm_service, credential):
+        assert_constant_list_queries(
+            client, '/scm-repositories/',
+            lambda n: _save(models.SCMRepository(scm_service=scm_service, credential=credential,
+                                                 organisation='acme', repository_name=f'repo{n}'))
+        )
+
+    def test_scm_pipeline_runs(self, client, logged_in_user, application):
+        assert_constant_list_queries(
+            client, '/scm-pipeline-runs/',
+            lambda n: _save(models.SCMPipelineRun(application=application, commit_hash=f'{n}',
+                                                  pipeline_yaml=f'stages: [stage{n}]'))
+        )
+
+    def test_scm_step_runs(self, client, logged_in_user, scm_pipeline_run):
+        assert_constant_list_queries(
+            client, '/scm-step-runs/',
+            lambda n: _save(models.SCMStepRun(slug=f'step{n}', name=f'Step {n}', stage='deploy',
+                                              scm_pipeline_run=scm_pipeline_run))
+        )
+
+    def test_scm_releases(self, client, logged_in_user, application):
+        def add_release(n):
+            pipeline_run = _save(models.SCMPipelineRun(application=application, commit_hash=f'{n}'))
+            release = _save(models.SCMRelease(name=f'Release {n}'))
+            release.scm_pipeline_runs.add(pipeline_run)
+
+        assert_constant_list_queries(client, '/scm-releases/', add_release)
+
+    def test_metadata(self, client, logged_in_user, application):
+        assert_constant_list_queries(
+            client, f'/applications/{application.pk}/metadata/',
+            lambda n: _save(models.ApplicationMetadata(key=f'key{n}', value='value', application=application))
+        )
+
+    def test_pipeline_run_releases_are_prefetched(self, client, logged_in_user, scm_pipeline_run,
+                                                  deactivated_scm_release):
+        response = client.get('/scm-pipeline-runs/')
+
+        # deleted releases are not listed
+        assert response.json()[0]['scmrelease_set'] == []
+
+    def test_release_pipeline_runs_are_prefetched_in_scope(self, client, logged_in_user, scm_release,
+                                                           scm_pipeline_run, not_my_application):
+        not_my_pipeline_run = _save(models.SCMPipelineRun(application=not_my_application, commit_hash='1'))
+        scm_release.scm_pipeline_runs.add(not_my_pipeline_run)
+
+        response = client.get('/scm-releases/')
+
+        assert response.json()[0]['scm_pipeline_runs'] == [str(scm_pipeline_run.pk)]
@@ -0,0 +1,173 @@
+import time
+from datetime import timedelta
+
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+import mock
+import pytest
+import requests
+from freezegun import freeze_time
+from katka import constants, notifications
+from katka.fields import username_on_model
+from katka.models import PipelineChangeNotification, SCMPipelineRun
+from katka.notifications import dispatch_pending, enqueue_notification, schedule_dispatch
+from requests import HTTPError
+from tests.utils.stub_server import StubRunnerServer
+
+
+@pytest.fixture
+def outbox(settings):
+    settings.PIPELINE_CHANGE_NOTIFICATION_DISPATCHER = constants.NOTIFICATION_DISPATCHER_OUTBOX
+    settings.PIPELINE_CHANGE_NOTIFICATION_URL = 'http://override-url/'
+    settings.PIPELINE_CHANGE_NOTIFICATION_SESSION = mock.MagicMock()
+    return settings.PIPELINE_CHANGE_NOTIFICATION_SESSION
+
+
+def _set_status(pipeline, status):
+    with username_on_model(SCMPipelineRun, 'signal_tester'):
+        pipeline.status = status
+        pipeline.save()
+
+
+@pytest.mark.django_db
+class TestOutboxDispatcher:
+    def test_coalesces_notifications(self, outbox, scm_pipeline_run, another_scm_pipeline_run):
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_SUCCESS)
+        _set_status(another_scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+
+        assert outbox.post.call_args_list == []
+        assert PipelineChangeNotification.objects.count() == 2
+
+        assert dispatch_pending() == 2
+
+        assert sorted(outbox.post.call_args_list, key=str) == sorted([
+            mock.call('http://override-url/', json={'public_identifier': str(scm_pipeline_run.public_identifier)}),
+            mock.call('http://override-url/',
+                      json={'public_identifier': str(another_scm_pipeline_run.public_identifier)}),
+        ], key=str)
+        assert PipelineChangeNotification.objects.count() == 0
+
+    def test_retry_with_backoff(self, outbox, scm_pipeline_run, caplog):
+        outbox.post.return_value.raise_for_status.side_effect = HTTPError("Error", 503)
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+
+        now = timezone.now()
+        with freeze_time(now):
+            assert dispatch_pending() == 0
+            assert dispatch_pending() == 0  # not due yet
+
+        notification = PipelineChangeNotification.objects.get()
+        assert notification.attempts == 1
+        assert notification.next_attempt_at == now + timedelta(seconds=2)
+        assert outbox.post.call_count == 1
+        assert 'Failed to notify pipeline runner' in caplog.messages
+
+        outbox.post.return_value.raise_for_status.side_effect = None
+        with freeze_time(now + timedelta(seconds=2)):
+            assert dispatch_pending() == 1
+
+        assert PipelineChangeNotification.objects.count() == 0
+
+    def test_connection_error_is_retried(self, outbox, scm_pipeline_run):
+        outbox.post.side_effect = requests.ConnectionError()
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+
+        assert dispatch_pending() == 0
+        assert PipelineChangeNotification.objects.get().attempts == 1
+
+    def test_give_up_after_max_attempts(self, outbox, settings, scm_pipeline_run, caplog):
+        settings.PIPELINE_CHANGE_NOTIFICATION_MAX_ATTEMPTS = 1
+        outbox.post.return_value.raise_for_status.side_effect = HTTPError("Error", 503)
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+
+        assert dispatch_pending() == 0
+        assert PipelineChangeNotification.objects.count() == 0
+        assert any('Giving up' in message for message in caplog.messages)
+
+    def test_notification_requested_while_sending_is_kept(self, outbox, scm_pipeline_run):
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+
+        def change_during_post(*args, **kwargs):
+            _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_SUCCESS)
+            return mock.MagicMock()
+
+        outbox.post.side_effect = change_during_post
+        with freeze_time(timezone.now() + timedelta(seconds=1), tick=True):
+            assert dispatch_pending() == 1
+
+        assert PipelineChangeNotification.objects.count() == 1
+
+    def test_enqueue_created_concurrently(self, outbox, scm_pipeline_run):
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+        PipelineChangeNotification.objects.update(attempts=3)
+        update = QuerySet.update
+        calls = []
+
+        def update_before_concurrent_create(queryset, **kwargs):
+            # the first update runs before the other transaction created the row
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_before_concurrent_create):
+            enqueue_notification(scm_pipeline_run.public_identifier)
+
+        assert len(calls) == 2
+        assert PipelineChangeNotification.objects.get().attempts == 0
+
+    def test_claimed_notifications_are_not_sent_twice(self, outbox, scm_pipeline_run):
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+        concurrent = []
+        outbox.post.side_effect = lambda *args, **kwargs: concurrent.append(dispatch_pending()) or mock.MagicMock()
+
+        assert dispatch_pending() == 1
+        assert concurrent == [0]
+        assert outbox.post.call_count == 1
+
+    def test_retry_is_scheduled(self, outbox, scm_pipeline_run):
+        outbox.post.return_value.raise_for_status.side_effect = HTTPError("Error", 503)
+        _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+
+        now = timezone.now()
+        with freeze_time(now), mock.patch('katka.notifications.threading.Timer') as timer:
+            dispatch_pending()
+            notifications._schedule_retry()
+            notifications._retry_timer = None
+
+        timer.assert_called_once_with(2.0, schedule_dispatch)
+        timer.return_value.start.assert_called_once_with()
+
+    def test_dispatch_scheduled_on_commit(self, outbox, scm_pipeline_run):
+        with mock.patch('katka.notifications.transaction.on_commit') as on_commit:
+            _set_status(scm_pipeline_run, constants.PIPELINE_STATUS_IN_PROGRESS)
+
+        on_commit.assert_called_once_with(schedule_dispatch)
+
+
+@pytest.mark.django_db
+class TestStubRunner:
+    def test_save_does_not_wait_on_runner(self, settings, application):
+        settings.PIPELINE_CHANGE_NOTIFICATION_SESSION = requests.Session()
+
+        with StubRunnerServer(delay=0.5) as runner:
+            settings.PIPELINE_CHANGE_NOTIFICATION_URL = runner.url
+
+            settings.PIPELINE_CHANGE_NOTIFICATION_DISPATCHER = constants.NOTIFICATION_DISPATCHER_SYNC
+            start = time.monotonic()
+            with username_on_model(SCMPipelineRun, 'signal_tester'):
+                SCMPipelineRun.objects.create(application=application, commit_hash='1')
+            sync_duration = time.monotonic() - start
+
+            settings.PIPELINE_CHANGE_NOTIFICATION_DISPATCHER = constants.NOTIFICATION_DISPATCHER_OUTBOX
+            start = time.monotonic()
+            with username_on_model(SCMPipelineRun, 'signal_tester'):
+                pipeline_run = SCMPipelineRun.objects.create(application=application, commit_hash='2')
+            outbox_duration = time.monotonic() - start
+
+            assert len(runner.received) == 1
+            assert dispatch_pending() == 1
+
+        assert sync_duration >= 0.5
+        assert outbox_duration < 0.5
+        assert runner.received[-1] == {'public_identifier': str(pipeline_run.public_identifier)}
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import pytest
+from freezegun import freeze_time
+
+
+@pytest.fixture
+def create_steps(create_scm_step_run):
+    def create(pipeline, count, start):
+        steps = []
+        for i in range(count):
+            with freeze_time(start + timedelta(seconds=i)):
+                steps.append(create_scm_step_run(pipeline, f'step{i}'))
+        return steps
+
+    return create
+
+
+def _follow(client, url):
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.json()
+        pages.append([item['public_identifier'] for item in page['results']])
+        url = page['next']
+    return pages
+
+
+@pytest.mark.django_db
+class TestCursorPagination:
+    def test_not_paginated_by_default(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        create_steps(scm_pipeline_run, 3, timezone.now())
+
+        response = client.get('/scm-step-runs/')
+        assert response.status_code == 200
+        assert len(response.json()) == 3
+
+    def test_pages_newest_first(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        steps = create_steps(scm_pipeline_run, 5, timezone.now())
+
+        pages = _follow(client, '/scm-step-runs/?page_size=2')
+
+        assert pages == [
+            [str(steps[4].pk), str(steps[3].pk)],
+            [str(steps[2].pk), str(steps[1].pk)],
+            [str(steps[0].pk)],
+        ]
+
+    def test_stable_under_concurrent_inserts(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        start = timezone.now()
+        steps = create_steps(scm_pipeline_run, 4, start)
+
+        response = client.get('/scm-step-runs/?page_size=2')
+        first_page = response.json()
+        create_steps(scm_pipeline_run, 2, start + timedelta(minutes=1))
+
+        remaining = _follow(client, first_page['next'])
+        assert remaining == [[str(steps[1].pk), str(steps[0].pk)]]
+
+    def test_same_created_at(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        now = timezone.now()
+        older = create_steps(scm_pipeline_run, 1, now - timedelta(seconds=1))
+        same = [step for i in range(5) for step in create_steps(scm_pipeline_run, 1, now)]
+        newer = create_steps(scm_pipeline_run, 1, now + timedelta(seconds=1))
+        # the steps with the same created_at are ordered on their primary key
+        expected = [str(step.pk) for step in newer + sorted(same, key=lambda step: step.pk, reverse=True) + older]
+
+        pages = _follow(client, '/scm-step-runs/?page_size=2')
+
+        assert pages == [expected[0:2], expected[2:4], expected[4:6], expected[6:7]]
+
+    def test_same_value_with_requested_ordering(self, client, logged_in_user, scm_pipeline_run, create_steps):
+        now = timezone.now()
+        steps = [step for i in range(5) for step in create_steps(scm_pipeline_run, 1, now)]
+        expected = sorted(str(step.pk) for step in steps)
+
+        pages = _follow(client, '/scm-step-runs/?page_size=2&ordering=created_at')
+
+        assert pages == [expected[0:2], expected[2:4], expected[4:5]]
+
+    def test_page_size_is_capped(self, client, logged_in_user, scm_pipeline_run, monkeypatch, create_steps):
+        create_steps(scm_pipeline_run, 3, timezone.now())
+        monkeypatch.setattr('katka.pagination.CreatedAtCursorPagination.max_page_size', 2)
+
+        response = client.get('/scm-step-runs/?page_size=100')
+
+        assert len(response.json()['results']) == 2
+
+    def test_pipeline_runs_and_releases(self, client, logged_in_user, scm_pipeline_run, next_scm_pipeline_run):
+        response = client.get('/scm-pipeline-runs/?page_size=1')
+        assert response.status_code == 200
+        parsed = response.json()
+        assert [item['public_identifier'] for item in parsed['results']] == [str(next_scm_pipeline_run.pk)]
+        assert parsed['next'] is not None
+
+        response = client.get('/scm-releases/?page_size=1')
+        assert response.status_code == 200
+        parsed = response.json()
+        assert len(parsed['results']) == 1
+        assert parsed['next'] is None
+
+    @pytest.mark.parametrize('url', ['/applications/', '/scm-step-runs/'])
+    def test_lists_without_pages_are_not_reordered(self, client, logged_in_user, application, scm_step_run, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+
+        assert response.status_code == 200
+        assert not any('ORDER BY' in query['sql'] for query in queries.captured_queries)
+
+    def test_pages_are_ordered(self, client, logged_in_user, scm_step_run):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/scm-step-runs/?page_size=1')
+
+        assert response.status_code == 200
+        assert any('ORDER BY "katka_scmsteprun"."created_at" DESC, "katka_scmsteprun"."public_identifier" DESC'
+                   in query['sql'] for query in queries.captured_queries)
@@ -0,0 +1,153 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from katka.fields import username_on_model
+from katka.models import PipelineDefinition, SCMPipelineRun
+
+PIPELINE_YAML = 'stages:\n  - deploy\n'
+
+
+def _create_pipeline(application, commit_hash, **kwargs):
+    with username_on_model(SCMPipelineRun, 'initial'):
+        return SCMPipelineRun.objects.create(application=application, commit_hash=commit_hash, **kwargs)
+
+
+def _url(pipeline):
+    return f'/scm-pipeline-runs/{pipeline.pk}/pipeline-definition/'
+
+
+@pytest.mark.django_db
+class TestPipelineDefinitions:
+    def test_stored_once(self, application):
+        first = _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+        second = _create_pipeline(application, '2', pipeline_yaml=PIPELINE_YAML)
+        other = _create_pipeline(application, '3', pipeline_yaml='stages: []')
+
+        assert first.pipeline_definition_id == second.pipeline_definition_id != other.pipeline_definition_id
+        assert PipelineDefinition.objects.get(pk=first.pipeline_definition_id).pipeline_yaml == PIPELINE_YAML
+        assert SCMPipelineRun.objects.get(pk=second.pk).pipeline_yaml == PIPELINE_YAML
+
+    def test_default(self, application):
+        pipeline = _create_pipeline(application, '1')
+
+        assert SCMPipelineRun.objects.get(pk=pipeline.pk).pipeline_yaml == '---'
+
+    def test_change(self, client, logged_in_user, application):
+        pipeline = _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+        shared = _create_pipeline(application, '2', pipeline_yaml=PIPELINE_YAML)
+
+        response = client.patch(f'/scm-pipeline-runs/{pipeline.pk}/', {'pipeline_yaml': 'stages: []'},
+                                content_type='application/json')
+
+        assert response.status_code == 200
+        assert response.json()['pipeline_yaml'] == 'stages: []'
+        assert SCMPipelineRun.objects.get(pk=pipeline.pk).pipeline_yaml == 'stages: []'
+        assert SCMPipelineRun.objects.get(pk=shared.pk).pipeline_yaml == PIPELINE_YAML
+
+    def test_create(self, client, logged_in_user, application):
+        data = {'commit_hash': '1', 'application': str(application.pk), 'pipeline_yaml': PIPELINE_YAML}
+        response = client.post('/scm-pipeline-runs/', data, content_type='application/json')
+
+        assert response.status_code == 201
+        pipeline = SCMPipelineRun.objects.get(pk=response.json()['public_identifier'])
+        # like other text fields of the api, the whitespace around it is trimmed
+        assert pipeline.pipeline_definition_id == PipelineDefinition.objects.content_hash(PIPELINE_YAML.strip())
+
+    def test_read_with_the_run(self, client, logged_in_user, application):
+        _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/scm-pipeline-runs/')
+
+        assert response.json()[0]['pipeline_yaml'] == PIPELINE_YAML
+        assert not [query for query in queries.captured_queries
+                    if query['sql'].startswith('SELECT "katka_pipelinedefinition"')]
+
+    def test_filter(self, client, logged_in_user, application):
+        pipeline = _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+        _create_pipeline(application, '2', pipeline_yaml='stages: []')
+
+        response = client.get('/scm-pipeline-runs/', {'pipeline_yaml': PIPELINE_YAML})
+
+        assert [run['public_identifier'] for run in response.json()] == [str(pipeline.pk)]
+
+    def test_etag(self, client, logged_in_user, application):
+        pipeline = _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+        content_hash = PipelineDefinition.objects.content_hash(PIPELINE_YAML)
+
+        response = client.get(_url(pipeline))
+
+        assert response.status_code == 200
+        assert response['ETag'] == f'"{content_hash}"'
+        assert response.json() == {'content_hash': content_hash, 'pipeline_yaml': PIPELINE_YAML}
+
+    @pytest.mark.parametrize('if_none_match', ['"{}"', 'W/"{}"', '"other", "{}"', '*'])
+    def test_not_modified(self, client, logged_in_user, application, if_none_match):
+        pipeline = _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+        content_hash = PipelineDefinition.objects.content_hash(PIPELINE_YAML)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(_url(pipeline), HTTP_IF_NONE_MATCH=if_none_match.format(content_hash))
+
+        assert response.status_code == 304
+        assert response['ETag'] == f'"{content_hash}"'
+        assert not [query for query in queries.captured_queries if 'katka_pipelinedefinition' in query['sql']]
+
+    def test_modified(self, client, logged_in_user, application):
+        pipeline = _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+
+        response = client.get(_url(pipeline), HTTP_IF_NONE_MATCH='"other"')
+
+        assert response.status_code == 200
+        assert response.json()['pipeline_yaml'] == PIPELINE_YAML
+
+    def test_not_logged_in(self, client, application):
+        pipeline = _create_pipeline(application, '1', pipeline_yaml=PIPELINE_YAML)
+
+        assert client.get(_url(pipeline)).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_migration(application):
+    executor = MigrationExecutor(connection)
+    executor.migrate([('katka', '0040_pipelinedefinition')])
+    state_apps = executor.loader.project_state(('katka', '0040_pipelinedefinition')).apps
+    OldSCMPipelineRun = state_apps.get_model('katka', 'SCMPipelineRun')
+    with username_on_model(OldSCMPipelineRun, 'initial'):
+        for number, pipeline_yaml in enumerate([PIPELINE_YAML, 'stages: []', PIPELINE_YAML]):
+            OldSCMPipelineRun.objects.create(application_id=application.pk, commit_hash=str(number),
+                                             pipeline_yaml=pipeline_yaml)
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+    assert PipelineDefinition.objects.count() == 2
+    assert list(SCMPipelineRun.objects.order_by('commit_hash').values_list('commit_hash', 'pipeline_definition')) == [
+        ('0', PipelineDefinition.objects.content_hash(PIPELINE_YAML)),
+        ('1', PipelineDefinition.objects.content_hash('stages: []')),
+        ('2', PipelineDefinition.objects.content_hash(PIPELINE_YAML)),
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_migration_backwards(application):
+    for number, pipeline_yaml in enumerate([PIPELINE_YAML, 'stages: []', PIPELINE_YAML]):
+        _create_pipeline(application, str(number), pipeline_yaml=pipeline_yaml)
+
+    executor = MigrationExecutor(connection)
+    executor.migrate([('katka', '0040_pipelinedefinition')])
+    state_apps = executor.loader.project_state(('katka', '0040_pipelinedefinition')).apps
+    OldSCMPipelineRun = state_apps.get_model('katka', 'SCMPipelineRun')
+
+    assert list(OldSCMPipelineRun.objects.order_by('commit_hash').values_list('commit_hash', 'pipeline_yaml')) == [
+        ('0', PIPELINE_YAML), ('1', 'stages: []'), ('2', PIPELINE_YAML),
+    ]
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+    assert SCMPipelineRun.objects.get(commit_hash='1').pipeline_yaml == 'stages: []'
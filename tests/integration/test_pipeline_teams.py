@@ -0,0 +1,124 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from katka.fields import username_on_model
+from katka.models import Application, Project, SCMPipelineRun, SCMStepRun
+
+STEPS = [
+    {'slug': 'build', 'name': 'Build', 'stage': 'build', 'sequence_id': '1.1'},
+    {'slug': 'deploy', 'name': 'Deploy', 'stage': 'deploy', 'sequence_id': '2.1'},
+]
+
+
+def _teams(model):
+    return set(model.objects.values_list('team', flat=True))
+
+
+@pytest.mark.django_db
+class TestPipelineTeams:
+    def test_set_on_create(self, team, scm_pipeline_run, scm_step_run):
+        assert SCMPipelineRun.objects.get(pk=scm_pipeline_run.pk).team_id == team.pk
+        assert SCMStepRun.objects.get(pk=scm_step_run.pk).team_id == team.pk
+
+    def test_set_on_api_create(self, client, logged_in_user, team, application, scm_pipeline_run):
+        response = client.post('/scm-pipeline-runs/', data={'application': application.public_identifier,
+                                                            'commit_hash': '1234'})
+        assert response.status_code == 201
+
+        response = client.post(f'/scm-pipeline-runs/{scm_pipeline_run.pk}/steps/', STEPS,
+                               content_type='application/json')
+        assert response.status_code == 201
+
+        assert _teams(SCMPipelineRun) == {team.pk}
+        assert _teams(SCMStepRun) == {team.pk}
+
+    def test_application_moves_to_project_of_other_team(self, my_other_team, another_project, application,
+                                                        scm_step_run):
+        application.project = another_project
+        with username_on_model(Application, 'moved'):
+            application.save()
+
+        assert _teams(SCMPipelineRun) == {my_other_team.pk}
+        assert _teams(SCMStepRun) == {my_other_team.pk}
+
+    def test_project_moves_to_other_team(self, my_other_team, project, scm_step_run):
+        project.team = my_other_team
+        with username_on_model(Project, 'moved'):
+            project.save()
+
+        assert _teams(SCMPipelineRun) == {my_other_team.pk}
+        assert _teams(SCMStepRun) == {my_other_team.pk}
+
+    def test_not_moved_when_unchanged(self, application, project, scm_step_run):
+        application = Application.objects.get(pk=application.pk)
+        project = Project.objects.get(pk=project.pk)
+        application.name = 'Renamed'
+        project.name = 'Renamed'
+
+        with CaptureQueriesContext(connection) as queries:
+            with username_on_model(Application, 'renamed'):
+                application.save()
+            with username_on_model(Project, 'renamed'):
+                project.save()
+
+        assert not [query for query in queries.captured_queries if 'katka_scmpipelinerun' in query['sql']]
+
+    def test_moved_again_after_save(self, my_other_team, team, another_project, project, application, scm_step_run):
+        application.project = another_project
+        with username_on_model(Application, 'moved'):
+            application.save()
+        application.project = project
+        with username_on_model(Application, 'moved back'):
+            application.save()
+
+        assert _teams(SCMPipelineRun) == {team.pk}
+        assert _teams(SCMStepRun) == {team.pk}
+
+    def test_pipeline_moves_to_application_of_other_team(self, my_other_team, another_application, scm_pipeline_run,
+                                                         scm_step_run):
+        pipeline = SCMPipelineRun.objects.get(pk=scm_pipeline_run.pk)
+        pipeline.application = another_application
+        with username_on_model(SCMPipelineRun, 'moved'):
+            pipeline.save(update_fields=['application'])
+
+        assert _teams(SCMPipelineRun) == {my_other_team.pk}
+        assert _teams(SCMStepRun) == {my_other_team.pk}
+
+    def test_step_moves_to_pipeline_of_other_team(self, my_other_team, another_application, scm_step_run):
+        with username_on_model(SCMPipelineRun, 'initial'):
+            other_pipeline = SCMPipelineRun.objects.create(application=another_application, commit_hash='1234')
+        step = SCMStepRun.objects.get(pk=scm_step_run.pk)
+        step.scm_pipeline_run_id = other_pipeline.pk
+        with username_on_model(SCMStepRun, 'moved'):
+            step.save()
+
+        assert SCMStepRun.objects.get(pk=step.pk).team_id == my_other_team.pk
+
+    def test_moved_pipelines_leave_the_scope(self, client, logged_in_user, not_my_project, application,
+                                             scm_step_run):
+        assert len(client.get('/scm-pipeline-runs/').json()) == 1
+
+        application.project = not_my_project
+        with username_on_model(Application, 'moved'):
+            application.save()
+
+        assert client.get('/scm-pipeline-runs/').json() == []
+        assert client.get(f'/scm-step-runs/{scm_step_run.pk}/').status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_migration(team, scm_step_run):
+    executor = MigrationExecutor(connection)
+    executor.migrate([('katka', '0044_denormalized_team')])
+    state_apps = executor.loader.project_state(('katka', '0044_denormalized_team')).apps
+    state_apps.get_model('katka', 'SCMPipelineRun').objects.update(team=None)
+    state_apps.get_model('katka', 'SCMStepRun').objects.update(team=None)
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+    assert _teams(SCMPipelineRun) == {team.pk}
+    assert _teams(SCMStepRun) == {team.pk}
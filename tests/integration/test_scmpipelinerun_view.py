@@ -309,3 +309,30 @@ class TestSCMPipelineRunRunNextPipeline:
         response = client.patch(url, data, content_type='application/json')
         assert response.status_code == 200
         assert caplog.messages == []
+
+    def test_branches(self, client, logged_in_user, application, scm_pipeline_run, next_scm_pipeline_run, caplog):
+        with username_on_model(models.SCMPipelineRun, 'test'):
+            next_scm_pipeline_run.status = 'queued'
+            next_scm_pipeline_run.save()
+            branch = models.SCMPipelineRun.objects.create(application=application, status='queued',
+                                                          commit_hash='AB14567A143AEC5156FD1444A017A3213654EF1',
+                                                          first_parent_hash=scm_pipeline_run.commit_hash)
+            initializing_branch = models.SCMPipelineRun.objects.create(
+                application=application, commit_hash='CD14567A143AEC5156FD1444A017A3213654EF1',
+                first_parent_hash=scm_pipeline_run.commit_hash,
+            )
+
+        url = f'/scm-pipeline-runs/{scm_pipeline_run.public_identifier}/'
+        response = client.patch(url, {'status': 'success'}, content_type='application/json')
+        assert response.status_code == 200
+
+        assert models.SCMPipelineRun.objects.get(pk=next_scm_pipeline_run.pk).status == 'in progress'
+        assert models.SCMPipelineRun.objects.get(pk=branch.pk).status == 'in progress'
+        assert models.SCMPipelineRun.objects.get(pk=initializing_branch.pk).status == 'initializing'
+        assert [message for message in caplog.messages if message.startswith('Next pipeline')] == []
+
+    def test_children_lookup_uses_index(self, application, scm_pipeline_run):
+        plan = models.SCMPipelineRun.objects.filter(
+            application=application, first_parent_hash=scm_pipeline_run.commit_hash,
+        ).order_by('created_at', 'pk').explain()
+        assert 'katka_scmpi_applica_eb3126_idx (application_id=? AND first_parent_hash=?)' in plan
@@ -0,0 +1,73 @@
+from django.db import connection
+
+import mock
+import pytest
+from katka import fields
+from katka.fields import EncryptedValue, username_on_model
+from katka.models import CredentialSecret
+from katka.secret_cache import secret_cache
+
+
+@pytest.fixture(autouse=True)
+def decryptions():
+    secret_cache.clear()
+    with mock.patch('katka.fields.decrypt_str', wraps=fields.decrypt_str) as decrypt_str:
+        yield decrypt_str
+    secret_cache.clear()
+
+
+def _url(secret):
+    return f'/credentials/{secret.credential_id}/secrets/{secret.key}/'
+
+
+@pytest.mark.django_db
+class TestSecretDecryption:
+    def test_decrypted_once(self, client, logged_in_user, credential, secret, decryptions):
+        for _ in range(3):
+            response = client.get(f'/credentials/{credential.pk}/secrets/')
+            assert response.json()[0]['value'] == 'full_access_value'
+
+        assert decryptions.call_count == 1
+
+    def test_not_decrypted_when_not_used(self, secret, decryptions):
+        loaded = CredentialSecret.objects.get(pk=secret.pk)
+
+        assert loaded.key == 'access_token'
+        assert decryptions.call_count == 0
+        assert isinstance(CredentialSecret.objects.values_list('value', flat=True).get(pk=secret.pk), EncryptedValue)
+
+    def test_update_is_read_immediately(self, client, logged_in_user, secret):
+        assert client.get(_url(secret)).json()['value'] == 'full_access_value'
+
+        response = client.patch(_url(secret), {'value': 'new value'}, content_type='application/json')
+
+        assert response.json()['value'] == 'new value'
+        assert client.get(_url(secret)).json()['value'] == 'new value'
+        assert CredentialSecret.objects.get(pk=secret.pk).value == 'new value'
+
+    def test_queryset_update_is_read_immediately(self, client, logged_in_user, secret):
+        assert client.get(_url(secret)).json()['value'] == 'full_access_value'
+
+        # not through save(), so the cache is not invalidated and modified_at is not changed
+        CredentialSecret.objects.filter(pk=secret.pk).update(value='new value')
+
+        assert client.get(_url(secret)).json()['value'] == 'new value'
+
+    def test_save_and_delete_forget_plaintext(self, client, logged_in_user, secret):
+        client.get(_url(secret))
+        assert len(secret_cache) == 1
+
+        with username_on_model(CredentialSecret, 'test'):
+            secret.save()
+        assert len(secret_cache) == 0
+
+        client.get(_url(secret))
+        assert len(secret_cache) == 1
+        CredentialSecret.objects.get(pk=secret.pk).delete()
+        assert len(secret_cache) == 0
+
+    def test_not_encrypted_value(self, secret):
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE katka_credentialsecret SET value = %s', ['stored before encryption'])
+
+        assert CredentialSecret.objects.get(pk=secret.pk).value == 'stored before encryption'
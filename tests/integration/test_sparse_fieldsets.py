@@ -0,0 +1,61 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+
+
+def _get(client, url, table):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    sql = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(f'SELECT "{table}".')]
+    return response, sql
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    def test_fields(self, client, logged_in_user, scm_pipeline_run):
+        response, sql = _get(client, '/scm-pipeline-runs/?fields=public_identifier,status', 'katka_scmpipelinerun')
+
+        assert response.status_code == 200
+        assert response.json() == [{'public_identifier': str(scm_pipeline_run.pk), 'status': 'initializing'}]
+        assert '"pipeline_yaml"' not in sql[0]
+
+    def test_omit(self, client, logged_in_user, scm_step_run):
+        response, sql = _get(client, '/scm-step-runs/?omit=output,tags', 'katka_scmsteprun')
+
+        assert response.status_code == 200
+        parsed = response.json()
+        assert 'output' not in parsed[0]
+        assert 'tags' not in parsed[0]
+        assert parsed[0]['status'] == 'not started'
+        assert '"output"' not in sql[0]
+        assert '"tags"' not in sql[0]
+
+    def test_retrieve(self, client, logged_in_user, scm_pipeline_run):
+        response, sql = _get(client, f'/scm-pipeline-runs/{scm_pipeline_run.pk}/?omit=pipeline_yaml',
+                             'katka_scmpipelinerun')
+
+        assert response.status_code == 200
+        assert 'pipeline_yaml' not in response.json()
+        assert response.json()['commit_hash'] == scm_pipeline_run.commit_hash
+        assert '"pipeline_yaml"' not in sql[0]
+
+    def test_all_fields_by_default(self, client, logged_in_user, scm_pipeline_run):
+        response, sql = _get(client, '/scm-pipeline-runs/', 'katka_scmpipelinerun')
+
+        assert 'pipeline_yaml' in response.json()[0]
+        assert '"pipeline_yaml"' in sql[0]
+
+    def test_unknown_field(self, client, logged_in_user, scm_pipeline_run):
+        response = client.get('/scm-pipeline-runs/?fields=status,bla')
+
+        assert response.status_code == 400
+        assert response.json() == {'fields': ['Unknown field(s): bla']}
+
+    def test_not_applied_on_write(self, client, logged_in_user, scm_step_run):
+        url = f'/scm-step-runs/{scm_step_run.public_identifier}/?fields=status'
+        response = client.patch(url, {'output': 'Step executed.'}, content_type='application/json')
+
+        assert response.status_code == 200
+        assert response.json()['output'] == 'Step executed.'
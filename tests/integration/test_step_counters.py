@@ -0,0 +1,139 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test import override_settings
+
+import mock
+import pytest
+from katka import constants
+from katka.fields import username_on_model
+from katka.models import SCMPipelineRun, SCMStepRun
+from katka.step_counters import reconcile_step_counters
+
+
+@pytest.mark.django_db
+class TestDeltaStepCounters:
+    @pytest.fixture(autouse=True)
+    def delta_mode(self, settings):
+        settings.PIPELINE_STEP_COUNTER_MODE = constants.STEP_COUNTER_MODE_DELTA
+
+    def test_create_and_update(self, scm_pipeline_run, create_scm_step_run):
+        SCMPipelineRun.objects.filter(pk=scm_pipeline_run.pk).update(steps_total=0)
+
+        step = create_scm_step_run(scm_pipeline_run, 'step1')
+        create_scm_step_run(scm_pipeline_run, 'step2', status=constants.STEP_STATUS_SKIPPED)
+
+        scm_pipeline_run.refresh_from_db()
+        assert scm_pipeline_run.steps_total == 2
+        assert scm_pipeline_run.steps_completed == 1
+
+        step = SCMStepRun.objects.get(pk=step.pk)
+        with username_on_model(SCMStepRun, 'signal_tester'):
+            step.status = constants.STEP_STATUS_IN_PROGRESS
+            step.save()
+            step.status = constants.STEP_STATUS_SUCCESS
+            step.save()
+            step.save()  # no status change, no counter change
+
+        scm_pipeline_run.refresh_from_db()
+        assert scm_pipeline_run.steps_total == 2
+        assert scm_pipeline_run.steps_completed == 2
+        assert scm_pipeline_run.modified_username == 'signal_tester'
+
+    def test_back_to_non_final_status(self, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step1', status=constants.STEP_STATUS_FAILED)
+
+        with username_on_model(SCMStepRun, 'signal_tester'):
+            step.status = constants.STEP_STATUS_IN_PROGRESS
+            step.save()
+
+        scm_pipeline_run.refresh_from_db()
+        assert scm_pipeline_run.steps_completed == 0
+
+    def test_no_count_queries(self, scm_pipeline_run, scm_step_run, django_assert_num_queries):
+        step = SCMStepRun.objects.get(pk=scm_step_run.pk)
+        step.status = constants.STEP_STATUS_SUCCESS
+
+        # step update, release summary lookup and update, counter update, refresh of the counters, open release lookup
+        with django_assert_num_queries(6), username_on_model(SCMStepRun, 'signal_tester'):
+            step.save()
+
+    def test_unknown_previous_state_recounts(self, scm_pipeline_run, scm_step_run):
+        step = SCMStepRun.objects.defer('status').get(pk=scm_step_run.pk)
+        step.status = constants.STEP_STATUS_SUCCESS
+        with username_on_model(SCMStepRun, 'signal_tester'):
+            step.save()
+
+        scm_pipeline_run.refresh_from_db()
+        assert scm_pipeline_run.steps_total == 1
+        assert scm_pipeline_run.steps_completed == 1
+
+    def test_notifies_pipeline_change(self, scm_pipeline_run, scm_step_run):
+        session = mock.MagicMock()
+        overrides = {
+            'PIPELINE_CHANGE_NOTIFICATION_SESSION': session,
+            'PIPELINE_CHANGE_NOTIFICATION_URL': 'http://override-url/',
+        }
+        with override_settings(**overrides):
+            with username_on_model(SCMPipelineRun, 'signal_tester'):
+                scm_pipeline_run.status = constants.PIPELINE_STATUS_IN_PROGRESS
+                scm_pipeline_run.save()
+
+            with username_on_model(SCMStepRun, 'signal_tester'):
+                scm_step_run.status = constants.STEP_STATUS_IN_PROGRESS
+                scm_step_run.save()
+
+                scm_step_run.status = constants.STEP_STATUS_FAILED
+                scm_step_run.save()
+
+        assert len(session.post.call_args_list) == 2
+
+    def test_receivers_see_the_stored_status(self, scm_pipeline_run, scm_step_run):
+        step = SCMStepRun.objects.select_related('scm_pipeline_run').get(pk=scm_step_run.pk)
+        # the pipeline is changed by someone else after the step was loaded
+        SCMPipelineRun.objects.filter(pk=scm_pipeline_run.pk).update(status=constants.PIPELINE_STATUS_SUCCESS)
+        statuses = []
+
+        def receiver(sender, instance, **kwargs):
+            statuses.append(instance.status)
+
+        post_save.connect(receiver, sender=SCMPipelineRun)
+        try:
+            with username_on_model(SCMStepRun, 'signal_tester'):
+                step.status = constants.STEP_STATUS_SUCCESS
+                step.save()
+        finally:
+            post_save.disconnect(receiver, sender=SCMPipelineRun)
+
+        assert statuses == [constants.PIPELINE_STATUS_SUCCESS]
+
+
+@pytest.mark.django_db
+class TestReconcileStepCounters:
+    def test_fixes_drifted_counters(self, scm_pipeline_run, scm_step_run, another_scm_pipeline_run,
+                                    create_scm_step_run):
+        create_scm_step_run(scm_pipeline_run, 'step2', status=constants.STEP_STATUS_SUCCESS)
+        SCMPipelineRun.objects.filter(pk=scm_pipeline_run.pk).update(steps_total=7, steps_completed=0)
+
+        assert reconcile_step_counters() == 2
+
+        scm_pipeline_run.refresh_from_db()
+        assert scm_pipeline_run.steps_total == 2
+        assert scm_pipeline_run.steps_completed == 1
+
+        another_scm_pipeline_run.refresh_from_db()
+        assert another_scm_pipeline_run.steps_total == 0
+        assert another_scm_pipeline_run.steps_completed == 0
+
+        assert reconcile_step_counters() == 0
+
+    def test_command(self, scm_pipeline_run, scm_step_run):
+        SCMPipelineRun.objects.filter(pk=scm_pipeline_run.pk).update(steps_total=7)
+
+        out = StringIO()
+        call_command('reconcile_step_counters', stdout=out)
+
+        assert 'Fixed step counters of 1 pipeline run(s)' in out.getvalue()
+        scm_pipeline_run.refresh_from_db()
+        assert scm_pipeline_run.steps_total == 1
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+from katka.models import SCMStepRunOutputChunk
+from katka.output_storage import LocalDiskOutputStorage
+
+
+def _url(step):
+    return f'/scm-step-runs/{step.pk}/output/'
+
+
+def _append(client, step, text):
+    return client.post(_url(step), {'output': text}, content_type='application/json')
+
+
+@pytest.fixture(params=['database', 'local disk'])
+def storage(request, settings, tmp_path):
+    if request.param == 'local disk':
+        settings.KATKA_STEP_OUTPUT_STORAGE = 'katka.output_storage.LocalDiskOutputStorage'
+        settings.KATKA_STEP_OUTPUT_DIRECTORY = str(tmp_path)
+
+    return request.param
+
+
+@pytest.mark.django_db
+class TestStepOutputLog:
+    def test_append_and_read(self, client, logged_in_user, scm_step_run, storage):
+        response = _append(client, scm_step_run, 'line 1\n')
+        assert response.status_code == 201
+        assert response.json() == {'offset': 0, 'next_offset': 7}
+
+        response = _append(client, scm_step_run, 'lïne 2\n')
+        assert response.json() == {'offset': 7, 'next_offset': 14}
+
+        response = client.get(_url(scm_step_run))
+        assert response.status_code == 200
+        assert response.json() == {'offset': 0, 'next_offset': 14, 'size': 14, 'output': 'line 1\nlïne 2\n'}
+
+    def test_ranged_read(self, client, logged_in_user, scm_step_run, storage):
+        for text in ('abc', 'défgh', 'ij'):
+            _append(client, scm_step_run, text)
+
+        def read(offset, limit):
+            return client.get(f'{_url(scm_step_run)}?offset={offset}&limit={limit}').json()
+
+        assert read(0, 2)['output'] == 'ab'
+        assert read(2, 3)['output'] == 'cdé'
+        assert read(4, 100) == {'offset': 4, 'next_offset': 10, 'size': 10, 'output': 'éfghij'}
+        assert read(10, 5)['output'] == ''
+        assert read(8, 0)['output'] == ''
+
+    def test_tail(self, client, logged_in_user, scm_step_run, storage):
+        next_offset = 0
+        received = []
+        for number in range(5):
+            _append(client, scm_step_run, f'line {number}\n')
+            response = client.get(f'{_url(scm_step_run)}?offset={next_offset}').json()
+            received.append(response['output'])
+            next_offset = response['next_offset']
+
+        assert received == [f'line {number}\n' for number in range(5)]
+
+    def test_step_output_field_is_not_changed(self, client, logged_in_user, scm_step_run, storage):
+        _append(client, scm_step_run, 'log')
+
+        assert client.get(f'/scm-step-runs/{scm_step_run.pk}/').json()['output'] == ''
+
+    def test_read_page_size(self, client, logged_in_user, scm_step_run, storage, monkeypatch):
+        monkeypatch.setattr('katka.views.SCMStepRunViewSet.output_page_size', 3)
+        monkeypatch.setattr('katka.views.SCMStepRunViewSet.max_output_page_size', 4)
+        _append(client, scm_step_run, 'abcdefgh')
+
+        assert client.get(_url(scm_step_run)).json()['output'] == 'abc'
+        assert client.get(f'{_url(scm_step_run)}?limit=100').json()['output'] == 'abcd'
+
+    @pytest.mark.parametrize('query', ['offset=-1', 'limit=a'])
+    def test_invalid_range(self, client, logged_in_user, scm_step_run, query):
+        response = client.get(f'{_url(scm_step_run)}?{query}')
+
+        assert response.status_code == 400
+        assert response.json() == {query.split('=')[0]: ['A non-negative integer is required.']}
+
+    def test_empty_chunk(self, client, logged_in_user, scm_step_run):
+        response = _append(client, scm_step_run, '')
+
+        assert response.status_code == 400
+        assert SCMStepRunOutputChunk.objects.count() == 0
+
+    def test_not_logged_in(self, client, scm_step_run):
+        assert _append(client, scm_step_run, 'log').status_code == 404
+        assert client.get(_url(scm_step_run)).status_code == 404
+        assert SCMStepRunOutputChunk.objects.count() == 0
+
+    def test_local_disk_keeps_text_out_of_the_database(self, client, logged_in_user, scm_step_run, settings,
+                                                       tmp_path):
+        settings.KATKA_STEP_OUTPUT_STORAGE = 'katka.output_storage.LocalDiskOutputStorage'
+        settings.KATKA_STEP_OUTPUT_DIRECTORY = str(tmp_path / 'logs')
+        _append(client, scm_step_run, 'abc')
+        _append(client, scm_step_run, 'déf')
+
+        assert list(SCMStepRunOutputChunk.objects.values_list('data', 'storage_position', 'storage_length')) == [
+            ('', 0, 3), ('', 3, 4),
+        ]
+        path = LocalDiskOutputStorage().path(scm_step_run.pk)
+        assert os.path.dirname(path) == str(tmp_path / 'logs')
+        with open(path, 'rb') as f:
+            assert f.read().decode('utf-8') == 'abcdéf'
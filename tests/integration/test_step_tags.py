@@ -0,0 +1,112 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from katka import constants
+from katka.fields import username_on_model
+from katka.models import BatchedMigrationProgress, SCMStepRun, SCMStepRunTag
+from katka.releases import close_release_if_pipeline_finished
+from katka.step_tags import sync_step_tags
+
+fill_tags = import_module('katka.migrations.0037_fill_scmstepruntag').fill_tags
+
+
+def _tags(step):
+    return sorted(SCMStepRunTag.objects.filter(scm_step_run=step).values_list('name', flat=True))
+
+
+@pytest.mark.django_db
+class TestStepTags:
+    def test_created(self, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step', tags='b a  a')
+        assert _tags(step) == ['a', 'b']
+
+    def test_updated(self, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step', tags='a b')
+        step = SCMStepRun.objects.get(pk=step.pk)
+        step.tags = 'b c'
+        with username_on_model(SCMStepRun, 'tester'):
+            step.save()
+
+        assert _tags(step) == ['b', 'c']
+
+    def test_not_synced_when_unchanged(self, scm_pipeline_run, create_scm_step_run):
+        step = SCMStepRun.objects.get(pk=create_scm_step_run(scm_pipeline_run, 'step', tags='a b').pk)
+        step.status = constants.STEP_STATUS_IN_PROGRESS
+
+        with CaptureQueriesContext(connection) as queries, username_on_model(SCMStepRun, 'tester'):
+            step.save()
+
+        assert not [query for query in queries.captured_queries if 'katka_scmstepruntag' in query['sql']]
+
+    def test_created_concurrently(self, scm_pipeline_run, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step', tags='a b')
+        step.tags = 'a b c'
+
+        # the rows of 'a' and 'b' were already created by another save of the step
+        sync_step_tags([step], created=True)
+
+        assert _tags(step) == ['a', 'b', 'c']
+
+    def test_too_long_tag_is_skipped(self, scm_pipeline_run, caplog, create_scm_step_run):
+        step = create_scm_step_run(scm_pipeline_run, 'step', tags=f'a {"x" * 256}')
+        assert _tags(step) == ['a']
+        assert 'is longer than 255 characters' in caplog.messages[0]
+
+    def test_filter(self, client, logged_in_user, scm_pipeline_run, create_scm_step_run):
+        create_scm_step_run(scm_pipeline_run, 'start', tags='production_change_start other')
+        create_scm_step_run(scm_pipeline_run, 'end', tags='production_change_end other')
+
+        response = client.get('/scm-step-runs/?tag=production_change_start')
+        assert response.status_code == 200
+        assert [step['slug'] for step in response.json()] == ['start']
+
+        response = client.get('/scm-step-runs/?tag=other')
+        assert sorted(step['slug'] for step in response.json()) == ['end', 'start']
+
+    def test_filter_uses_index(self):
+        plan = SCMStepRunTag.objects.filter(name='production_change_start').explain()
+        assert 'USING COVERING INDEX' in plan
+        assert '(name=?)' in plan
+
+    def test_bulk_created(self, client, logged_in_user, scm_pipeline_run):
+        data = [{'slug': 'step', 'name': 'step', 'stage': 'deploy', 'tags': 'a b'}]
+        response = client.post(f'/scm-pipeline-runs/{scm_pipeline_run.pk}/steps/', data,
+                               content_type='application/json')
+
+        assert response.status_code == 201
+        assert _tags(response.json()[0]['public_identifier']) == ['a', 'b']
+
+    def test_data_migration(self, scm_pipeline_run, create_scm_step_run):
+        steps = [create_scm_step_run(scm_pipeline_run, f'step{number}', tags=f'a{number} b') for number in range(5)]
+        create_scm_step_run(scm_pipeline_run, 'untagged', tags='')
+        SCMStepRunTag.objects.filter(scm_step_run__in=steps[1:]).delete()
+        # the migration already completed when the test database was created
+        BatchedMigrationProgress.objects.all().delete()
+
+        fill_tags(apps, None)
+
+        assert SCMStepRunTag.objects.count() == 10
+        assert [_tags(step) for step in steps] == [[f'a{number}', 'b'] for number in range(5)]
+
+    def test_rescan_without_tags_does_not_read_steps(self, settings, scm_pipeline_run, scm_step_run_success_list):
+        settings.RELEASE_PRE_CONDITIONS_MODE = constants.RELEASE_PRE_CONDITIONS_MODE_RESCAN
+        scm_pipeline_run.status = constants.PIPELINE_STATUS_SUCCESS
+
+        with CaptureQueriesContext(connection) as queries:
+            assert close_release_if_pipeline_finished(scm_pipeline_run) is None
+
+        assert not [query for query in queries.captured_queries
+                    if query['sql'].startswith('SELECT "katka_scmsteprun"')]
+
+    def test_release_boundaries_are_the_tagged_steps(self, scm_pipeline_run,
+                                                     scm_step_run_success_list_with_start_end_tags):
+        scm_pipeline_run.status = constants.PIPELINE_STATUS_SUCCESS
+        assert close_release_if_pipeline_finished(scm_pipeline_run) == constants.RELEASE_STATUS_SUCCESS
+
+        SCMStepRunTag.objects.filter(name=constants.TAG_PRODUCTION_CHANGE_ENDED).delete()
+
+        assert close_release_if_pipeline_finished(scm_pipeline_run) is None
@@ -0,0 +1,131 @@
+from django.core.exceptions import ImproperlyConfigured
+
+import pytest
+from katka import constants, models
+from katka.fields import username_on_model
+from katka.views import SCMStepRunViewSet
+
+
+@pytest.fixture
+def steps(scm_pipeline_run):
+    data = [
+        ('step1', constants.STEP_STATUS_SUCCESS, '2018-11-11 08:00:00+0000'),
+        ('step2', constants.STEP_STATUS_FAILED, '2018-11-11 09:00:00+0000'),
+        ('step3', constants.STEP_STATUS_IN_PROGRESS, '2018-11-11 10:00:00+0000'),
+    ]
+    created = []
+    for slug, status, started_at in data:
+        with username_on_model(models.SCMStepRun, 'initial'):
+            created.append(models.SCMStepRun.objects.create(slug=slug, name=slug, stage='deploy', status=status,
+                                                            started_at=started_at, scm_pipeline_run=scm_pipeline_run))
+    return created
+
+
+def _slugs(response):
+    assert response.status_code == 200
+    return [step['slug'] for step in response.json()]
+
+
+@pytest.mark.django_db
+class TestTypedFilters:
+    def test_range(self, client, logged_in_user, steps):
+        response = client.get('/scm-step-runs/?started_at__gte=2018-11-11T09:00:00Z&started_at__lt=2018-11-11T10:00Z')
+        assert _slugs(response) == ['step2']
+
+    def test_range_on_date(self, client, logged_in_user, steps):
+        response = client.get('/scm-step-runs/?started_at__gt=2018-11-11')
+        assert sorted(_slugs(response)) == ['step1', 'step2', 'step3']
+
+        response = client.get('/scm-step-runs/?started_at__lt=2018-11-11')
+        assert _slugs(response) == []
+
+    def test_invalid_range_value(self, client, logged_in_user, steps):
+        response = client.get('/scm-step-runs/?started_at__gte=yesterday')
+        assert response.status_code == 400
+        assert response.json() == {'started_at__gte': ['Enter a valid date/time.']}
+
+    @pytest.mark.parametrize('value', ['2019-13-45', '2019-01-01T25:00'])
+    def test_impossible_range_value(self, client, logged_in_user, steps, value):
+        response = client.get(f'/scm-step-runs/?started_at__gte={value}')
+        assert response.status_code == 400
+        assert response.json() == {'started_at__gte': ['Enter a valid date/time.']}
+
+    @pytest.mark.parametrize('url', ['/scm-pipeline-runs/', '/scm-step-runs/', '/scm-releases/'])
+    def test_created_at_range(self, client, logged_in_user, steps, url):
+        assert len(client.get(f'{url}?created_at__gte=2000-01-01').json()) > 0
+        assert client.get(f'{url}?created_at__gte=2999-01-01').json() == []
+        assert client.get(f'{url}?created_at__lt=2000-01-01').json() == []
+
+    def test_in(self, client, logged_in_user, steps):
+        response = client.get('/scm-step-runs/?status__in=success,failed')
+        assert sorted(_slugs(response)) == ['step1', 'step2']
+
+    def test_invalid_in_value(self, client, logged_in_user, steps):
+        response = client.get('/scm-step-runs/?status__in=success,bla')
+        assert response.status_code == 400
+        assert response.json() == {'status__in': ["Value 'bla' is not a valid choice."]}
+
+    @pytest.mark.parametrize('query', ['tags=a', 'output=a', 'sequence_id=1.1&status=failed', 'bla__gte=1'])
+    def test_unindexed_fields_are_rejected(self, client, logged_in_user, steps, query):
+        response = client.get(f'/scm-step-runs/?{query}')
+        assert response.status_code == 400
+        assert 'is not supported' in response.json()[query.split('=')[0]][0]
+
+    def test_indexed_and_declared_fields(self, client, logged_in_user, steps, scm_pipeline_run):
+        assert len(client.get(f'/scm-step-runs/?scm_pipeline_run={scm_pipeline_run.pk}').json()) == 3
+        assert _slugs(client.get('/scm-step-runs/?status=failed')) == ['step2']
+        assert _slugs(client.get('/scm-step-runs/?name=step1&stage=deploy')) == ['step1']
+        assert client.get('/scm-pipeline-runs/?status=open').status_code == 200
+
+    def test_unindexed_fields_with_indexed_field(self, client, logged_in_user, steps, scm_pipeline_run):
+        response = client.get(f'/scm-step-runs/?scm_pipeline_run={scm_pipeline_run.pk}&sequence_id=1.1')
+        assert _slugs(response) == []
+
+        response = client.get('/scm-step-runs/?started_at__gte=2018-11-11T09:00:00Z&tags=')
+        assert sorted(_slugs(response)) == ['step2', 'step3']
+
+    @pytest.mark.parametrize('url', ['/projects/?name=x', '/scm-releases/?name=x', '/applications/?slug=x'])
+    def test_small_tables_are_not_checked(self, client, logged_in_user, url):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json() == []
+
+    @pytest.mark.parametrize('query', ['name__startswith=step', 'status__gte=failed', 'output__contains=a',
+                                       'scm_pipeline_run__application=1'])
+    def test_unsupported_lookups_are_rejected(self, client, logged_in_user, steps, query):
+        response = client.get(f'/scm-step-runs/?{query}')
+        assert response.status_code == 400
+        assert 'is not supported' in response.json()[query.split('=')[0]][0]
+
+    def test_ordering(self, client, logged_in_user, steps):
+        assert _slugs(client.get('/scm-step-runs/?ordering=-created_at')) == ['step3', 'step2', 'step1']
+        assert _slugs(client.get('/scm-step-runs/?ordering=created_at')) == ['step1', 'step2', 'step3']
+
+    def test_ordering_with_pagination(self, client, logged_in_user, steps):
+        response = client.get('/scm-step-runs/?ordering=created_at&page_size=2')
+        assert [step['slug'] for step in response.json()['results']] == ['step1', 'step2']
+
+        response = client.get(response.json()['next'])
+        assert [step['slug'] for step in response.json()['results']] == ['step3']
+
+    def test_unsupported_ordering(self, client, logged_in_user, steps):
+        response = client.get('/scm-step-runs/?ordering=name')
+        assert response.status_code == 400
+        assert response.json() == {'ordering': ['Ordering on "name" is not supported']}
+
+    @pytest.mark.parametrize('field_name', SCMStepRunViewSet.range_filter_fields)
+    def test_range_filters_use_index(self, field_name):
+        plan = models.SCMStepRun.objects.filter(**{f'{field_name}__gte': '2018-11-11 09:00:00+0000'}).explain()
+        assert 'USING INDEX katka_scmst_' in plan
+        assert f'({field_name}>?)' in plan
+
+    def test_ordering_uses_index(self):
+        # the pagination orders on the primary key as well
+        plan = models.SCMStepRun.objects.order_by(*SCMStepRunViewSet.ordering_fields, 'pk').explain()
+        assert 'katka_scmst_created_b71658_idx' in plan
+        assert 'TEMP B-TREE FOR ORDER BY' not in plan
+
+    @pytest.mark.parametrize('declaration', [{'range_filter_fields': ('name',)}, {'ordering_fields': ('ended_at',)}])
+    def test_unindexed_declarations_are_not_allowed(self, declaration):
+        with pytest.raises(ImproperlyConfigured):
+            type('UnindexedViewSet', (SCMStepRunViewSet,), declaration)
@@ -186,6 +186,19 @@ class TestSCMPipelineRunAdmin:
         assert obj.created_username == 'mock1'
         assert obj.modified_username == 'mock1'
 
+    def test_form_changes_pipeline_yaml(self, mock_request, scm_pipeline_run):
+        c = SCMPipelineRunAdmin(SCMPipelineRun, AdminSite())
+        form_class = c.get_form(mock_request, scm_pipeline_run)
+        data = {field: getattr(scm_pipeline_run, field) for field in c.fields}
+        data.update(application=scm_pipeline_run.application_id, pipeline_yaml='stages: []')
+        form = form_class(data, instance=scm_pipeline_run)
+
+        assert form.fields['pipeline_yaml'].initial == scm_pipeline_run.pipeline_yaml
+        assert form.is_valid(), form.errors
+        c.save_model(mock_request, form.save(commit=False), form, True)
+
+        assert SCMPipelineRun.objects.get(pk=scm_pipeline_run.pk).pipeline_yaml == 'stages: []'
+
 
 @pytest.mark.django_db
 class TestSCMStepRunAdmin:
@@ -9,6 +9,14 @@ from katka.signals import close_release_if_pipeline_finished
 @pytest.mark.django_db
 class TestCloseRelease:
 
+    @pytest.fixture(autouse=True, params=[
+        constants.RELEASE_PRE_CONDITIONS_MODE_INCREMENTAL,
+        constants.RELEASE_PRE_CONDITIONS_MODE_RESCAN,
+        constants.RELEASE_PRE_CONDITIONS_MODE_VERIFY,
+    ])
+    def pre_conditions_mode(self, request, settings):
+        settings.RELEASE_PRE_CONDITIONS_MODE = request.param
+
     @staticmethod
     def _assert_release_success_with_name(name):
         assert SCMRelease.objects.count() == 1
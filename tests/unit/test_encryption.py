@@ -0,0 +1,39 @@
+from django.core.exceptions import ImproperlyConfigured
+
+import pytest
+from cryptography.fernet import Fernet
+from katka.encryption import decrypt_str, encrypt_str, get_crypter, rotate_tokens
+
+OLD_KEY = Fernet.generate_key().decode('utf-8')
+NEW_KEY = Fernet.generate_key().decode('utf-8')
+
+
+class TestEncryption:
+    def test_single_key(self, settings):
+        settings.FIELD_ENCRYPTION_KEY = OLD_KEY
+
+        assert decrypt_str(encrypt_str('secret')) == 'secret'
+
+    def test_settings_change(self, settings):
+        settings.FIELD_ENCRYPTION_KEY = OLD_KEY
+        token = encrypt_str('secret')
+        settings.FIELD_ENCRYPTION_KEY = [NEW_KEY, OLD_KEY]
+
+        assert decrypt_str(token) == 'secret'
+        assert Fernet(NEW_KEY).decrypt(encrypt_str('secret').encode('utf-8')) == b'secret'
+
+    @pytest.mark.parametrize('keys', [None, [], ['invalid']])
+    def test_improperly_configured(self, settings, keys):
+        settings.FIELD_ENCRYPTION_KEY = keys
+
+        with pytest.raises(ImproperlyConfigured):
+            get_crypter()
+
+    def test_rotate_tokens(self, settings):
+        old = Fernet(OLD_KEY).encrypt(b'old').decode('utf-8')
+        new = Fernet(NEW_KEY).encrypt(b'new').decode('utf-8')
+
+        rotated = rotate_tokens((NEW_KEY, OLD_KEY), [old, new, 'not encrypted'])
+
+        assert rotated[1] is None
+        assert [Fernet(NEW_KEY).decrypt(rotated[i].encode('utf-8')) for i in (0, 2)] == [b'old', b'not encrypted']
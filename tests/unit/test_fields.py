@@ -1,6 +1,13 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
 import pytest
+from katka import fields
 from katka.exceptions import MissingUsername
-from katka.fields import username_on_model
+from katka.fields import CompressedTextField, register_audited_model, username_on_model
+from katka.models import SCMStepRun
 
 from .models import AlwaysUpdate, OnlyOnCreate
 
@@ -37,3 +44,102 @@ class TestAutoUsername:
             model.save()
 
         assert model.field == 'test_user'
+
+    def test_nested(self):
+        model = AlwaysUpdate()
+        with username_on_model(AlwaysUpdate, 'outer'):
+            with username_on_model(AlwaysUpdate, 'inner'):
+                model.save()
+                assert model.field == 'inner'
+
+                with username_on_model(OnlyOnCreate, 'other model'):
+                    model.save()
+                    assert model.field == 'inner'
+
+            model.save()
+            assert model.field == 'outer'
+
+        with pytest.raises(MissingUsername):
+            model.save()
+
+    def test_not_shared_with_other_threads(self):
+        with username_on_model(AlwaysUpdate, 'test_user'):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                assert executor.submit(AlwaysUpdate._meta.get_field('field').get_username).result() is None
+
+
+class TestRegisterAuditedModel:
+    def test_registered_when_ready(self):
+        assert fields._audited_models[SCMStepRun] == (
+            (SCMStepRun, 'created_username'), (SCMStepRun, 'modified_username'),
+        )
+
+    def test_register(self, monkeypatch):
+        monkeypatch.setattr(fields, '_audited_models', {})
+
+        assert register_audited_model(AlwaysUpdate) == ((AlwaysUpdate, 'field'),)
+        assert fields._audited_models == {AlwaysUpdate: ((AlwaysUpdate, 'field'),)}
+
+    @pytest.mark.django_db
+    def test_registered_on_first_use(self, monkeypatch):
+        monkeypatch.setattr(fields, '_audited_models', {})
+        model = OnlyOnCreate()
+
+        with username_on_model(OnlyOnCreate, 'test_user'):
+            model.save()
+
+        assert model.field == 'test_user'
+        assert list(fields._audited_models) == [OnlyOnCreate]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_saves():
+    threads = 8
+    saves_per_thread = 25
+    # all threads are in their own context before any of them saves, saving itself is serialized for sqlite
+    all_in_context = threading.Barrier(threads)
+    database_lock = threading.Lock()
+
+    def save_models(number):
+        try:
+            with username_on_model(AlwaysUpdate, f'user{number}'):
+                all_in_context.wait()
+                for _ in range(saves_per_thread):
+                    with database_lock:
+                        AlwaysUpdate.objects.create()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(save_models, range(threads)))
+
+    assert sorted(AlwaysUpdate.objects.values_list('field', flat=True)) == sorted(
+        f'user{number}' for number in range(threads) for _ in range(saves_per_thread)
+    )
+
+
+class TestCompressedTextField:
+    def test_round_trip(self):
+        text = 'stage: deploy\n' * 200
+
+        compressed = CompressedTextField.compress(text)
+
+        assert compressed.startswith(CompressedTextField.COMPRESSED_MARKER)
+        assert len(compressed) < len(text) / 10
+        assert CompressedTextField.decompress(compressed) == text
+
+    def test_short_text_is_not_compressed(self, settings):
+        assert CompressedTextField.compress('---') == '---'
+
+        settings.KATKA_COMPRESSION_MIN_LENGTH = 2
+        assert CompressedTextField.compress('aaaaaaaaaa') == 'aaaaaaaaaa'  # not smaller
+        assert CompressedTextField.compress('a' * 100).startswith(CompressedTextField.COMPRESSED_MARKER)
+
+    def test_text_that_looks_compressed(self):
+        text = f'{CompressedTextField.COMPRESSED_MARKER}not compressed'
+
+        assert CompressedTextField.decompress(CompressedTextField.compress(text)) == text
+
+    @pytest.mark.parametrize('value', [None, '', 'plain text'])
+    def test_not_compressed_value(self, value):
+        assert CompressedTextField.decompress(value) == value
@@ -0,0 +1,176 @@
+import json
+from datetime import datetime, timezone
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+
+import mock
+import pytest
+from katka import constants
+from katka.fields import username_on_model
+from katka.models import SCMRelease, SCMStepRun, SCMStepRunReleaseSummary
+from katka.releases import close_release_if_pipeline_finished
+
+
+def _summaries(pipeline):
+    return {str(summary.pk): summary for summary in SCMStepRunReleaseSummary.objects.filter(scm_pipeline_run=pipeline)}
+
+
+def _fields(pipeline):
+    return {
+        step_id: (summary.sequence_id, summary.status, summary.started_at, summary.ended_at, summary.release_version)
+        for step_id, summary in _summaries(pipeline).items()
+    }
+
+
+def _save(step, **kwargs):
+    for name, value in kwargs.items():
+        setattr(step, name, value)
+    with username_on_model(SCMStepRun, 'tester'):
+        step.save()
+
+
+@pytest.mark.django_db
+class TestReleaseSummaries:
+    def test_only_executed_steps_are_summarized(self, scm_pipeline_run, scm_step_run_success_list_with_start_end_tags):
+        step = scm_step_run_success_list_with_start_end_tags[0]
+        _save(step, status=constants.STEP_STATUS_SKIPPED)
+
+        summaries = _summaries(scm_pipeline_run)
+        assert len(summaries) == 6
+        assert str(step.pk) not in summaries
+
+    def test_summary(self, scm_pipeline_run, scm_step_run_success_list_with_start_end_tags):
+        fields = _fields(scm_pipeline_run)
+
+        assert fields[str(scm_step_run_success_list_with_start_end_tags[0].pk)] == (
+            '1.1-1', 'success', datetime(2018, 11, 11, 8, 25, 30, tzinfo=timezone.utc),
+            datetime(2018, 11, 11, 8, 25, 41, tzinfo=timezone.utc), '"1.0.0"',
+        )
+        # the complete output is not part of the summary
+        assert fields[str(scm_step_run_success_list_with_start_end_tags[1].pk)][4] is None
+
+    def test_close_release_does_not_read_step_outputs(self, scm_pipeline_run,
+                                                      scm_step_run_success_list_with_start_end_tags):
+        scm_pipeline_run.status = constants.PIPELINE_STATUS_SUCCESS
+
+        with CaptureQueriesContext(connection) as queries:
+            assert close_release_if_pipeline_finished(scm_pipeline_run) == constants.RELEASE_STATUS_SUCCESS
+
+        assert not [query for query in queries.captured_queries if '"katka_scmsteprun"."output"' in query['sql']]
+        assert SCMRelease.objects.get().name == '1.0.0'
+
+    def test_step_changes_are_tracked(self, scm_pipeline_run, scm_step_run_success_list_with_start_end_tags):
+        _save(scm_step_run_success_list_with_start_end_tags[4], status=constants.STEP_STATUS_FAILED)
+        scm_pipeline_run.status = constants.PIPELINE_STATUS_FAILED
+
+        assert close_release_if_pipeline_finished(scm_pipeline_run) == constants.RELEASE_STATUS_FAILED
+
+    def test_step_moved_to_another_pipeline(self, scm_pipeline_run, next_scm_pipeline_run,
+                                            scm_step_run_success_list_with_start_end_tags):
+        step = SCMStepRun.objects.get(pk=scm_step_run_success_list_with_start_end_tags[0].pk)
+        _save(step, scm_pipeline_run=next_scm_pipeline_run)
+
+        assert str(step.pk) not in _summaries(scm_pipeline_run)
+        assert str(step.pk) in _summaries(next_scm_pipeline_run)
+
+    def test_output_is_only_searched_when_it_changed(self, scm_pipeline_run,
+                                                     scm_step_run_success_list_with_start_end_tags):
+        step = SCMStepRun.objects.get(pk=scm_step_run_success_list_with_start_end_tags[0].pk)
+
+        with mock.patch('katka.releases.find_output_value') as find_output_value:
+            _save(step, status=constants.STEP_STATUS_FAILED)
+        assert not find_output_value.called
+        assert _fields(scm_pipeline_run)[str(step.pk)][1:2] == ('failed',)
+        assert _fields(scm_pipeline_run)[str(step.pk)][4] == '"1.0.0"'
+
+        _save(step, output='{"release.version": "1.0.1"}')
+        assert _fields(scm_pipeline_run)[str(step.pk)][4] == '"1.0.1"'
+
+    def test_bulk_created_and_updated_steps_are_tracked(self, client, logged_in_user, scm_pipeline_run):
+        steps = [
+            {'slug': 'version', 'name': 'version', 'stage': 'prepare', 'sequence_id': '1.1-1',
+             'output': '{"release.version": "2.0.0"}'},
+            {'slug': 'deploy', 'name': 'deploy', 'stage': 'deploy', 'sequence_id': '2.1-1',
+             'tags': 'production_change_start production_change_end', 'started_at': '2018-11-11T08:45:30Z'},
+        ]
+        response = client.post(f'/scm-pipeline-runs/{scm_pipeline_run.pk}/steps/', steps,
+                               content_type='application/json')
+        assert response.status_code == 201
+        assert _summaries(scm_pipeline_run) == {}
+
+        data = [{'public_identifier': step['public_identifier'], 'status': 'success'} for step in response.json()]
+        response = client.put('/update-scm-step-run/bulk/', data, content_type='application/json')
+        assert response.status_code == 200
+
+        scm_pipeline_run.status = constants.PIPELINE_STATUS_SUCCESS
+        assert close_release_if_pipeline_finished(scm_pipeline_run) == constants.RELEASE_STATUS_SUCCESS
+        assert SCMRelease.objects.get().name == '2.0.0'
+
+    def test_summary_created_concurrently(self, scm_pipeline_run, scm_step_run):
+        step = SCMStepRun.objects.get(pk=scm_step_run.pk)
+        _save(step, status=constants.STEP_STATUS_SUCCESS)
+
+        # the summary did not exist yet when it was looked up
+        with mock.patch('katka.releases._summarized_step_ids', return_value=set()):
+            _save(step, status=constants.STEP_STATUS_FAILED)
+
+        assert _fields(scm_pipeline_run)[str(step.pk)][1] == 'success'
+
+    def test_steps_without_sequence_id_and_equal_sequence_ids(self, settings, scm_pipeline_run, caplog):
+        settings.RELEASE_PRE_CONDITIONS_MODE = constants.RELEASE_PRE_CONDITIONS_MODE_VERIFY
+        tied = []
+        for sequence_id, output, tags in [('1.1', '{"release.version": "1.0.0"}', 'production_change_start'),
+                                          ('2.1', '{"release.version": "2.0.0"}', ''),
+                                          ('2.1', '{"release.version": "2.0.1"}', ''),
+                                          (None, '', 'production_change_end')]:
+            with username_on_model(SCMStepRun, 'initial'):
+                step = SCMStepRun.objects.create(
+                    slug='step', name='step', stage='deploy', status=constants.STEP_STATUS_SUCCESS, output=output,
+                    tags=tags, sequence_id=sequence_id, scm_pipeline_run=scm_pipeline_run,
+                    started_at='2018-11-11 08:25:30+0000', ended_at='2018-11-11 08:25:41+0000',
+                )
+            if sequence_id == '2.1':
+                tied.append(step)
+
+        scm_pipeline_run.status = constants.PIPELINE_STATUS_SUCCESS
+        assert close_release_if_pipeline_finished(scm_pipeline_run) == constants.RELEASE_STATUS_SUCCESS
+
+        # the step without sequence_id is the last step, of the steps with the same sequence_id the one with the
+        # highest primary key is
+        last_tied = max(tied, key=lambda step: step.pk)
+        assert SCMRelease.objects.get().name == json.loads(last_tied.output)['release.version']
+        assert not [message for message in caplog.messages if 'do not match' in message]
+
+    def test_verify_repairs_summaries(self, settings, scm_pipeline_run, scm_step_run_success_list_with_start_end_tags,
+                                      caplog):
+        settings.RELEASE_PRE_CONDITIONS_MODE = constants.RELEASE_PRE_CONDITIONS_MODE_VERIFY
+        expected = _fields(scm_pipeline_run)
+        # the summaries were changed behind our back
+        SCMStepRunReleaseSummary.objects.filter(scm_pipeline_run=scm_pipeline_run).update(
+            status=constants.STEP_STATUS_FAILED,
+        )
+
+        scm_pipeline_run.status = constants.PIPELINE_STATUS_SUCCESS
+        assert close_release_if_pipeline_finished(scm_pipeline_run) == constants.RELEASE_STATUS_SUCCESS
+
+        assert f'Release summaries of pipeline {scm_pipeline_run.pk} do not match its steps, rebuilding' in \
+            caplog.messages
+        assert _fields(scm_pipeline_run) == expected
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_migration(scm_pipeline_run, scm_step_run_success_list_with_start_end_tags):
+    expected = _fields(scm_pipeline_run)
+    executor = MigrationExecutor(connection)
+    executor.migrate([('katka', '0047_active_indexes_archivedrow')])
+    executor.loader.project_state(('katka', '0047_active_indexes_archivedrow')).apps.get_model(
+        'katka', 'SCMStepRunReleaseSummary',
+    ).objects.all().delete()
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+    assert _fields(scm_pipeline_run) == expected
@@ -0,0 +1,91 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from katka import models
+from katka.fields import username_on_model
+from katka.scopes import get_team_ids
+
+
+def _request(user):
+    request = RequestFactory().get('/')
+    request.user = user
+    return request
+
+
+@pytest.fixture
+def cross_request_cache(settings):
+    settings.KATKA_TEAM_SCOPE_CACHE_TIMEOUT = 60
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.django_db
+class TestGetTeamIds:
+    def test_resolved_once_per_request(self, user, team, my_other_team, django_assert_num_queries):
+        request = _request(user)
+        with django_assert_num_queries(1):
+            assert sorted(get_team_ids(request)) == sorted([team.pk, my_other_team.pk])
+
+        with django_assert_num_queries(0):
+            get_team_ids(request)
+
+    def test_anonymous(self, team, django_assert_num_queries):
+        with django_assert_num_queries(0):
+            assert get_team_ids(_request(AnonymousUser())) == []
+
+    def test_not_cached_across_requests_by_default(self, user, team, django_assert_num_queries):
+        get_team_ids(_request(user))
+        with django_assert_num_queries(1):
+            get_team_ids(_request(user))
+
+    def test_cached_across_requests(self, cross_request_cache, user, team, django_assert_num_queries):
+        get_team_ids(_request(user))
+        with django_assert_num_queries(0):
+            assert get_team_ids(_request(user)) == [team.pk]
+
+    def test_invalidated_on_group_membership_change(self, cross_request_cache, user, team, not_my_team):
+        assert get_team_ids(_request(user)) == [team.pk]
+
+        user.groups.add(not_my_team.group)
+        assert sorted(get_team_ids(_request(user))) == sorted([team.pk, not_my_team.pk])
+
+        not_my_team.group.user_set.remove(user)
+        assert get_team_ids(_request(user)) == [team.pk]
+
+    def test_invalidated_on_team_change(self, cross_request_cache, user, group, team):
+        assert get_team_ids(_request(user)) == [team.pk]
+
+        new_team = models.Team(name='C-Team', slug='CTM', group=group)
+        with username_on_model(models.Team, 'initial'):
+            new_team.save()
+
+        assert sorted(get_team_ids(_request(user))) == sorted([team.pk, new_team.pk])
+
+
+@pytest.mark.django_db
+class TestScopedQueries:
+    def test_step_runs_do_not_join_groups(self, client, logged_in_user, scm_step_run):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/scm-step-runs/')
+
+        assert response.status_code == 200
+        assert len(response.json()) == 1
+        step_run_queries = [q['sql'] for q in queries.captured_queries if 'FROM "katka_scmsteprun"' in q['sql']]
+        assert len(step_run_queries) == 1
+        assert 'auth_user_groups' not in step_run_queries[0]
+        assert 'katka_team' not in step_run_queries[0]
+
+    def test_team_ids_resolved_once_on_create(self, client, logged_in_user, scm_pipeline_run):
+        data = {'slug': 'release', 'name': 'Release product', 'stage': 'Production',
+                'scm_pipeline_run': str(scm_pipeline_run.public_identifier)}
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/scm-step-runs/', data, content_type='application/json')
+
+        assert response.status_code == 201
+        group_queries = [q for q in queries.captured_queries if 'auth_user_groups' in q['sql']]
+        assert len(group_queries) == 1
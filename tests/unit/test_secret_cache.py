@@ -0,0 +1,84 @@
+import pytest
+from katka.secret_cache import SecretCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cache(clock):
+    return SecretCache(clock=clock)
+
+
+class TestSecretCache:
+    def test_decrypted_once(self, cache):
+        calls = []
+
+        def decrypt():
+            calls.append(1)
+            return 'plaintext'
+
+        assert cache.get_or_decrypt(('credential', 'key', 'token'), decrypt) == 'plaintext'
+        assert cache.get_or_decrypt(('credential', 'key', 'token'), decrypt) == 'plaintext'
+        assert len(calls) == 1
+
+    def test_least_recently_used_evicted(self, settings, cache):
+        settings.KATKA_SECRET_CACHE_SIZE = 2
+        cache.get_or_decrypt('a', lambda: 'a')
+        cache.get_or_decrypt('b', lambda: 'b')
+        cache.get_or_decrypt('a', lambda: 'not used')
+        cache.get_or_decrypt('c', lambda: 'c')
+
+        assert len(cache) == 2
+        assert cache.get_or_decrypt('a', lambda: 'decrypted again') == 'a'
+        assert cache.get_or_decrypt('b', lambda: 'decrypted again') == 'decrypted again'
+
+    def test_expired(self, settings, clock, cache):
+        settings.KATKA_SECRET_CACHE_TTL = 10
+        cache.get_or_decrypt('a', lambda: 'a')
+
+        clock.now = 9
+        assert cache.get_or_decrypt('a', lambda: 'decrypted again') == 'a'
+        clock.now = 10
+        assert cache.get_or_decrypt('a', lambda: 'decrypted again') == 'decrypted again'
+
+    def test_expired_are_dropped(self, settings, clock, cache):
+        settings.KATKA_SECRET_CACHE_TTL = 10
+        cache.get_or_decrypt('a', lambda: 'a')
+        clock.now = 10
+        cache.get_or_decrypt('b', lambda: 'b')
+
+        assert len(cache) == 1
+
+    def test_disabled(self, settings, cache):
+        settings.KATKA_SECRET_CACHE_SIZE = 0
+        cache.get_or_decrypt('a', lambda: 'a')
+
+        assert len(cache) == 0
+        assert cache.get_or_decrypt('a', lambda: 'decrypted again') == 'decrypted again'
+
+    def test_invalidate(self, cache):
+        cache.get_or_decrypt(('credential', 'a', 'token'), lambda: 'a')
+        cache.get_or_decrypt(('credential', 'b', 'token'), lambda: 'b')
+        cache.get_or_decrypt(('other', 'a', 'token'), lambda: 'a')
+
+        cache.invalidate('credential')
+
+        assert len(cache) == 1
+        assert cache.get_or_decrypt(('other', 'a', 'token'), lambda: 'decrypted again') == 'a'
+
+    def test_clear(self, cache):
+        cache.get_or_decrypt('a', lambda: 'a')
+        cache.clear()
+
+        assert len(cache) == 0
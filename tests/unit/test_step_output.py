@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from katka import constants
+from katka.fields import username_on_model
+from katka.models import SCMStepRun
+from katka.step_output import find_output_value, output_may_contain_key
+
+KEY = 'release.version'
+
+
+class TestFindOutputValue:
+    @pytest.mark.parametrize('output', [
+        '{"release.version": "1.0.0"}',
+        ' { "a" : [1, {"release.version": "0.1"}], "release.version" : "1.0.0" } ',
+        '{"release.version": "0.1", "b": {"c": null}, "release.version": "1.0.0"}',
+        '{"release\\u002eversion": "1.0.0"}',
+        '{"release.version": "1.0.0", "log": "not valid json after the key is not noticed',
+    ])
+    def test_found(self, output):
+        assert find_output_value(output, KEY) == (True, '1.0.0')
+
+    def test_any_json_value(self):
+        assert find_output_value('{"release.version": {"major": 1}}', KEY) == (True, {'major': 1})
+        assert find_output_value('{"release.version": null}', KEY) == (True, None)
+
+    @pytest.mark.parametrize('output', [
+        '', '{}', '{"a": 1}', '{"a": {"release.version": "1.0.0"}}', '["release.version"]', '"release.version"',
+        '{"a": "release.version"}',
+        # outputs that cannot contain the key are not parsed, so it does not matter they are not valid JSON
+        '1:2', '{release.version: 1}',
+    ])
+    def test_not_found(self, output):
+        assert find_output_value(output, KEY) == (False, None)
+
+    @pytest.mark.parametrize('output', [
+        '{"release.version" "1.0.0"}', '{"a": 1 "release.version": "1.0.0"}', '{"release.version": ',
+        '{"a" "release.version"}',
+    ])
+    def test_invalid(self, output, caplog):
+        assert find_output_value(output, KEY) == (False, None)
+        assert caplog.messages == ['Invalid JSON in step output']
+
+    def test_same_as_json_loads(self):
+        output = json.dumps({'log': 'x' * 100000, 'nested': {'release.version': 'no'}, KEY: '2.0.0', 'after': [1]})
+        assert find_output_value(output, KEY) == (True, json.loads(output)[KEY])
+
+
+@pytest.mark.django_db
+class TestOutputMayContainKey:
+    def test_filter(self, scm_pipeline_run):
+        outputs = ['', '{"a": 1}', '{"release.version": "1.0.0"}', '{"release\\u002eversion": "1.0.0"}']
+        with username_on_model(SCMStepRun, 'initial'):
+            for number, output in enumerate(outputs):
+                SCMStepRun.objects.create(slug=f'step{number}', name=f'step{number}', stage='deploy', output=output,
+                                          status=constants.STEP_STATUS_SUCCESS, scm_pipeline_run=scm_pipeline_run)
+
+        filtered = SCMStepRun.objects.filter(output_may_contain_key(KEY)).values_list('output', flat=True)
+        assert sorted(filtered) == sorted(outputs[2:])
@@ -0,0 +1,32 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    return len(queries.captured_queries), response.json()
+
+
+def assert_constant_list_queries(client, url, add_item, extra_items=5):
+    """
+    Assert that listing 'url' costs the same number of queries, however many items are listed.
+
+    Args:
+        client: The (logged in) test client
+        url: The list endpoint
+        add_item: Callable that creates one more item that shows up in the list, it receives the item number
+        extra_items: The number of items to add between the two measurements
+    """
+    add_item(0)
+    queries_before, listed_before = count_queries(client, url)
+
+    for number in range(1, extra_items + 1):
+        add_item(number)
+
+    queries_after, listed_after = count_queries(client, url)
+
+    assert len(listed_after) == len(listed_before) + extra_items
+    assert queries_after == queries_before, f'{url} needs {queries_after - queries_before} queries per extra item'
@@ -0,0 +1,46 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class StubRunnerServer:
+    """
+    Local HTTP server that acts as the pipeline runner, records the notifications it receives and
+    optionally responds slowly or with an error.
+    """
+
+    def __init__(self, delay=0, status=200):
+        self.delay = delay
+        self.status = status
+        self.received = []
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stub.received.append(json.loads(body))
+                time.sleep(stub.delay)
+                self.send_response(stub.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = HTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()